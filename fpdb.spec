@@ -49,6 +49,7 @@ coll = COLLECT(exe,
                Tree('pyfpdb/locale', prefix='pyfpdb/locale', excludes=['*.po', '*.pot', '*.sh']),
                [('pyfpdb/logging.conf','pyfpdb/logging.conf','DATA')],
                [('pyfpdb/HUD_config.xml.example','pyfpdb/HUD_config.xml.example','DATA')],
+               [('pyfpdb/preflop_equity.bin','pyfpdb/preflop_equity.bin','DATA')],
                strip=None,
                upx=True,
                name='fpdb')
@@ -94,11 +94,21 @@ class Simple_HUD(Aux_Base.Aux_Seats):
                     = self.game_params.stats[stat].popup
             self.tips[self.game_params.stats[stat].rowcol[0]][self.game_params.stats[stat].rowcol[1]] \
                     = self.game_params.stats[stat].tip
+
+        # resolve the stat names once, each hand computes the whole set for every player in one go
+        self.stat_functions = Stats.compile_stats(set(stat for row in self.stats for stat in row if stat))
+        self.stat_values = (None, {})   # (stat_dict, {player_id: {stat: do_stat result}})
                                         
     def create_contents(self, container, i):
         # this is a call to whatever is in self.aw_class_window but it isn't obvious
         container.create_contents(i)
 
+    def update_gui(self, new_hand_id):
+        self.stat_values = (self.hud.stat_dict,
+                            Stats.do_stats(self.hud.stat_dict, self.stat_functions,
+                                           hand_instance = self.hud.hand_instance))
+        super(Simple_HUD, self).update_gui(new_hand_id)
+
     def update_contents(self, container, i):
         # this is a call to whatever is in self.aw_class_window but it isn't obvious
         container.update_contents(i)
@@ -191,11 +201,16 @@ class Simple_stat(object):
         self.widget = self.lab
         self.stat_dict = None
         self.hud = aw.hud
+        self.aw = aw
 
     def update(self, player_id, stat_dict):
         self.stat_dict = stat_dict     # So the Simple_stat obj always has a fresh stat_dict
         self.lab.stat_dict = stat_dict
-        self.number = Stats.do_stat(stat_dict, player_id, self.stat, self.hud.hand_instance)
+        (values_stat_dict, values) = self.aw.stat_values
+        if values_stat_dict is stat_dict and self.stat in self.aw.stat_functions:
+            self.number = values[player_id][self.stat]
+        else:
+            self.number = Stats.do_stat(stat_dict, player_id, self.stat, self.hud.hand_instance)
         if self.number:
             self.lab.setText(unicode(self.number[1]))
 
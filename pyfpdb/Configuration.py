@@ -598,7 +598,9 @@ class Import:
         self.publicDB           = string_to_bool(node.getAttribute("publicDB")         , default=False)
         self.callFpdbHud        = string_to_bool(node.getAttribute("callFpdbHud")      , default=False)
         self.fastStoreHudCache  = string_to_bool(node.getAttribute("fastStoreHudCache"), default=False)
+        self.preloadPlayers     = string_to_bool(node.getAttribute("preloadPlayers")   , default=False)
         self.saveStarsHH        = string_to_bool(node.getAttribute("saveStarsHH")      , default=False)
+        self.parseProcesses     = node.getAttribute("parseProcesses")
         if node.getAttribute("importFilters"):
             self.importFilters = node.getAttribute("importFilters").split(",")
         else:
@@ -1285,6 +1287,26 @@ class Config:
             self.db_selected = db_name
         return
 
+    def get_stopped_rebuild(self):
+        """(hero, villain) start dates of the HUD cache rebuild of the selected db that
+           was stopped, None if the last one finished"""
+        db_node = self.get_db_node(self.db_selected)
+        if db_node is None or not db_node.getAttribute("stopped_rebuild"):
+            return None
+        return tuple(db_node.getAttribute("stopped_rebuild").split(","))
+
+    def set_stopped_rebuild(self, dates):
+        """Remember the start dates of a stopped HUD cache rebuild of the selected db,
+           None once a rebuild finished, and save the config"""
+        db_node = self.get_db_node(self.db_selected)
+        if db_node is None or dates == self.get_stopped_rebuild():
+            return
+        if dates is None:
+            db_node.removeAttribute("stopped_rebuild")
+        else:
+            db_node.setAttribute("stopped_rebuild", ",".join(dates))
+        self.save()
+
     def add_db_parameters(self, db_name = 'fpdb', db_ip = None, db_user = None,
                           db_pass = None, db_desc = None, db_server = None,
                           default = "False"):
@@ -1467,12 +1489,19 @@ class Config:
         try:    imp['fastStoreHudCache'] = self.imp.fastStoreHudCache
         except:  imp['fastStoreHudCache'] = False
 
+        try:    imp['preloadPlayers'] = self.imp.preloadPlayers
+        except:  imp['preloadPlayers'] = False
+
         try:    imp['importFilters'] = self.imp.importFilters
         except:  imp['importFilters'] = []
 
         try:    imp['timezone'] = self.imp.timezone
         except:  imp['timezone'] = "America/New_York"
 
+        # number of processes used to parse hand histories during bulk import
+        try:    imp['parseProcesses'] = int(self.imp.parseProcesses)
+        except:  imp['parseProcesses'] = 1
+
         return imp
     
     def set_timezone(self, timezone):
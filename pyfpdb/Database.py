@@ -48,6 +48,8 @@ import pytz
 import csv
 import logging
 import random
+import bisect
+import threading
 
 re_char = re.compile('[^a-zA-Z]')
 re_insert = re.compile("insert\sinto\s(?P<TABLENAME>[A-Za-z]+)\s(?P<COLUMNS>\(.+?\))\s+values", re.DOTALL)
@@ -58,6 +60,7 @@ import Card
 import Charset
 from Exceptions import *
 import Configuration
+import ResultCache
 
 if __name__ == "__main__":
     Configuration.set_logfile("fpdb-log.txt")
@@ -80,7 +83,7 @@ except ImportError:
     use_numpy = False
 
 
-DB_VERSION = 208
+DB_VERSION = 209
 
 # Variance created as sqlite has a bunch of undefined aggregate functions.
 
@@ -104,8 +107,116 @@ def adapt_decimal(d):
 
 def convert_decimal(s):
     return Decimal(s)
-    
-    
+
+
+class SessionBucket:
+    """Hero sessions of the hands waiting to be written by storeSessions.
+
+    Sessions are kept in a list sorted on sessionStart, a hand only has to be
+    compared with the sessions starting within threshold + the longest session
+    before it instead of with all of them. Sessions joined by a hand are merged
+    into the one holding the most hands."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.sessions  = {}           # seq -> session, seq gives the order sessions were opened in
+        self.starts    = []           # (sessionStart, seq) sorted
+        self.tourneys  = {}           # tourney id -> set of seq
+        self.span      = timedelta(0) # longest sessionEnd - sessionStart seen
+        self.seq       = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        """Sessions in the order they were opened, merged sessions count as opened at the merge"""
+        for seq in sorted(self.sessions):
+            yield self.sessions[seq]
+
+    def add(self, hid, startTime, weekStart, monthStart, tid):
+        """Put hand hid in the session it belongs to, opening or merging sessions as needed"""
+        found = self.find(startTime, tid)
+        for seq in found:
+            session = self.sessions[seq]
+            if startTime < session['sessionStart']:
+                self.moveStart(seq, startTime)
+                session['weekStart']  = weekStart
+                session['monthStart'] = monthStart
+            elif startTime > session['sessionEnd']:
+                session['sessionEnd'] = startTime
+            self.span = max(self.span, session['sessionEnd'] - session['sessionStart'])
+
+        if len(found) == 1:
+            seq = found[0]
+        elif len(found) > 1:
+            seq = self.merge(found)
+        else:
+            seq = self.open({'id': None,
+                             'sessionStart': startTime,
+                             'sessionEnd': startTime,
+                             'weekStart': weekStart,
+                             'monthStart': monthStart,
+                             'ids': [],
+                             'tourneys': set()})
+        self.sessions[seq]['ids'].append(hid)
+        if tid:
+            self.sessions[seq]['tourneys'].add(tid)
+            self.tourneys.setdefault(tid, set()).add(seq)
+
+    def find(self, startTime, tid):
+        """seq of the sessions within threshold of startTime or playing tourney tid"""
+        lower = startTime - self.threshold
+        upper = startTime + self.threshold
+        found = set(self.tourneys.get(tid, ())) if tid else set()
+        i = bisect.bisect_right(self.starts, (upper, self.seq))
+        while i > 0:
+            i -= 1
+            start, seq = self.starts[i]
+            if start < lower - self.span:
+                break
+            if self.sessions[seq]['sessionEnd'] >= lower:
+                found.add(seq)
+        return sorted(found)
+
+    def open(self, session):
+        self.seq += 1
+        self.sessions[self.seq] = session
+        self.span = max(self.span, session['sessionEnd'] - session['sessionStart'])
+        bisect.insort(self.starts, (session['sessionStart'], self.seq))
+        return self.seq
+
+    def close(self, seq):
+        session = self.sessions.pop(seq)
+        del self.starts[bisect.bisect_left(self.starts, (session['sessionStart'], seq))]
+        for tid in session['tourneys']:
+            self.tourneys[tid].discard(seq)
+        return session
+
+    def moveStart(self, seq, startTime):
+        session = self.sessions[seq]
+        del self.starts[bisect.bisect_left(self.starts, (session['sessionStart'], seq))]
+        session['sessionStart'] = startTime
+        bisect.insort(self.starts, (startTime, seq))
+
+    def merge(self, found):
+        """Merge the sessions found into a new one, the biggest session keeps its list of hands"""
+        sessions = [self.close(seq) for seq in found]
+        first = min(sessions, key=lambda s: s['sessionStart'])
+        merged = max(sessions, key=lambda s: len(s['ids']))
+        for session in sessions:
+            if session is not merged:
+                merged['ids'] += session['ids']
+                merged['tourneys'] |= session['tourneys']
+        merged['sessionStart'] = first['sessionStart']
+        merged['weekStart']    = first['weekStart']
+        merged['monthStart']   = first['monthStart']
+        merged['sessionEnd']   = max(s['sessionEnd'] for s in sessions)
+        seq = self.open(merged)
+        for tid in merged['tourneys']:
+            self.tourneys[tid].add(seq)
+        return seq
+
+
 # These are for appendStats. Insert new stats at the right place, because
 # SQL needs strict order.
 # Keys used to index into player data in storeHandsPlayers.
@@ -386,6 +497,11 @@ CACHE_KEYS = [
     'street3Discards'
     ]
 
+# Key columns of the cache tables, in the order of their bulk cache keys
+HUDCACHE_KEYS = ('gametypeId', 'playerId', 'seats', 'position', 'tourneyTypeId', 'styleKey')
+CARDSCACHE_KEYS = ('weekId', 'monthId', 'gametypeId', 'tourneyTypeId', 'playerId', 'startCards')
+POSITIONSCACHE_KEYS = ('weekId', 'monthId', 'gametypeId', 'tourneyTypeId', 'playerId', 'seats', 'maxPosition', 'position')
+
 
 class Database:
 
@@ -618,9 +734,11 @@ class Database:
     # create index indexname on tablename (col);
 
 
-    def __init__(self, c, sql = None, autoconnect = True):
+    def __init__(self, c, sql = None, autoconnect = True, read_only = False):
         self.config = c
         self.__connected = False
+        self.read_only = read_only  # see ReadPool
+        self._snapshot = False      # sqlite read transaction begun by get_cursor
         self.settings = {}
         self.settings['os'] = "linuxmac" if os.name != "nt" else "windows"
         db_params = c.get_db_parameters()
@@ -764,7 +882,7 @@ class Database:
 
         if backend == Database.MYSQL_INNODB:
             import MySQLdb
-            if use_pool:
+            if use_pool and not self.read_only:
                 MySQLdb = pool.manage(MySQLdb, pool_size=5)
             try:
                 self.connection = MySQLdb.connect(host=host
@@ -788,7 +906,7 @@ class Database:
         elif backend == Database.PGSQL:
             import psycopg2
             import psycopg2.extensions
-            if use_pool:
+            if use_pool and not self.read_only:
                 psycopg2 = pool.manage(psycopg2, pool_size=5)
             psycopg2.extensions.register_type(psycopg2.extensions.UNICODE)
             psycopg2.extensions.register_adapter(Decimal, psycopg2._psycopg.Decimal)
@@ -830,7 +948,7 @@ class Database:
         elif backend == Database.SQLITE:
             create = True
             import sqlite3
-            if use_pool:
+            if use_pool and not self.read_only:
                 sqlite3 = pool.manage(sqlite3, pool_size=1)
             #else:
             #    log.warning("SQLite won't work well without 'sqlalchemy' installed.")
@@ -844,7 +962,9 @@ class Database:
             self.db_path = database
             log.info(_("Connecting to SQLite: %s") % self.db_path)
             if os.path.exists(database) or create:
-                self.connection = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES )
+                # a ReadPool connection can be used by another thread once released
+                self.connection = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES,
+                                                  check_same_thread=not self.read_only)
                 self.__connected = True
                 sqlite3.register_converter("bool", lambda x: bool(int(x)))
                 sqlite3.register_adapter(bool, lambda x: 1 if x else 0)
@@ -871,6 +991,16 @@ class Database:
             self.cursor = self.connection.cursor()
             self.cursor.execute(self.sql.query['set tx level'])
             self.check_version(database=database, create=create)
+            if self.read_only:
+                if self.backend == self.SQLITE:
+                    self.connection.isolation_level = None  # transactions are begun by get_cursor
+                if self.backend == self.PGSQL:
+                    # a SET in psycopg2's implicit transaction would be undone by its rollback
+                    self.connection.rollback()
+                    self.connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+                else:
+                    self.cursor.execute(self.sql.query['set tx read only'])
+                    self.connection.commit()    # the setting outlives the rollbacks to come
 
     def get_sites(self):
         self.cursor.execute("SELECT name,id FROM Sites")
@@ -921,9 +1051,11 @@ class Database:
             if not ok:
                 log.debug(_("commit failed"))
                 raise FpdbError('sqlite commit failed')
+        self._snapshot = False
 
     def rollback(self):
         self.connection.rollback()
+        self._snapshot = False
 
     def connected(self):
         """ now deprecated, use is_connected() instead """
@@ -935,12 +1067,33 @@ class Database:
     def get_cursor(self, connect=False):
         if self.backend == Database.MYSQL_INNODB and os.name == 'nt':
             self.connection.ping(True)
+        if self.read_only and self.backend == Database.SQLITE and not self._snapshot:
+            # sqlite reads outside a transaction each see the db as it is when they run,
+            # the queries up to the next rollback see it as it is now
+            self.connection.execute("BEGIN")
+            self._snapshot = True
         return self.connection.cursor()
 
     def close_connection(self):
         self.connection.close()
         self.__connected = False
 
+    def interrupt(self):
+        """Stop the query running on this connection, called from another thread. The
+           query fails with an error in the thread running it"""
+        if self.backend == self.SQLITE:
+            self.connection.interrupt()
+            return
+        if self.backend == self.PGSQL:
+            server_id = self.connection.get_backend_pid()
+        else:
+            server_id = self.connection.thread_id()
+        # the server is asked to cancel it on another connection, the calling thread's
+        db = read_connection(self.config)
+        c = db.get_cursor()
+        c.execute(self.sql.query['cancel query'], (server_id, ))
+        db.rollback()
+
     def disconnect(self, due_to_error=False):
         """Disconnects the DB (rolls back if param is true, otherwise commits"""
         if due_to_error:
@@ -980,7 +1133,10 @@ class Database:
     def get_table_info(self, hand_id):
         c = self.connection.cursor()
         c.execute(self.sql.query['get_table_name'], (hand_id, ))
-        row = c.fetchone()
+        return self.table_info(c.fetchone())
+
+    def table_info(self, row):
+        """get_table_info of a get_table_name row, tournaments get their table name split"""
         l = list(row)
         if row[3] == "ring":   # cash game
             l.append(None)
@@ -1085,6 +1241,27 @@ class Database:
         cards['common'] = c.fetchone()
         return cards
 
+    def get_hud_hand(self, hand_id):
+        """What the HUD reads about a hand, in one query: (table_info, cards, players) with
+           table_info as get_table_info, cards as get_cards plus 'common' as get_common_cards
+           for the games with common cards, and players the (seat, player id, name) of the
+           seated players. None if the hand is not in the db"""
+        c = self.connection.cursor()
+        c.execute(self.sql.query['get_hud_hand'], (hand_id, ))
+        rows = c.fetchall()
+        if not rows:
+            return None
+        first = rows[0]
+        table_info = self.table_info(tuple(first[:7]) + (len(rows), ))
+        cards = {}
+        players = []
+        for row in rows:
+            cards[row[14]] = row[15:]
+            players.append((row[14], row[12], row[13]))
+        if first[2] in ('holdem', 'omahahi', 'omahahilo'):
+            cards['common'] = first[7:12]
+        return (table_info, cards, players)
+
     def get_action_from_hand(self, hand_no):
         action = [ [], [], [], [], [] ]
         c = self.connection.cursor()
@@ -1107,18 +1284,20 @@ class Database:
     def set_printdata(self, val):
         self.printdata = val
 
-    def init_hud_stat_vars(self, hud_days, h_hud_days):
+    def init_hud_stat_vars(self, hud_days, h_hud_days, session=True):
         """Initialise variables used by Hud to fetch stats:
            self.hand_1day_ago     handId of latest hand played more than a day ago
            self.date_ndays_ago    date n days ago
            self.h_date_ndays_ago  date n days ago for hero (different n)
+           hand_1day_ago is only used by session stats, it is not read unless session
         """
-        self.hand_1day_ago = 1
-        c = self.get_cursor()
-        c.execute(self.sql.query['get_hand_1day_ago'])
-        row = c.fetchone()
-        if row and row[0]:
-            self.hand_1day_ago = int(row[0])
+        if session:
+            self.hand_1day_ago = 1
+            c = self.get_cursor()
+            c.execute(self.sql.query['get_hand_1day_ago'])
+            row = c.fetchone()
+            if row and row[0]:
+                self.hand_1day_ago = int(row[0])
                 
         tz = datetime.utcnow() - datetime.today()
         tz_offset = tz.seconds/3600
@@ -1147,6 +1326,51 @@ class Database:
                            , hero_id = -1
                            , num_seats = 6
                            ):
+        ((stat_range, stylekey, agg_bb_mult, seats_min, seats_max),
+         (h_stat_range, h_stylekey, h_agg_bb_mult, h_seats_min, h_seats_max)) = self.get_stats_filters(hud_params, num_seats)
+
+        stat_dict = {}
+
+        if stat_range == 'S' or h_stat_range == 'S':
+            self.get_stats_from_hand_session(hand, stat_dict, hero_id
+                                            ,stat_range, seats_min, seats_max
+                                            ,h_stat_range, h_seats_min, h_seats_max)
+
+            if stat_range == 'S' and h_stat_range == 'S':
+                return stat_dict
+
+        # lookup gametypeId from hand
+        handinfo = self.get_gameinfo_from_hid(hand)
+        gametypeId = handinfo["gametypeId"]
+
+        query = 'get_stats_from_hand_aggregated'
+        subs = (hand
+               ,hero_id, stylekey, agg_bb_mult, agg_bb_mult, gametypeId, seats_min, seats_max  # hero params
+               ,hero_id, h_stylekey, h_agg_bb_mult, h_agg_bb_mult, gametypeId, h_seats_min, h_seats_max)    # villain params
+
+        stime = time()
+        c = self.connection.cursor()
+
+        # Now get the stats
+        c.execute(self.sql.query[query], subs)
+        ptime = time() - stime
+        log.info("HudCache query get_stats_from_hand_aggregated took %.3f seconds" % ptime)
+        colnames = [desc[0] for desc in c.description]
+        for row in c.fetchall():
+            playerid = row[0]
+            if (playerid == hero_id and h_stat_range != 'S') or (playerid != hero_id and stat_range != 'S'):
+                t_dict = {}
+                for name, val in zip(colnames, row):
+                    t_dict[name.lower()] = val
+                stat_dict[t_dict['player_id']] = t_dict
+
+        return stat_dict
+
+    def get_stats_filters(self, hud_params, num_seats):
+        """Returns what the HUD aggregates the stats of opponents and the ones of hero over:
+           ((stat_range, stylekey, agg_bb_mult, seats_min, seats_max), (the same for hero))
+           HudCache rows count if their styleKey is above stylekey, their seats are between
+           seats_min and seats_max and their bigblind is within agg_bb_mult of the hand's"""
         stat_range   = hud_params['stat_range']
         agg_bb_mult = hud_params['agg_bb_mult']
         seats_style = hud_params['seats_style']
@@ -1158,8 +1382,6 @@ class Database:
         h_seats_cust_nums_low = hud_params['h_seats_cust_nums_low']
         h_seats_cust_nums_high = hud_params['h_seats_cust_nums_high']
 
-        stat_dict = {}
-
         if seats_style == 'A':
             seats_min, seats_max = 0, 10
         elif seats_style == 'C':
@@ -1180,14 +1402,6 @@ class Database:
             h_seats_min, h_seats_max = 0, 10
             print "bad h_seats_style value:", h_seats_style
 
-        if stat_range == 'S' or h_stat_range == 'S':
-            self.get_stats_from_hand_session(hand, stat_dict, hero_id
-                                            ,stat_range, seats_min, seats_max
-                                            ,h_stat_range, h_seats_min, h_seats_max)
-
-            if stat_range == 'S' and h_stat_range == 'S':
-                return stat_dict
-
         if stat_range == 'T':
             stylekey = self.date_ndays_ago
         elif stat_range == 'A':
@@ -1214,32 +1428,49 @@ class Database:
         #elif h_stat_range == 'H':
         #    h_stylekey = date_nhands_ago  needs array by player here ...
 
-        # lookup gametypeId from hand
-        handinfo = self.get_gameinfo_from_hid(hand)
-        gametypeId = handinfo["gametypeId"]
+        return ((stat_range, stylekey, agg_bb_mult, seats_min, seats_max),
+                (h_stat_range, h_stylekey, h_agg_bb_mult, h_seats_min, h_seats_max))
 
-        query = 'get_stats_from_hand_aggregated'
+    def get_stats_seed(self, hand, gametypeId, filters, hero_id):
+        """HudCache totals of the players of hand as get_stats_from_hand reads them, for the
+           filters returned by get_stats_filters. Returns (max_hand, {playerId: stats}) with
+           max_hand the highest hand id when they were read, None if no player has stats"""
+        ((stat_range, stylekey, agg_bb_mult, seats_min, seats_max),
+         (h_stat_range, h_stylekey, h_agg_bb_mult, h_seats_min, h_seats_max)) = filters
         subs = (hand
-               ,hero_id, stylekey, agg_bb_mult, agg_bb_mult, gametypeId, seats_min, seats_max  # hero params
-               ,hero_id, h_stylekey, h_agg_bb_mult, h_agg_bb_mult, gametypeId, h_seats_min, h_seats_max)    # villain params
-
-        stime = time()
-        c = self.connection.cursor()
-
-        # Now get the stats
-        c.execute(self.sql.query[query], subs)
-        ptime = time() - stime
-        log.info("HudCache query get_stats_from_hand_aggregated took %.3f seconds" % ptime)
-        colnames = [desc[0] for desc in c.description]
+               ,hero_id, stylekey, agg_bb_mult, agg_bb_mult, gametypeId, seats_min, seats_max
+               ,hero_id, h_stylekey, h_agg_bb_mult, h_agg_bb_mult, gametypeId, h_seats_min, h_seats_max)
+        c = self.get_cursor()
+        c.execute(self.sql.query['get_stats_from_hand_seed'], subs)
+        rows = c.fetchall()
+        (max_hand, stats) = (None, {})
+        if not rows:    # sqlite leaves description empty then
+            return (max_hand, stats)
+        colnames = [desc[0].lower() for desc in c.description]
+        for row in rows:
+            t_dict = dict(zip(colnames, row))
+            max_hand = t_dict.pop('max_hand')
+            stats[t_dict['player_id']] = t_dict
+        return (max_hand, stats)
+
+    def get_stats_delta(self, after, upto):
+        """Stats of every player of the hands with an id above after and up to upto, one
+           dict per player and hand in hand id order, with the gametype, seats and
+           styleKey of the hand they count in"""
+        query = self.sql.query['get_stats_from_hands_delta']
+        if self.db_server == 'mysql':
+            query = query.replace("<signed>", 'signed ')
+        else:
+            query = query.replace("<signed>", '')
+        c = self.get_cursor()
+        c.execute(query, (after, upto))
+        colnames = [desc[0].lower() for desc in c.description]
+        deltas = []
         for row in c.fetchall():
-            playerid = row[0]
-            if (playerid == hero_id and h_stat_range != 'S') or (playerid != hero_id and stat_range != 'S'):
-                t_dict = {}
-                for name, val in zip(colnames, row):
-                    t_dict[name.lower()] = val
-                stat_dict[t_dict['player_id']] = t_dict
-
-        return stat_dict
+            t_dict = dict(zip(colnames, row))
+            t_dict['stylekey'] = self.get_style_key(t_dict.pop('start_time'))
+            deltas.append(t_dict)
+        return deltas
 
     # uses query on handsplayers instead of hudcache to get stats on just this session
     def get_stats_from_hand_session(self, hand, stat_dict, hero_id
@@ -1310,6 +1541,16 @@ class Database:
         else:
             return None
 
+    def get_hero_ids(self, names):
+        """{(site name, player name): player id} of the players called one of names,
+           on any site"""
+        if not names:
+            return {}
+        c = self.connection.cursor()
+        q = self.sql.query['get_hero_ids'].replace('<names>', ','.join([self.sql.query['placeholder']] * len(names)))
+        c.execute(q, [unicode(name) for name in names])
+        return dict(((site, name), player_id) for (site, name, player_id) in c.fetchall())
+
     def get_player_names(self, config, site_id=None, like_player_name="%"):
         """Fetch player names from players. Use site_id and like_player_name if provided"""
 
@@ -1336,6 +1577,7 @@ class Database:
         self.tcache     = None       # TourneyId cache
         self.pcache     = None       # PlayerId cache
         self.tpcache    = None       # TourneysPlayersId cache
+        self.preloaded  = set()      # sites whose players were put in pcache by preloadPlayerCache
 
     def get_last_insert_id(self, cursor=None):
         ret = None
@@ -1577,6 +1819,7 @@ class Database:
         self.create_tables()
         self.createAllIndexes()
         self.commit()
+        ResultCache.bump_import_generation(self.config)
         self.get_sites()
         log.info(_("Finished recreating tables"))
     #end def recreate_tables
@@ -2077,8 +2320,16 @@ class Database:
                 
         return query
 
-    def rebuild_cache(self, h_start=None, v_start=None, table = 'HudCache', ttid = None, wmid = None):
-        """clears hudcache and rebuilds from the individual handsplayers records"""
+    def rebuild_cache(self, h_start=None, v_start=None, table = 'HudCache', ttid = None, wmid = None,
+                      progress = None, resume = False, workers = 4):
+        """clears hudcache and rebuilds from the individual handsplayers records
+
+           A full rebuild is done one gametype at a time, by up to workers
+           connections in parallel on mysql and postgres. progress(table, done, total)
+           is called with the number of gametypes done, if it returns False the
+           rebuild stops after the gametypes being worked on. Calling again with
+           the same dates and resume=True carries on with the gametypes that have
+           nothing in the cache yet. Returns False if the rebuild was stopped."""
         stime = time()
         # derive list of program owner's player ids
         self.hero = {}                               # name of program owner indexed by site id
@@ -2103,30 +2354,29 @@ class Database:
             if not v_start:
                 v_start = self.villain_hudstart_def
                 
-        if not ttid and not wmid:
+        if not ttid and not wmid and not resume:
             self.get_cursor().execute(self.sql.query['clear%s' % table])
             self.commit()
+            ResultCache.bump_import_generation(self.config)   # the gui tabs' results are out of date
         
+        queries = {}
         if not ttid:
             if self.hero_ids is None:
                 if wmid:
                     where = "WHERE g.type = 'ring' AND weekId = %s and monthId = %s<hero_where>" % wmid
                 else:
-                    where = "WHERE g.type = 'ring'<hero_where>"
+                    where = "WHERE g.type = 'ring'<hero_where><gametype_where>"
             else:
                 where =   "where (((    hp.playerId not in " + str(tuple(self.hero_ids.values())) \
                         + "       and h.startTime > '" + v_start + "')" \
                         + "   or (    hp.playerId in " + str(tuple(self.hero_ids.values())) \
                         + "       and h.startTime > '" + h_start + "'))" \
-                        + "   AND hp.tourneysPlayersId IS NULL)"
+                        + "   AND hp.tourneysPlayersId IS NULL)<gametype_where>"
             rebuild_sql_cash = self.sql.query['rebuildCache'].replace('%s', self.sql.query['placeholder'])
             rebuild_sql_cash = rebuild_sql_cash.replace('<tourney_join_clause>', "")
             rebuild_sql_cash = rebuild_sql_cash.replace('<where_clause>', where)
             rebuild_sql_cash = self.replace_statscache('ring', table, rebuild_sql_cash)
-            #print rebuild_sql_cash 
-            self.get_cursor().execute(rebuild_sql_cash)
-            self.commit()
-            #print _("Rebuild cache(cash) took %.1f seconds") % (time() - stime,)
+            queries['ring'] = rebuild_sql_cash
 
         if ttid:
             where = "WHERE t.tourneyTypeId = %s<hero_where>" % ttid
@@ -2134,21 +2384,115 @@ class Database:
             if wmid:
                 where = "WHERE g.type = 'tour' AND weekId = %s and monthId = %s<hero_where>" % wmid
             else:
-                where = "WHERE g.type = 'tour'<hero_where>"
+                where = "WHERE g.type = 'tour'<hero_where><gametype_where>"
         else:
             where =   "where (((    hp.playerId not in " + str(tuple(self.hero_ids.values())) \
                     + "       and h.startTime > '" + v_start + "')" \
                     + "   or (    hp.playerId in " + str(tuple(self.hero_ids.values())) \
                     + "       and h.startTime > '" + h_start + "'))" \
-                    + "   AND hp.tourneysPlayersId >= 0)"
+                    + "   AND hp.tourneysPlayersId >= 0)<gametype_where>"
         rebuild_sql_tourney = self.sql.query['rebuildCache'].replace('%s', self.sql.query['placeholder'])
         rebuild_sql_tourney = rebuild_sql_tourney.replace('<tourney_join_clause>', """INNER JOIN Tourneys t ON (t.id = h.tourneyId)""")
         rebuild_sql_tourney = rebuild_sql_tourney.replace('<where_clause>', where)
         rebuild_sql_tourney = self.replace_statscache('tour', table, rebuild_sql_tourney)
-        #print rebuild_sql_tourney
-        self.get_cursor().execute(rebuild_sql_tourney)
-        self.commit()
-        #print _("Rebuild hudcache took %.1f seconds") % (time() - stime,)
+        queries['tour'] = rebuild_sql_tourney
+
+        if ttid or wmid:
+            for type in ('ring', 'tour'):
+                if type in queries:
+                    self.get_cursor().execute(queries[type].replace('<gametype_where>', ''))
+                    self.commit()
+            ResultCache.bump_import_generation(self.config)
+            return True
+
+        try:
+            finished = self.rebuild_cache_gametypes(table, queries, progress, workers)
+        finally:
+            # results cached while the rebuild ran are from a part of the cache
+            ResultCache.bump_import_generation(self.config)
+        log.info(_("Rebuild %s took %.1f seconds") % (table, time() - stime))
+        return finished
+
+    def rebuild_cache_gametypes(self, table, queries, progress = None, workers = 4):
+        """Run the rebuild queries for the gametypes with nothing in table yet, each
+           gametype is committed on its own"""
+        c = self.get_cursor()
+        c.execute(self.sql.query['countGametypes'])
+        total = c.fetchone()[0]
+        c.execute(self.sql.query['fetchNew%sGametypeIds' % table])
+        gametypes = [(gtid, type) for (gtid, type) in c.fetchall() if type in queries]
+        done = total - len(gametypes)
+        if progress is not None and progress(table, done, total) is False:
+            return False
+
+        if self.backend == self.SQLITE or workers < 2 or len(gametypes) < 2:
+            for (gtid, type) in gametypes:
+                c.execute(queries[type].replace('<gametype_where>', " AND h.gametypeId = %d" % gtid))
+                self.commit()
+                done += 1
+                if progress is not None and progress(table, done, total) is False:
+                    return False
+            return True
+
+        tasks, results = Queue.Queue(), Queue.Queue()
+        for gametype in gametypes:
+            tasks.put(gametype)
+        threads = [threading.Thread(target=self.rebuild_cache_worker, args=(queries, tasks, results))
+                   for i in range(min(workers, len(gametypes)))]
+        for t in threads:
+            t.start()
+        (running, finished, error) = (len(threads), True, None)
+        while running:
+            (gtid, e) = results.get()
+            if e is not None and error is None:
+                error, finished = e, False
+                self.empty_queue(tasks)
+            if gtid is None:
+                running -= 1
+            elif e is None:
+                done += 1
+                if progress is not None and progress(table, done, total) is False and finished:
+                    finished = False
+                    self.empty_queue(tasks)
+        for t in threads:
+            t.join()
+        if error is not None:
+            raise error
+        return finished
+
+    def rebuild_cache_worker(self, queries, tasks, results):
+        """Take gametypes from tasks until it is empty and rebuild them on a
+           connection of its own, puts (gametypeId, error) on results for each
+           and (None, error) when done"""
+        db = None
+        try:
+            db = Database(self.config, sql = self.sql)
+            c = db.get_cursor()
+            while True:
+                try:
+                    (gtid, type) = tasks.get_nowait()
+                except Queue.Empty:
+                    break
+                c.execute(queries[type].replace('<gametype_where>', " AND h.gametypeId = %d" % gtid))
+                db.commit()
+                results.put((gtid, None))
+        except Exception, e:
+            log.error(_("Error rebuilding cache: %s") % e)
+            if db is not None and db.is_connected():
+                db.rollback()
+            results.put((None, e))
+        else:
+            results.put((None, None))
+        finally:
+            if db is not None and db.is_connected():
+                db.close_connection()
+
+    def empty_queue(self, queue):
+        while True:
+            try:
+                queue.get_nowait()
+            except Queue.Empty:
+                return
     #end def rebuild_cache
     
     def update_timezone(self, tz_name):
@@ -2289,7 +2633,8 @@ class Database:
     #end def lock_for_insert
     
     def resetBulkCache(self, reconnect=False):
-        self.siteHandNos = []         # cache of siteHandNo
+        self.siteHandNos = set()      # cache of siteHandNo, hands in the db or already inserted
+        self.checkedHandNos = set()   # siteHandNos looked up by findDuplicates
         self.hbulk       = []         # Hands bulk inserts
         self.bbulk       = []         # Boards bulk inserts
         self.hpbulk      = []         # HandsPlayers bulk inserts
@@ -2300,7 +2645,8 @@ class Database:
         self.hsbulk      = []         # HandsStove bulk inserts
         self.htbulk      = []         # HandsPots bulk inserts
         self.tbulk       = {}         # Tourneys bulk updates
-        self.s          = {'bk': []} # Sessions bulk updates
+        self.s           = {}         # Sessions of the hands, filled by storeSessions
+        self.sb          = None       # Sessions bulk updates
         self.sc          = {}         # SessionsCache bulk updates
         self.tc          = {}         # TourneysCache bulk updates
         self.hids        = []         # hand ids in order of hand bulk inserts
@@ -2471,17 +2817,25 @@ class Database:
             c = self.get_cursor()
             self.executemany(c, q, self.hsbulk) #c.executemany(q, self.hsbulk)
             
+    def get_style_key(self, starttime):
+        """The HudCache styleKey of a hand started at starttime, 'd' + the yymmdd of the day
+           it was played, days starting at day_start, or 'A000000' if the HudCache is not
+           kept by day"""
+        if not self.build_full_hudcache:
+            return 'A000000'
+        tz = datetime.utcnow() - datetime.today()
+        tz_offset = tz.seconds/3600
+        tz_day_start_offset = self.day_start + tz_offset
+        
+        d = timedelta(hours=tz_day_start_offset)
+        starttime_offset = starttime - d
+        return datetime.strftime(starttime_offset, 'd%y%m%d')
+
     def storeHudCache(self, gid, gametype, pids, starttime, pdata, doinsert=False):
         """Update cached statistics. If update fails because no record exists, do an insert."""
                 
         if pdata:   
-            tz = datetime.utcnow() - datetime.today()
-            tz_offset = tz.seconds/3600
-            tz_day_start_offset = self.day_start + tz_offset
-            
-            d = timedelta(hours=tz_day_start_offset)
-            starttime_offset = starttime - d
-            styleKey = datetime.strftime(starttime_offset, 'd%y%m%d')
+            styleKey = self.get_style_key(starttime)
             seats = len(pids)
             
         pos = {'B':'B', 'S':'S', 0:'D', 1:'C', 2:'M', 3:'M', 4:'M', 5:'E', 6:'E', 7:'E', 8:'E', 9:'E' }
@@ -2496,7 +2850,7 @@ class Database:
                       ,seats
                       ,position if self.build_full_hudcache else '0'
                       ,player_stats['tourneyTypeId']
-                      ,styleKey if self.build_full_hudcache else 'A000000'
+                      ,styleKey
                       )
                 player_stats['n'] = 1
                 line = [int(player_stats[s]) if isinstance(player_stats[s],bool) else player_stats[s] for s in CACHE_KEYS]
@@ -2515,35 +2869,64 @@ class Database:
             insert_hudcache = self.sql.query['insert_hudcache']
             insert_hudcache = insert_hudcache.replace('%s', self.sql.query['placeholder'])
             
-            select_hudcache_ring = self.sql.query['select_hudcache_ring']
-            select_hudcache_ring = select_hudcache_ring.replace('%s', self.sql.query['placeholder'])
-            select_hudcache_tour = self.sql.query['select_hudcache_tour']
-            select_hudcache_tour = select_hudcache_tour.replace('%s', self.sql.query['placeholder'])
-            inserts = []
             c = self.get_cursor()
-            for k, item in self.hcbulk.iteritems():
-                
-                if not k[4]:
-                    q = select_hudcache_ring
-                    row = list(k[:4]) + [k[-1]]
-                else:
-                    q = select_hudcache_tour
-                    row = list(k)
-                
-                c.execute(q, row)
-                result = c.fetchone()
-                if result:
-                    id = result[0]
-                    update = item + [id]
-                    c.execute(update_hudcache, update)
-                    
-                else:
-                    inserts.append(list(k) + item)
-                
-            if inserts:
-                self.executemany(c, insert_hudcache, inserts)
+            self.mergeCache(c, 'HudCache', HUDCACHE_KEYS, self.hcbulk, update_hudcache, insert_hudcache)
             self.commit()
             
+    def mergeCache(self, c, table, keycols, cache, update, insert):
+        """Add the lines of cache, {key: line} with key the values of keycols, to the rows of
+           table: one executemany of update for the keys that already have a row and one of
+           insert for the others. Returns True if anything was inserted"""
+        ids = self.fetchCacheIds(c, table, keycols, cache.keys())
+        updates, inserts = [], []
+        for k, item in cache.iteritems():
+            id = ids.get(k)
+            if id is not None:
+                updates.append(item + [id])
+            else:
+                inserts.append(list(k) + item)
+        if updates:
+            c.executemany(update, updates)
+        if inserts:
+            self.executemany(c, insert, inserts)
+        return len(inserts) > 0
+
+    def fetchCacheIds(self, c, table, keycols, keys):
+        """Returns {key: id} for the rows of table matching keys, tuples of values for keycols.
+           Looks them up chunk_size players per query, narrowed down by the values the other key
+           columns take in keys, instead of with a select per key"""
+        chunk_size = 200    # sqlite allows 999 parameters
+        found = {}
+        if not keys:
+            return found
+        wanted = set(keys)
+        pidx = keycols.index('playerId')
+        where, args = [], []
+        for i, col in enumerate(keycols):
+            values = set(k[i] for k in wanted)
+            if i == pidx or len(values) > chunk_size/2:
+                continue
+            conds = []
+            if None in values:
+                values.discard(None)
+                conds.append(col + " IS NULL")
+            if values:
+                conds.append(col + " IN (" + ",".join(["%s"] * len(values)) + ")")
+                args += list(values)
+            where.append(" AND (" + " OR ".join(conds) + ")")
+        players = sorted(set(k[pidx] for k in wanted))
+        for i in xrange(0, len(players), chunk_size):
+            chunk = players[i:i+chunk_size]
+            q = ("SELECT id, " + ", ".join(keycols) + " FROM " + table
+                 + " WHERE playerId IN (" + ",".join(["%s"] * len(chunk)) + ")" + "".join(where))
+            q = q.replace('%s', self.sql.query['placeholder'])
+            c.execute(q, chunk + args)
+            for row in c.fetchall():
+                key = tuple(row[1:])
+                if key in wanted:
+                    found[key] = row[0]
+        return found
+
     def storeSessions(self, hid, pids, startTime, tid, heroes, tz_name, doinsert = False):
         """Update cached sessions. If no record exists, do an insert"""
         THRESHOLD     = timedelta(seconds=int(self.sessionTimeout * 60))
@@ -2570,64 +2953,12 @@ class Database:
             weekdate   = datetime(local.year, local.month, local.day)
             weekStart  = weekdate - timedelta(days=weekdate.weekday())
        
-        j, hand = None, {}
+        if self.sb is None:
+            self.sb = SessionBucket(THRESHOLD)
         for p, id in pids.iteritems():
             if id in heroes:
-                hand['startTime']  = startTime.replace(tzinfo=None)
-                hand['weekStart']  = weekStart
-                hand['monthStart'] = monthStart
-                hand['ids'] = [hid]
-                hand['tourneys'] = set()
-        
-        id = []
-        if hand:
-            lower = hand['startTime']-THRESHOLD
-            upper = hand['startTime']+THRESHOLD
-            for i in range(len(self.s['bk'])):
-                if (((lower  <= self.s['bk'][i]['sessionEnd'])
-                and  (upper  >= self.s['bk'][i]['sessionStart']))
-                or   (tid in self.s['bk'][i]['tourneys'])):
-                    if ((hand['startTime'] <= self.s['bk'][i]['sessionEnd']) 
-                    and (hand['startTime'] >= self.s['bk'][i]['sessionStart'])):
-                         id.append(i)
-                    elif hand['startTime'] < self.s['bk'][i]['sessionStart']:
-                         self.s['bk'][i]['sessionStart'] = hand['startTime']
-                         self.s['bk'][i]['weekStart']    = hand['weekStart']
-                         self.s['bk'][i]['monthStart']   = hand['monthStart']
-                         id.append(i)
-                    elif hand['startTime'] > self.s['bk'][i]['sessionEnd']:
-                         self.s['bk'][i]['sessionEnd'] = hand['startTime']
-                         id.append(i)
-            if len(id) == 1:
-                j = id[0]
-                self.s['bk'][j]['ids'] += [hid]
-                if tid: self.s['bk'][j]['tourneys'].add(tid)
-            elif len(id) > 1:
-                merged = {}
-                merged['ids'] = [hid]
-                merged['tourneys'] = set()
-                if tid: merged['tourneys'].add(tid) 
-                for n in id:
-                    h = self.s['bk'][n]
-                    if not merged.get('sessionStart') or merged.get('sessionStart') > h['sessionStart']:
-                        merged['sessionStart'] = h['sessionStart']
-                        merged['weekStart'] = h['weekStart']
-                        merged['monthStart'] = h['monthStart']
-                    if not merged.get('sessionEnd') or merged.get('sessionEnd') < h['sessionEnd']:
-                        merged['sessionEnd'] = h['sessionEnd']
-                    merged['ids'] += h['ids']
-                    merged['tourneys'].union(h['tourneys'])
-                    self.s['bk'][n]['delete'] = True
-                    
-                self.s['bk'] = [item for item in self.s['bk'] if not item.get('delete')]
-                self.s['bk'].append(merged)
-            elif len(id) == 0:
-                j = len(self.s['bk'])
-                hand['id'] = None
-                hand['sessionStart'] = hand['startTime']
-                hand['sessionEnd']   = hand['startTime']
-                if tid: hand['tourneys'].add(tid)
-                self.s['bk'].append(hand)
+                self.sb.add(hid, startTime.replace(tzinfo=None), weekStart, monthStart, tid)
+                break
         
         if doinsert:
             select_S     = self.sql.query['select_S'].replace('%s', self.sql.query['placeholder'])
@@ -2643,11 +2974,12 @@ class Database:
             update_S_H   = self.sql.query['update_S_H'].replace('%s', self.sql.query['placeholder'])
             delete_S     = self.sql.query['delete_S'].replace('%s', self.sql.query['placeholder'])
             c = self.get_cursor()
-            for i in range(len(self.s['bk'])):                
-                lower = self.s['bk'][i]['sessionStart'] - THRESHOLD
-                upper = self.s['bk'][i]['sessionEnd']   + THRESHOLD
-                tourneys = self.s['bk'][i]['tourneys']
-                if (self.s['bk'][i]['tourneys']):
+            merged, results = {}, []  # merged: session id -> (id, wid, mid) of the session replacing it
+            for session in (self.sb or ()):
+                lower = session['sessionStart'] - THRESHOLD
+                upper = session['sessionEnd']   + THRESHOLD
+                tourneys = session['tourneys']
+                if (session['tourneys']):
                     toursql = 'OR SC.id in (SELECT DISTINCT sessionId FROM Tourneys T WHERE T.id in (%s))' % ', '.join(str(t) for t in tourneys)
                     q = select_S.replace('<TOURSELECT>', toursql)
                 else:
@@ -2660,29 +2992,28 @@ class Database:
                     week, month = r[0]['weekStart'],    r[0]['monthStart']
                     wid, mid    = r[0]['weekId'],       r[0]['monthId']
                     update, updateW, updateM = False, False, False
-                    if self.s['bk'][i]['sessionStart'] < start:
-                        start, update = self.s['bk'][i]['sessionStart'], True
-                        if self.s['bk'][i]['weekStart'] != week:
-                            week, updateW = self.s['bk'][i]['weekStart'], True
-                        if self.s['bk'][i]['monthStart'] != month:
-                            month, updateM = self.s['bk'][i]['monthStart'], True
+                    if session['sessionStart'] < start:
+                        start, update = session['sessionStart'], True
+                        if session['weekStart'] != week:
+                            week, updateW = session['weekStart'], True
+                        if session['monthStart'] != month:
+                            month, updateM = session['monthStart'], True
                         if (updateW or updateM):
                             self.wmold.add((wid, mid))
-                    if self.s['bk'][i]['sessionEnd'] > end:
-                        end, update = self.s['bk'][i]['sessionEnd'], True
+                    if session['sessionEnd'] > end:
+                        end, update = session['sessionEnd'], True
                     if updateW:  wid = self.insertOrUpdate('weeks', c, (week,), select_W, insert_W)
                     if updateM:  mid = self.insertOrUpdate('months', c, (month,), select_M, insert_M)
                     if (updateW or updateM):
                         self.wmnew.add((wid, mid))
                     if update: 
                         c.execute(update_S, [wid, mid, start, end, r[0]['id']])
-                    for h in  self.s['bk'][i]['ids']:
-                        self.s[h] = {'id': r[0]['id'], 'wid': wid, 'mid': mid}
+                    results.append((session, (r[0]['id'], wid, mid)))
                 elif (num > 1):
                     start, end, wmold, merge = None, None, set(), []
                     for n in r: merge.append(n['id'])
                     merge.sort()
-                    r.append(self.s['bk'][i])
+                    r.append(session)
                     for n in r:
                         if 'weekId' in n:
                             wmold.add((n['weekId'],  n['monthId']))    
@@ -2709,29 +3040,35 @@ class Database:
                     row = [wid, mid, start, end]
                     c.execute(insert_S, row)
                     sid = self.get_last_insert_id(c)
-                    for h in self.s['bk'][i]['ids']:
-                        self.s[h] = {'id': sid, 'wid': wid, 'mid': mid}
+                    results.append((session, (sid, wid, mid)))
                     for m in merge:
-                        for h, n in self.s.iteritems():
-                            if h!='bk' and n['id'] == m:
-                                self.s[h] = {'id': sid, 'wid': wid, 'mid': mid}
+                        merged[m] = (sid, wid, mid)
                         c.execute(update_S_TC,(sid, m))
                         c.execute(update_S_SC,(sid, m))
                         c.execute(update_S_T, (sid, m))
                         c.execute(update_S_H, (sid, m))
                         c.execute(delete_S, (m,))
                 elif (num == 0):
-                    start   =  self.s['bk'][i]['sessionStart']
-                    end     =  self.s['bk'][i]['sessionEnd']
-                    week    =  self.s['bk'][i]['weekStart']
-                    month   =  self.s['bk'][i]['monthStart']
+                    start   =  session['sessionStart']
+                    end     =  session['sessionEnd']
+                    week    =  session['weekStart']
+                    month   =  session['monthStart']
                     wid = self.insertOrUpdate('weeks', c, (week,), select_W, insert_W)
                     mid = self.insertOrUpdate('months', c, (month,), select_M, insert_M)
                     row = [wid, mid, start, end]
                     c.execute(insert_S, row)
                     sid = self.get_last_insert_id(c)
-                    for h in self.s['bk'][i]['ids']:
-                        self.s[h] = {'id': sid, 'wid': wid, 'mid': mid}
+                    results.append((session, (sid, wid, mid)))
+            for session, (sid, wid, mid) in results:
+                # follow the merges done after this session was written
+                path = []
+                while sid in merged:
+                    path.append(sid)
+                    (sid, wid, mid) = merged[sid]
+                for m in path:
+                    merged[m] = (sid, wid, mid)
+                for h in session['ids']:
+                    self.s[h] = {'id': sid, 'wid': wid, 'mid': mid}
             self.commit()
     
     def storeSessionsCache(self, hid, pids, startTime, gametypeId, gametype, pdata, heroes, doinsert = False):
@@ -2938,17 +3275,13 @@ class Database:
             update_cardscache = update_cardscache.replace('%s', self.sql.query['placeholder'])
             insert_cardscache = self.sql.query['insert_cardscache']
             insert_cardscache = insert_cardscache.replace('%s', self.sql.query['placeholder'])
-            select_cardscache_ring = self.sql.query['select_cardscache_ring']
-            select_cardscache_ring = select_cardscache_ring.replace('%s', self.sql.query['placeholder'])
-            select_cardscache_tour = self.sql.query['select_cardscache_tour']
-            select_cardscache_tour = select_cardscache_tour.replace('%s', self.sql.query['placeholder'])
             
             select_W     = self.sql.query['select_W'].replace('%s', self.sql.query['placeholder'])
             select_M     = self.sql.query['select_M'].replace('%s', self.sql.query['placeholder'])
             insert_W     = self.sql.query['insert_W'].replace('%s', self.sql.query['placeholder'])
             insert_M     = self.sql.query['insert_M'].replace('%s', self.sql.query['placeholder'])
             
-            dccache, inserts = {}, []
+            dccache = {}
             for k, l in self.dcbulk.iteritems():
                 sc = self.s.get(k[0])
                 if sc != None:                    
@@ -2965,25 +3298,7 @@ class Database:
                             dccache[n] = l
 
             c = self.get_cursor()
-            for k, item in dccache.iteritems():
-                if k[3]:
-                    q = select_cardscache_tour
-                    row = list(k)
-                else:
-                    q = select_cardscache_ring
-                    row = list(k[:3]) + list(k[-2:])
-                c.execute(q, row)
-                result = c.fetchone()
-                if result:
-                    id = result[0]
-                    update = item + [id]
-                    c.execute(update_cardscache, update)                 
-                else:
-                    insert = list(k) + item
-                    inserts.append(insert)
-                
-            if inserts:
-                self.executemany(c, insert_cardscache, inserts)
+            if self.mergeCache(c, 'CardsCache', CARDSCACHE_KEYS, dccache, update_cardscache, insert_cardscache):
                 self.commit()
             
     def storePositionsCache(self, hid, pids, startTime, gametypeId, tourneyTypeId, pdata, hdata, heroes, tz_name, doinsert):
@@ -3009,17 +3324,13 @@ class Database:
             insert_positionscache = self.sql.query['insert_positionscache']
             insert_positionscache = insert_positionscache.replace('%s', self.sql.query['placeholder'])
             
-            select_positionscache_ring = self.sql.query['select_positionscache_ring']
-            select_positionscache_ring = select_positionscache_ring.replace('%s', self.sql.query['placeholder'])
-            select_positionscache_tour = self.sql.query['select_positionscache_tour']
-            select_positionscache_tour = select_positionscache_tour.replace('%s', self.sql.query['placeholder'])
             
             select_W     = self.sql.query['select_W'].replace('%s', self.sql.query['placeholder'])
             select_M     = self.sql.query['select_M'].replace('%s', self.sql.query['placeholder'])
             insert_W     = self.sql.query['insert_W'].replace('%s', self.sql.query['placeholder'])
             insert_M     = self.sql.query['insert_M'].replace('%s', self.sql.query['placeholder'])
                 
-            pccache, inserts = {}, []
+            pccache = {}
             for k, l in self.pcbulk.iteritems():
                 sc = self.s.get(k[0])
                 if sc != None:
@@ -3036,26 +3347,7 @@ class Database:
                             pccache[n] = l
             
             c = self.get_cursor()
-            for k, item in pccache.iteritems():
-                if k[3]:
-                    q = select_positionscache_tour
-                    row = list(k)
-                else:
-                    q = select_positionscache_ring
-                    row = list(k[:3]) + list(k[-4:])
-                
-                c.execute(q, row)
-                result = c.fetchone()
-                if result:
-                    id = result[0]
-                    update = item + [id]
-                    c.execute(update_positionscache, update)
-                else:
-                    insert = list(k) + item
-                    inserts.append(insert)
-                
-            if inserts:
-                self.executemany(c, insert_positionscache, inserts)
+            if self.mergeCache(c, 'PositionsCache', POSITIONSCACHE_KEYS, pccache, update_positionscache, insert_positionscache):
                 self.commit()
     
     def appendHandsSessionIds(self):
@@ -3091,6 +3383,22 @@ class Database:
         c = self.get_cursor()
         c.execute(q, fdata)
 
+    def getFileOffset(self, id):
+        q = self.sql.query['get_file_offset']
+        q = q.replace('%s', self.sql.query['placeholder'])
+        c = self.get_cursor()
+        c.execute(q, (id,))
+        offset = c.fetchone()
+        if not offset or offset[0] is None:
+            return 0
+        return offset[0]
+
+    def updateFileOffset(self, id, offset):
+        q = self.sql.query['update_file_offset']
+        q = q.replace('%s', self.sql.query['placeholder'])
+        c = self.get_cursor()
+        c.execute(q, (offset, id))
+
     def getHeroIds(self, pids, sitename):
         #Grab playerIds using hero names in HUD_Config.xml
         try:
@@ -3129,23 +3437,63 @@ class Database:
         id += self.hand_inc
         return id
 
-    def isDuplicate(self, siteId, siteHandNo, heroSeat, publicDB):
-        q = self.sql.query['isAlreadyInDB'].replace('%s', self.sql.query['placeholder'])
+    def siteHandKey(self, siteId, siteHandNo, heroSeat, publicDB):
+        """Key for a hand in siteHandNos"""
+        try:
+            siteHandNo = long(siteHandNo)
+        except (TypeError, ValueError):
+            pass
         if publicDB:
-            key = (siteHandNo, siteId, heroSeat)
-            q = q.replace('<heroSeat>', ' AND heroSeat=%s').replace('%s', self.sql.query['placeholder'])
-        else:
-            key = (siteHandNo, siteId)
-            q = q.replace('<heroSeat>', '')
+            return (siteHandNo, siteId, heroSeat)
+        return (siteHandNo, siteId)
+
+    def isDuplicate(self, siteId, siteHandNo, heroSeat, publicDB):
+        key = self.siteHandKey(siteId, siteHandNo, heroSeat, publicDB)
         if key in self.siteHandNos:
             return True
-        c = self.get_cursor()
-        c.execute(q, key)
-        result = c.fetchall()
-        if len(result) > 0:
-            return True
-        self.siteHandNos.append(key)
+        if key not in self.checkedHandNos:
+            q = self.sql.query['isAlreadyInDB'].replace('%s', self.sql.query['placeholder'])
+            if publicDB:
+                q = q.replace('<heroSeat>', ' AND heroSeat=%s').replace('%s', self.sql.query['placeholder'])
+            else:
+                q = q.replace('<heroSeat>', '')
+            c = self.get_cursor()
+            c.execute(q, key)
+            result = c.fetchall()
+            if len(result) > 0:
+                return True
+        self.siteHandNos.add(key)
         return False
+
+    def findDuplicates(self, hands, publicDB):
+        """Batched isDuplicate for a file's worth of hands, given as (siteId, siteHandNo, heroSeat)
+           tuples. Looks them up chunk_size siteHandNos per query and returns the set of the
+           keys (see siteHandKey) that are already in the db. isDuplicate doesn't query again
+           for any of the hands"""
+        chunk_size = 500    # sqlite allows 999 parameters
+        keys = set()
+        bysite = {}
+        for (siteId, siteHandNo, heroSeat) in hands:
+            key = self.siteHandKey(siteId, siteHandNo, heroSeat, publicDB)
+            if key not in keys:
+                keys.add(key)
+                bysite.setdefault(siteId, set()).add(key[0])
+        found = set()
+        c = self.get_cursor()
+        for siteId, siteHandNos in bysite.iteritems():
+            siteHandNos = sorted(siteHandNos)
+            for i in xrange(0, len(siteHandNos), chunk_size):
+                chunk = siteHandNos[i:i+chunk_size]
+                q = self.sql.query['findAlreadyInDB'].replace('<siteHandNos>', ','.join(['%s'] * len(chunk)))
+                q = q.replace('%s', self.sql.query['placeholder'])
+                c.execute(q, [siteId] + chunk)
+                for (siteHandNo, heroSeat) in c.fetchall():
+                    key = self.siteHandKey(siteId, siteHandNo, heroSeat, publicDB)
+                    if key in keys:
+                        found.add(key)
+        self.checkedHandNos.update(keys)
+        self.siteHandNos.update(found)
+        return found
     
     def getSqlPlayerIDs(self, pnames, siteid, hero):
         result = {}
@@ -3163,10 +3511,94 @@ class Database:
             #result[player] = self.pcache[player]
 
         return result
-    
-    def insertPlayer(self, name, site_id, hero):
+
+    def loadPlayerIDs(self, players):
+        """Put the ids of players, (name, siteId, hero) tuples for all the hands of a file,
+           in pcache with a query per site and chunk_size names. Players that aren't in the db
+           yet are inserted with one executemany, so getSqlPlayerIDs doesn't go to the db for
+           any of them"""
+        chunk_size = 500    # sqlite allows 999 parameters
+        if(self.pcache == None):
+            self.pcache = LambdaDict(lambda  key:self.insertPlayer(key[0], key[1], key[2]))
+
+        wanted = {}         # siteId -> {name: hero}
+        for key in players:
+            if key not in self.pcache:
+                names = wanted.setdefault(key[1], {})
+                names[key[0]] = names.get(key[0], False) or key[2]
+
+        c = self.get_cursor()
+        select = "SELECT id, name, hero FROM Players WHERE siteId=%s AND name IN (<names>)"
         insert_player = "INSERT INTO Players (name, siteId, hero, chars) VALUES (%s, %s, %s, %s)"
         insert_player = insert_player.replace('%s', self.sql.query['placeholder'])
+        for site_id, names in wanted.iteritems():
+            rows, dbnames = {}, {}
+            for name, hero in names.iteritems():
+                rows[name] = self.playerRow(name, site_id, hero)
+                dbnames[name] = rows[name][0]
+                if not isinstance(dbnames[name], unicode):
+                    dbnames[name] = unicode(dbnames[name], 'utf8')
+            found = self.fetchPlayers(c, select, site_id, [row[0] for row in rows.values()], chunk_size)
+            # names that only match a player with different case (MySQL collation) are left
+            # to insertPlayer
+            folded = set(name.lower() for name in found)
+            missing = []
+            for name, row in rows.iteritems():
+                if dbnames[name] not in found and dbnames[name].lower() not in folded:
+                    folded.add(dbnames[name].lower())
+                    missing.append(row)
+            if missing:
+                self.executemany(c, insert_player, missing)
+                found.update(self.fetchPlayers(c, select, site_id, [row[0] for row in missing], chunk_size))
+
+            for name, hero in names.iteritems():
+                player = found.get(dbnames[name])
+                if player is None:
+                    continue
+                (id, dbhero) = player
+                if hero and not dbhero:
+                    q = "UPDATE Players SET hero=%s WHERE id=%s"
+                    q = q.replace('%s', self.sql.query['placeholder'])
+                    c.execute(q, (True, id))
+                    self.pcache[(name, site_id, False)] = id
+                self.pcache[(name, site_id, hero)] = id
+
+    def fetchPlayers(self, c, select, site_id, names, chunk_size):
+        """Returns {name: (id, hero)} for those of names that are in the Players table"""
+        found = {}
+        for i in xrange(0, len(names), chunk_size):
+            chunk = names[i:i+chunk_size]
+            q = select.replace('<names>', ','.join(['%s'] * len(chunk)))
+            q = q.replace('%s', self.sql.query['placeholder'])
+            c.execute(q, [site_id] + chunk)
+            for (id, name, hero) in c.fetchall():
+                if not isinstance(name, unicode):
+                    name = unicode(name, 'utf8')
+                found[name] = (id, hero)
+        return found
+
+    def preloadPlayerCache(self, site):
+        """Fill pcache with the players of site, once, if it is enabled and the hero has a
+           screen name for it: the players auto import keeps seeing"""
+        if site in self.preloaded:
+            return
+        self.preloaded.add(site)
+        site_id = self.config.site_ids.get(site)
+        if (site_id is None or site not in self.config.supported_sites
+                or not self.config.supported_sites[site].screen_name):
+            return
+        if(self.pcache == None):
+            self.pcache = LambdaDict(lambda  key:self.insertPlayer(key[0], key[1], key[2]))
+        q = "SELECT id, name, hero FROM Players WHERE siteId=%s"
+        q = q.replace('%s', self.sql.query['placeholder'])
+        c = self.get_cursor()
+        c.execute(q, (site_id,))
+        for (id, name, hero) in c.fetchall():
+            self.pcache[(name, site_id, bool(hero))] = id
+        log.info(_("Preloaded the player ids of %s, %d in the cache") % (site, len(self.pcache)))
+
+    def playerRow(self, name, site_id, hero):
+        """Values for insert_player: (name, siteId, hero, chars)"""
         _name = Charset.to_db_utf8(name)
         if re_char.match(_name[0]):
             char = '123'
@@ -3174,8 +3606,12 @@ class Database:
             char = _name[0] + '1'
         else:
             char = _name[:2]
-        
-        key = (_name, site_id, hero, char.upper())
+        return (_name, site_id, hero, char.upper())
+
+    def insertPlayer(self, name, site_id, hero):
+        insert_player = "INSERT INTO Players (name, siteId, hero, chars) VALUES (%s, %s, %s, %s)"
+        insert_player = insert_player.replace('%s', self.sql.query['placeholder'])
+        key = self.playerRow(name, site_id, hero)
         
         #NOTE/FIXME?: MySQL has ON DUPLICATE KEY UPDATE
         #Usage:
@@ -3453,7 +3889,7 @@ class Database:
                         self.rebuild_cache(None, None, t, None, wmid)
             self.commit()
             
-    def rebuild_caches(self):
+    def rebuild_caches(self, progress = None, resume = False):
         if self.callHud and self.cacheSessions:
             tables = ('HudCache','CardsCache', 'PositionsCache')
         elif self.cacheSessions:
@@ -3461,7 +3897,9 @@ class Database:
         else:
             tables = ('HudCache',)
         for t in tables:
-            self.rebuild_cache(None, None, t)
+            if not self.rebuild_cache(None, None, t, progress = progress, resume = resume):
+                return False
+        return True
                 
     def resetClean(self):
         self.ttold = set()
@@ -3687,6 +4125,77 @@ class Database:
     
 #end class Database
 
+
+READ_POOL_SIZE = 4  # released read connections kept for other threads, the others are closed
+
+class ReadPool:
+    """Read-only connections for the gui tabs, the HUD and its aux windows.
+
+    get gives a thread its own connection, the same one every time, until the thread
+    calls release, which hands it over to the next thread needing one. The connections
+    cannot write, and the queries between two rollbacks see the db as it was at the
+    first of them: a snapshot of the WAL on SQLite, REPEATABLE READ on PostgreSQL and
+    MySQL. So readers block neither the importer, which writes on connections of its
+    own, nor each other."""
+
+    def __init__(self, size=READ_POOL_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = []                  # released connections, as (key, Database)
+        self.threads = threading.local()
+
+    def key(self, config):
+        """What tells the dbs of configs apart"""
+        db = config.get_db_parameters()
+        return (db['db-backend'], db['db-host'], db['db-databaseName'], db['db-user'], config.dir_database)
+
+    def connections(self):
+        """{key: Database} of the calling thread"""
+        if not hasattr(self.threads, 'connections'):
+            self.threads.connections = {}
+        return self.threads.connections
+
+    def get(self, config, sql=None):
+        """The read connection of the calling thread to the db of config"""
+        key = self.key(config)
+        connections = self.connections()
+        if key not in connections:
+            db = None
+            with self.lock:
+                for (i, (idle_key, idle)) in enumerate(self.idle):
+                    if idle_key == key:
+                        db = self.idle.pop(i)[1]
+                        break
+            if db is None:
+                db = Database(config, sql=sql, read_only=True)
+            connections[key] = db
+        return connections[key]
+
+    def release(self):
+        """Give back the connections of the calling thread, for the thread's end"""
+        connections = self.connections()
+        for (key, db) in connections.items():
+            db.rollback()
+            with self.lock:
+                if len(self.idle) < self.size:
+                    self.idle.append((key, db))
+                    db = None
+            if db is not None:
+                db.close_connection()
+        connections.clear()
+
+read_pool = ReadPool()
+
+def read_connection(config, sql=None):
+    """The read-only Database of the calling thread, from read_pool. Writes stay on the
+       connections of the importer, which are made with Database(config)"""
+    return read_pool.get(config, sql)
+
+def release_read_connection():
+    """Give back the read connection of the calling thread, before the thread ends"""
+    read_pool.release()
+
+
 if __name__=="__main__":
     c = Configuration.Config()
     sql = SQL.Sql(db_server = 'sqlite')
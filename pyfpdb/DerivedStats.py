@@ -19,6 +19,7 @@
 import L10n
 _ = L10n.get_translation()
 import Card
+import PreflopEquity
 from decimal_wrapper import Decimal, ROUND_DOWN
 
 import sys
@@ -29,8 +30,14 @@ log = logging.getLogger("parser")
 try:
     from pokereval import PokerEval
     pokereval = PokerEval()
+    allin_ev = True
 except:
-    pokereval = None
+    # the built-in evaluator, slower but good for the same stats
+    from HandEvaluator import PokerEval, numpy
+    pokereval = PokerEval()
+    # without NumPy it deals the boards one at a time, seconds a hand: only the all-in EVs
+    # of the equities PreflopEquity has are worked out
+    allin_ev = numpy is not None
     
 def _buildStatsInitializer():
     init = {}
@@ -169,10 +176,7 @@ class DerivedStats():
         self.hands['texture']       = None                    # No calculation done for this yet.
         self.hands['tourneyId']     = hand.tourneyId
         
-        self.hands['heroSeat']      = 0
-        for player in hand.players:
-            if hand.hero==player[1]:
-                self.hands['heroSeat'] = player[0]
+        self.hands['heroSeat']      = hand.getHeroSeat()
         # This (i think...) is correct for both stud and flop games, as hand.board['street'] disappears, and
         # those values remain default in stud.
         boardcards = []
@@ -241,7 +245,7 @@ class DerivedStats():
                 player_stats['sitout'] = False
             if hand.gametype["type"]=="tour":
                 player_stats['tourneyTypeId']=hand.tourneyTypeId
-                player_stats['tourneysPlayersId'] = hand.tourneysPlayersIds[player[1]]
+                player_stats['tourneysPlayersId'] = hand.tourneysPlayersIds.get(player[1])
             else:
                 player_stats['tourneysPlayersId'] = None
             if player_name in hand.shown:
@@ -377,6 +381,10 @@ class DerivedStats():
                         self.handsplayers[act[0]]['street%dAllIn' %(i-1)] = True
     
     def assembleHandsStove(self, hand):
+        # HandsStove and HandsPots rows carry the player name in the playerId
+        # column, Hand.insertHandsStove/insertHandsPlayers swap in the db ids.
+        # This keeps assembly free of any db lookups so it can run in the
+        # parse processes of a parallel bulk import.
         category = hand.gametype['category']
         holecards, holeplayers, allInStreets = {}, [], hand.allStreets[1:]
         base, evalgame, hilo, streets, last, hrange = Card.games[category]
@@ -420,21 +428,22 @@ class DerivedStats():
                                         _cards = ''.join([pokereval.card2string(i)[0] for i in rank[1:]])
                                     else:
                                         _cards = None
-                                    self.handsstove.append( [hand.dbid_hands, hand.dbid_pids[pname], streetId, boardId, hl, rankId, value, _cards, 0] )
+                                    self.handsstove.append( [hand.dbid_hands, pname, streetId, boardId, hl, rankId, value, _cards, 0] )
                             else:
-                                self.handsstove.append( [hand.dbid_hands, hand.dbid_pids[pname], streetId, boardId, 'n', 1, 0, None, 0] )
+                                self.handsstove.append( [hand.dbid_hands, pname, streetId, boardId, 'n', 1, 0, None, 0] )
             else:
                 hl, streetId = hiLoKey[hilo][0][0], 0
                 if (hp['sawShowdown'] or hp['showed']):
                     hp['handString'] = hand.showdownStrings.get(pname)
                     streetId = streets[last]
-                self.handsstove.append( [hand.dbid_hands, hand.dbid_pids[player[1]], streetId, 0, hl, 1, 0, None, 0] )
+                self.handsstove.append( [hand.dbid_hands, player[1], streetId, 0, hl, 1, 0, None, 0] )
         
         if base=='hold' and evalgame:
             self.getAllInEV(hand, evalgame, holeplayers, boards, streets, holecards)
                 
     def getAllInEV(self, hand, evalgame, holeplayers, boards, streets, holecards):
         startstreet, potId, allInStreets = None, 0, hand.allStreets[1:]
+        known = True    # the equities of the all-in street were had, else allInEV is left out
         for pot, players in hand.pot.pots:
             if potId ==0: pot += sum(hand.pot.common.values())
             potId+=1
@@ -449,30 +458,38 @@ class DerivedStats():
                     if len(players) == len(valid) and (board['allin'] or hand.publicDB):
                         if board['allin'] and not startstreet: startstreet = street
                         if len(valid) > 1:
-                            evs = pokereval.poker_eval(
-                                game = evalgame, 
-                                iterations = Card.iter[streetId],
-                                pockets = [holecards[p]['hole'] for p in valid],
-                                dead = [], 
-                                board = [str(b) for b in board['board'][n]] + (5 - len(board['board'][n])) * ['__']
-                            )
-                            equities = [e['ev'] for e in evs['eval']]
+                            equities = None
+                            if len(valid) == 2 and evalgame == 'holdem' and not board['board'][n]:
+                                # heads-up preflop, exact from the table
+                                equities = PreflopEquity.equities(*[holecards[p]['hole'] for p in valid])
+                            if equities is None and not allin_ev:
+                                if street == startstreet:
+                                    known = False
+                                continue
+                            if equities is None:
+                                evs = pokereval.poker_eval(
+                                    game = evalgame, 
+                                    iterations = Card.iter[streetId],
+                                    pockets = [holecards[p]['hole'] for p in valid],
+                                    dead = [], 
+                                    board = [str(b) for b in board['board'][n]] + (5 - len(board['board'][n])) * ['__']
+                                )
+                                equities = [e['ev'] for e in evs['eval']]
                         else:
                             equities = [1000]
                         remainder = (1000 - sum(equities)) / Decimal(len(equities))
                         for i in range(len(equities)):
                             equities[i] += remainder
                             p = valid[i]
-                            pid = hand.dbid_pids[p]
                             if street == startstreet:
                                 rake = (hand.rake * (Decimal(pot)/Decimal(hand.totalpot)))
                                 holecards[p]['eq'] += ((pot - rake) * equities[i])/Decimal(10)
                                 holecards[p]['committed'] = 100*hand.pot.committed[p] + 100*hand.pot.common[p]
                             for j in self.handsstove:
-                                if [pid, streetId, boardId] == j[1:4] and len(valid) == len(hand.pot.contenders):
+                                if [p, streetId, boardId] == j[1:4] and len(valid) == len(hand.pot.contenders):
                                     j[-1] = equities[i]
         for p in holeplayers:
-            if holecards[p]['committed'] != 0: 
+            if known and holecards[p]['committed'] != 0: 
                 self.handsplayers[p]['allInEV'] = holecards[p]['eq'] - holecards[p]['committed']
     
     def getBoardsList(self, hand):
@@ -662,7 +679,7 @@ class DerivedStats():
                             collected = ppot - rake 
                         potFound[p][0] -= ppot
                         potFound[p][1] -= collected
-                        insert = [None, item['potId'], item['boardId'], item['hiLo'][0], hand.dbid_pids[p], int(item['ppot']*100), int(collected*100), int(rake*100)]   
+                        insert = [None, item['potId'], item['boardId'], item['hiLo'][0], p, int(item['ppot']*100), int(collected*100), int(rake*100)]   
                         self.handspots.append(insert)
                         self.handsplayers[p]['rake'] += int(rake*100)
 
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Event driven watching of hand history directories for the auto importer.
+
+Uses Linux inotify through ctypes, get_watcher() returns None where that is
+not available and the importer carries on polling the directories."""
+
+import L10n
+_ = L10n.get_translation()
+
+import os
+import sys
+import errno
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+import logging
+# logging has been set up in fpdb.py or HUD_main.py, use their settings:
+log = logging.getLogger("importer")
+
+# from <sys/inotify.h>
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')     # wd, mask, cookie, len
+READ_SIZE = 65536
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.inotify_init.argtypes = []
+    _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+except (OSError, AttributeError):
+    _libc = None
+
+
+def get_watcher(queue, callback = None):
+    """Return an InotifyWatcher putting changed paths on queue, or None if this
+       platform has no inotify"""
+    if _libc is None:
+        return None
+    try:
+        return InotifyWatcher(queue, callback)
+    except OSError, e:
+        log.warning(_("Could not start inotify watcher: %s") % e)
+        return None
+
+
+class InotifyWatcher(threading.Thread):
+    """Thread putting the path of every file created or written in the watched
+       directories, and their subdirectories, on a Queue.
+
+       None is put on the queue if the kernel dropped events, the reader should
+       then check all its files. callback, if given, is called from this thread
+       after each batch of paths has been queued."""
+
+    def __init__(self, queue, callback = None):
+        threading.Thread.__init__(self, name = "InotifyWatcher")
+        self.daemon = True
+        self.queue = queue
+        self.callback = callback
+        self.watches = {}                     # watch descriptor -> directory
+        self.fd = _libc.inotify_init()
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        (self.stop_r, self.stop_w) = os.pipe()
+
+    def addDirectory(self, dir):
+        """Watch dir and all directories below it"""
+        for subdir in os.walk(dir):
+            self._addWatch(subdir[0])
+
+    def _addWatch(self, dir):
+        if isinstance(dir, unicode):
+            path = dir.encode(sys.getfilesystemencoding())
+        else:
+            path = dir
+        wd = _libc.inotify_add_watch(self.fd, path, WATCH_MASK)
+        if wd < 0:
+            log.warning(_("Could not watch directory '%s': %s") % (dir, os.strerror(ctypes.get_errno())))
+        else:
+            self.watches[wd] = dir
+
+    def stop(self):
+        os.write(self.stop_w, 'x')
+        if self.is_alive():
+            self.join()
+        for fd in (self.fd, self.stop_r, self.stop_w):
+            os.close(fd)
+
+    def run(self):
+        while True:
+            try:
+                readable = select.select([self.fd, self.stop_r], [], [])[0]
+                if self.stop_r in readable:
+                    return
+                buf = os.read(self.fd, READ_SIZE)
+            except (OSError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                log.error(_("inotify watcher stopped: %s") % e)
+                self.queue.put(None)
+                return
+            if self.readEvents(buf) and self.callback is not None:
+                self.callback()
+
+    def readEvents(self, buf):
+        """Queue the paths of the events in buf, returns True if any were queued"""
+        queued = False
+        pos = 0
+        while pos < len(buf):
+            (wd, mask, cookie, length) = EVENT_HEADER.unpack_from(buf, pos)
+            name = buf[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip('\0')
+            pos += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                log.warning(_("inotify event queue overflowed, checking all files"))
+                self.queue.put(None)
+                queued = True
+                continue
+            if mask & IN_IGNORED:           # directory was removed
+                self.watches.pop(wd, None)
+                continue
+            dir = self.watches.get(wd)
+            if dir is None or not name:
+                continue
+            if isinstance(dir, unicode):
+                name = name.decode(sys.getfilesystemencoding(), 'replace')
+            path = os.path.join(dir, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # files may already be there by the time the watch is added
+                    self.addDirectory(path)
+                    for subdir in os.walk(path):
+                        for file in subdir[2]:
+                            self.queue.put(os.path.join(subdir[0], file))
+                            queued = True
+                continue
+            self.queue.put(path)
+            queued = True
+        return queued
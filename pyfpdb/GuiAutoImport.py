@@ -27,10 +27,11 @@ import sys
 import logging
 
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QSpinBox, QPushButton, QLineEdit, QTextEdit, QCheckBox, QFileDialog
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, pyqtSignal
 from PyQt5.QtGui import QTextCursor
 
 import Importer
+import HudChannel
 from optparse import OptionParser
 import Configuration
 import string
@@ -46,9 +47,12 @@ if os.name == "nt":
 
 
 class GuiAutoImport(QWidget):
+    filesChanged = pyqtSignal()     # emitted from the importer's file watcher thread
+
     def __init__(self, settings, config, sql = None, parent = None, cli = False):
         QWidget.__init__(self, parent)
         self.importtimer = None
+        self.filesChanged.connect(self.do_import)
         self.settings = settings
         self.config = config
         self.sql = sql
@@ -56,6 +60,7 @@ class GuiAutoImport(QWidget):
 
         self.input_settings = {}
         self.pipe_to_hud = None
+        self.hud_server = None
 
         self.importer = Importer.Importer(self, self.settings, self.config, self.sql)
         self.importer.setCallHud(True)
@@ -197,25 +202,28 @@ class GuiAutoImport(QWidget):
                 self.doAutoImportBool = True
                 self.intervalEntry.setEnabled(False)
                 if self.pipe_to_hud is None:
+                    # the hands go to the HUD over a socket, stdin stays open as before
+                    self.hud_server = HudChannel.HudServer()
+                    hud_options = " --hudport %d --hudtoken %s" % (self.hud_server.port, self.hud_server.token)
                     if self.config.install_method == "exe":    # if py2exe, run hud_main.exe
                         path = self.config.pyfpdb_path
-                        command = "HUD_main.exe"
+                        command = "HUD_main.exe" + hud_options
                         bs = 0
                     elif self.config.install_method == "app":
-                        command = os.path.join(sys.path[0], "HUD_main")
+                        command = [os.path.join(sys.path[0], "HUD_main"), ] + string.split(hud_options)
                         bs = 1
                     elif os.name == 'nt':
                         path = sys.path[0].replace('\\','\\\\')
                         if win32console.GetConsoleWindow() == 0:
-                            command = 'pythonw "'+path+'\\HUD_main.pyw" ' + self.settings['cl_options']
+                            command = 'pythonw "'+path+'\\HUD_main.pyw" ' + self.settings['cl_options'] + hud_options
                         else:
-                            command = 'python "'+path+'\\HUD_main.pyw" ' + self.settings['cl_options']
+                            command = 'python "'+path+'\\HUD_main.pyw" ' + self.settings['cl_options'] + hud_options
                         bs = 0
                     else:
                         command = os.path.join(sys.path[0], 'HUD_main.pyw')
                         if not os.path.isfile(command):
                             self.addText("\n" + _('*** %s was not found') % (command))
-                        command = [command, ] + string.split(self.settings['cl_options'])
+                        command = [command, ] + string.split(self.settings['cl_options'] + hud_options)
                         bs = 1
 
                         print _("opening pipe to HUD")
@@ -236,6 +244,10 @@ class GuiAutoImport(QWidget):
                             self.importer.addImportDirectory(self.input_settings[(site,type)][0], monitor = True, site=(site,type))
                             self.addText("\n * " + _("Add %s import directory %s") % (site, self.input_settings[(site,type)][0]))
                             self.do_import()
+                        # with a watcher hands are imported as soon as they are written,
+                        # the timer below is then only needed for the summary grab
+                        if self.importer.startWatcher(self.filesChanged.emit):
+                            self.addText("\n * " + _("Watching import directories for changes"))
                     interval = self.intervalEntry.value()
                     self.importtimer = QTimer()
                     self.importtimer.timeout.connect(self.do_import)
@@ -246,9 +258,13 @@ class GuiAutoImport(QWidget):
         else: # toggled off
             self.doAutoImportBool = False # do_import will return this and stop the gobject callback timer
             self.importtimer = None
+            self.importer.stopWatcher()
             self.importer.autoSummaryGrab(True)
             self.settings['global_lock'].release()
             self.addText("\n" + _("Stopping Auto Import.") + _("Global lock released."))
+            if self.hud_server is not None:
+                self.hud_server.close()
+                self.hud_server = None
             if self.pipe_to_hud.poll() is not None:
                 self.addText("\n * " + _("Stop Auto Import") + ": " + _("HUD already terminated."))
             else:
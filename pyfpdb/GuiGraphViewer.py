@@ -27,6 +27,7 @@ from time import time
 import Database
 import Filters
 import Charset
+import QueryRunner
 
 try:
     calluse = not 'matplotlib' in sys.modules
@@ -54,8 +55,13 @@ class GuiGraphViewer(QSplitter):
         self.conf = config
         self.debug = debug
         self.parent = parent
-        self.db = Database.Database(self.conf, sql=self.sql)
+        self.db = Database.read_connection(self.conf, sql=self.sql)
 
+        # the graph query runs off the gui thread, a refresh cancels the one running
+        self.runner = QueryRunner.QueryRunner(self.conf, self)
+        self.runner.rows.connect(self.graphRows)
+        self.runner.failed.connect(self.graphFailed)
+        self.winnings = []
 
         filters_display = { "Heroes"    : True,
                             "Sites"     : True,
@@ -118,6 +124,7 @@ class GuiGraphViewer(QSplitter):
         self.canvas.setParent(self)
 
     def generateGraph(self, widget):
+        self.runner.cancel()
         self.clearGraphData()
 
         sitenos = []
@@ -158,14 +165,35 @@ class GuiGraphViewer(QSplitter):
             self.db.rollback()
             return
 
+        #Get graph data from DB, drawGraph draws it once it is there
+        self.starttime = time()
+        self.graph = (names, graphops, display_in)
+        self.winnings = []
+        self.runner.run([self.getRingProfitGraph(playerids, sitenos, limits, games, currencies, display_in)])
+        self.db.rollback()
+
+    def graphRows(self, job, index, colnames, rows):
+        """Rows of the graph query, no rows once they are all there"""
+        if not self.runner.current(job):
+            return
+        if rows:
+            self.winnings.extend(rows)
+            return
+        (green, blue, red, orange) = self.profitLines(self.winnings)
+        self.winnings = []
+        print _("Graph generated in: %s") %(time() - self.starttime)
+        self.drawGraph(green, blue, red, orange)
+
+    def graphFailed(self, job, error):
+        if self.runner.current(job):
+            print _("Graph failed: %s") % error
+
+    def drawGraph(self, green, blue, red, orange):
+        (names, graphops, display_in) = self.graph
+
         #Set graph properties
         self.ax = self.fig.add_subplot(111)
 
-        #Get graph data from DB
-        starttime = time()
-        (green, blue, red, orange) = self.getRingProfitGraph(playerids, sitenos, limits, games, currencies, display_in)
-        print _("Graph generated in: %s") %(time() - starttime)
-
         #Set axis labels and grid overlay properites
         self.ax.set_xlabel(_("Hands"))
         # SET LABEL FOR X AXIS
@@ -225,6 +253,7 @@ class GuiGraphViewer(QSplitter):
 
 
     def getRingProfitGraph(self, names, sites, limits, games, currencies, units):
+        """The query of the (handId, totalProfit, sawShowdown, allInEV) rows profitLines adds up"""
 #        tmp = self.sql.query['getRingProfitAllHandsPlayerIdSite']
 #        print "DEBUG: getRingProfitGraph"
 
@@ -279,11 +308,9 @@ class GuiGraphViewer(QSplitter):
 
         #print "DEBUG: sql query:"
         #print tmp
-        self.db.cursor.execute(tmp)
-        #returns (HandId,Winnings,Costs,Profit)
-        winnings = self.db.cursor.fetchall()
-        self.db.rollback()
+        return tmp
 
+    def profitLines(self, winnings):
         if len(winnings) == 0:
             return (None, None, None, None)
 
@@ -32,16 +32,159 @@ import SQL
 import Filters
 import Deck
 
-from PyQt5.QtCore import QCoreApplication, QSortFilterProxyModel, Qt
-from PyQt5.QtGui import (QPainter, QPixmap, QStandardItem, QStandardItemModel)
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtGui import (QPainter, QPixmap)
 from PyQt5.QtWidgets import (QApplication, QFrame, QMenu,
-                             QProgressDialog, QScrollArea, QSplitter,
+                             QScrollArea, QSplitter,
                              QTableView, QVBoxLayout)
 
 from StringIO import StringIO
+from collections import OrderedDict
 
 import GuiReplayer
 
+PREFETCH = 200              # hands read from the db at once, a page of rows
+HAND_CACHE_SIZE = 2000      # Hand objects kept, the least recently used ones are dropped
+PIXMAP_CACHE_SIZE = 500     # rendered card strings kept
+CARD_HEIGHT = 42
+CARD_WIDTH = 30
+
+COLUMNS = ['Stakes', 'Pos', 'Street0', 'Action0', 'Street1-4', 'Action1-4',
+           'Won', 'Bet', 'Net', 'Game', 'HandId']
+
+
+class HandsModel(QAbstractTableModel):
+    """The rows of the hand viewer. Only the hand ids, the hero's net and start cards of the
+    hands are read up front, the hands themselves are read a page of PREFETCH rows at a time
+    when the view first shows one of the rows, and their cards rendered when they are drawn.
+    Sorts by hand id or net only, the other columns are not known for all the rows"""
+
+    def __init__(self, viewer):
+        QAbstractTableModel.__init__(self)
+        self.viewer = viewer
+        self.handinfo = {}          # hand id -> (net, start cards abbreviation or None)
+        self.order = []             # hand ids of the rows, filtered and sorted
+        self.sortkey = (COLUMNS.index('HandId'), Qt.AscendingOrder)
+        self.rows = {}              # hand id -> the values of the columns
+        self.hands = OrderedDict()  # hand id -> Hand, least recently used first
+        self.pixmaps = OrderedDict()
+
+    def set_hands(self, handinfo):
+        """handinfo has rows of get_hands_from_date_range"""
+        self.beginResetModel()
+        self.handinfo = {}
+        for (handid, net, card1, card2, category) in handinfo:
+            abbr = None
+            if card1 and card2 and category in ('holdem', 'omahahi', 'omahahilo'):
+                # Holdem: the real start cards as the card filter has them (ie. AhKh = AKs)
+                (c1, c2) = (Card.valueSuitFromCard(card1), Card.valueSuitFromCard(card2))
+                abbr = Card.twoStartCardString(Card.twoStartCards(Card.card_map[c1[0]], c1[1], Card.card_map[c2[0]], c2[1]))
+            self.handinfo[handid] = (net, abbr)
+        self.rows = {}
+        self.hands.clear()
+        self.order = self.filtered()
+        self.sort_order()
+        self.endResetModel()
+
+    def filtered(self):
+        card_filter = self.viewer.filters.getCards()
+        return [handid for (handid, (net, abbr)) in self.handinfo.iteritems()
+                if abbr is None or card_filter[abbr]]
+
+    def refilter(self):
+        self.beginResetModel()
+        self.order = self.filtered()
+        self.sort_order()
+        self.endResetModel()
+
+    def sort_order(self):
+        (column, order) = self.sortkey
+        if column == COLUMNS.index('Net'):
+            self.order.sort(key=lambda handid: (self.handinfo[handid][0], handid))
+        else:
+            self.order.sort()
+        if order == Qt.DescendingOrder:
+            self.order.reverse()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column not in (COLUMNS.index('HandId'), COLUMNS.index('Net')):
+            # put the indicator back on the column the rows are sorted by
+            self.viewer.view.horizontalHeader().setSortIndicator(*self.sortkey)
+            return
+        if (column, order) == self.sortkey:
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.sortkey = (column, order)
+        self.sort_order()
+        self.layoutChanged.emit()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = COLUMNS[index.column()]
+        if role == Qt.DisplayRole:
+            if column in ('Street0', 'Street1-4'):
+                return ""
+            if column == 'Net':
+                # the net the rows are sorted by, it counts the antes
+                return str(self.handinfo[self.order[index.row()]][0])
+            return self.row(index.row())[index.column()]
+        if role == Qt.DecorationRole and column in ('Street0', 'Street1-4'):
+            return self.cards_pixmap(self.row(index.row())[index.column()])
+        return None
+
+    def row(self, rownum):
+        handid = self.order[rownum]
+        if handid not in self.rows:
+            start = rownum - rownum % PREFETCH
+            self.load([h for h in self.order[start:start + PREFETCH] if h not in self.rows])
+        return self.rows[handid]
+
+    def hand(self, handid):
+        """The Hand of handid, read again if it was dropped, None if it is not in the db"""
+        if handid not in self.hands:
+            self.load([handid])
+        hand = self.hands.pop(handid, None)
+        if hand is not None:
+            self.hands[handid] = hand
+        return hand
+
+    def load(self, handids):
+        heroes = self.viewer.filters.getHeroes()
+        hands = Hand.select_many(self.viewer.db, handids, self.viewer.config)
+        self.viewer.db.rollback()
+        for handid in handids:
+            hand = hands.get(handid)
+            if hand is None:
+                self.rows[handid] = [None] * (len(COLUMNS) - 1) + [str(handid)]
+                continue
+            hand.hero = heroes[hand.sitename]
+            self.rows[handid] = self.viewer.hand_row(handid, hand)
+            self.hands[handid] = hand
+        while len(self.hands) > HAND_CACHE_SIZE:
+            self.hands.popitem(last=False)
+
+    def cards_pixmap(self, cardstring):
+        pixmap = self.pixmaps.pop(cardstring, None)
+        if pixmap is None:
+            pixmap = self.viewer.render_cards(cardstring)
+            while len(self.pixmaps) >= PIXMAP_CACHE_SIZE:
+                self.pixmaps.popitem(last=False)
+        self.pixmaps[cardstring] = pixmap
+        return pixmap
+
+
 class GuiHandViewer(QSplitter):
     def __init__(self, config, querylist, mainwin):
         QSplitter.__init__(self, mainwin)
@@ -50,7 +193,7 @@ class GuiHandViewer(QSplitter):
         self.sql = querylist
         self.replayer = None
 
-        self.db = Database.Database(self.config, sql=self.sql)
+        self.db = Database.read_connection(self.config, sql=self.sql)
 
         
         filters_display = { "Heroes"    : True,
@@ -89,41 +232,24 @@ class GuiHandViewer(QSplitter):
         self.setStretchFactor(0, 0)
         self.setStretchFactor(1, 1)
 
-        self.deck_instance = Deck.Deck(self.config, height=42, width=30)
+        self.deck_instance = Deck.Deck(self.config, height=CARD_HEIGHT, width=CARD_WIDTH)
         self.cardImages = self.init_card_images()
 
-        # Dict of colnames and their column idx in the model/ListStore
-        self.colnum = {
-                  'Stakes'       : 0,
-                  'Pos'          : 1,
-                  'Street0'      : 2,
-                  'Action0'      : 3,
-                  'Street1-4'    : 4,
-                  'Action1-4'    : 5,
-                  'Won'          : 6,
-                  'Bet'          : 7,
-                  'Net'          : 8,
-                  'Game'         : 9,
-                  'HandId'       : 10,
-                 }
+        # Dict of colnames and their column idx in the model
+        self.colnum = dict((name, idx) for (idx, name) in enumerate(COLUMNS))
         self.view = QTableView()
         self.view.setSelectionBehavior(QTableView.SelectRows)
         self.handsVBox.addWidget(self.view)
-        self.model = QStandardItemModel(0, len(self.colnum), self.view)
-        self.filterModel = QSortFilterProxyModel()
-        self.filterModel.setSourceModel(self.model)
-        self.filterModel.setSortRole(Qt.UserRole)
+        self.model = HandsModel(self)
 
-        self.view.setModel(self.filterModel)
+        self.view.setModel(self.model)
         self.view.verticalHeader().hide()
-        self.model.setHorizontalHeaderLabels(
-            ['Stakes', 'Pos', 'Street0', 'Action0', 'Street1-4', 'Action1-4',
-             'Won', 'Bet', 'Net', 'Game', 'HandId'])
+        self.view.verticalHeader().setDefaultSectionSize(CARD_HEIGHT + 4)
+        # size the columns to the rows on screen, not to all the rows
+        self.view.horizontalHeader().setResizeContentsPrecision(0)
 
         self.view.doubleClicked.connect(self.row_activated)
         self.view.contextMenuEvent = self.contextMenu
-        self.filterModel.rowsInserted.connect(lambda index, start, end: [self.view.resizeRowToContents(r) for r in xrange(start, end + 1)])
-        self.filterModel.filterAcceptsRow = lambda row, sourceParent: self.is_row_in_card_filter(row)
 
         self.view.resizeColumnsToContents()
         self.view.setSortingEnabled(True)
@@ -144,10 +270,11 @@ class GuiHandViewer(QSplitter):
         return card_images
 
     def loadHands(self, checkState):
-        hand_ids = self.get_hand_ids_from_date_range(self.filters.getDates()[0], self.filters.getDates()[1])
-        self.reload_hands(hand_ids)
+        hands = self.get_hands_from_date_range(self.filters.getDates()[0], self.filters.getDates()[1])
+        self.reload_hands(hands)
 
-    def get_hand_ids_from_date_range(self, start, end):
+    def get_hands_from_date_range(self, start, end):
+        """(hand id, net, card1, card2, category) of the hero's hands in the date range"""
         q = self.db.sql.query['handsInRange']
         q = q.replace('<datetest>', "between '" + start + "' and '" + end + "'")
         q = self.filters.replace_placeholders_with_filter_values(q)
@@ -155,7 +282,9 @@ class GuiHandViewer(QSplitter):
         c = self.db.get_cursor()
 
         c.execute(q)
-        return [r[0] for r in c.fetchall()]
+        hands = c.fetchall()
+        self.db.rollback()
+        return hands
 
     def rankedhand(self, hand, game):
         ranks = {'0':0, '2':2, '3':3, '4':4, '5':5, '6':6, '7':7, '8':8, '9':9, 'T':10, 'J':11, 'Q':12, 'K':13, 'A':14}
@@ -175,27 +304,14 @@ class GuiHandViewer(QSplitter):
         else:
             return 0
 
-    def reload_hands(self, handids):
-        self.hands = {}
-        self.model.removeRows(0, self.model.rowCount())
-        if len(handids) == 0:
-            return
-        progress = QProgressDialog("Loading hands", "Abort", 0, len(handids), self)
-        progress.setValue(0)
-        progress.show()
-        for idx, handid in enumerate(handids):
-            if progress.wasCanceled():
-                break
-            self.hands[handid] = self.importhand(handid)
-            self.addHandRow(handid, self.hands[handid])
-            progress.setValue(idx + 1)
-            if idx % 10 == 0:
-                QCoreApplication.processEvents()
-                self.view.resizeColumnsToContents()
+    def reload_hands(self, hands):
+        """Show hands, rows of get_hands_from_date_range, reading them as they are shown"""
+        self.model.set_hands(hands)
         self.view.resizeColumnsToContents()
     
-    def addHandRow(self, handid, hand):
-        hero = self.filters.getHeroes()[hand.sitename]
+    def hand_row(self, handid, hand):
+        """The values of the columns of the row of hand"""
+        hero = hand.hero
         won = 0
         if hero in hand.collectees.keys():
             won = hand.collectees[hero]
@@ -239,17 +355,7 @@ class GuiHandViewer(QSplitter):
             row = [hand.getStakesAsString(), pos, hand.join_holecards(hero,street='DEAL'), hand.get_actions_short(hero, 'DEAL'), None, None, 
                    str(won), str(bet), str(net), gt, str(handid)]
 
-        modelrow = [QStandardItem(r) for r in row]
-        for index, item in enumerate(modelrow):
-            item.setEditable(False)
-            if index in (self.colnum['Street0'], self.colnum['Street1-4']):
-                cards = item.data(Qt.DisplayRole)
-                item.setData(self.render_cards(cards), Qt.DecorationRole)
-                item.setData("", Qt.DisplayRole)
-                item.setData(cards, Qt.UserRole + 1)
-            if index in (self.colnum['Bet'], self.colnum['Net'], self.colnum['Won']):
-                item.setData(float(item.data(Qt.DisplayRole)), Qt.UserRole)
-        self.model.appendRow(modelrow)
+        return row
 
     def copyHandToClipboard(self, checkState, hand):
         handText = StringIO()
@@ -260,7 +366,9 @@ class GuiHandViewer(QSplitter):
         index = self.view.currentIndex()
         if index.row() < 0:
             return
-        hand = self.hands[int(index.sibling(index.row(), self.colnum['HandId']).data())]
+        hand = self.model.hand(int(index.sibling(index.row(), self.colnum['HandId']).data()))
+        if hand is None:
+            return
         m = QMenu()
         copyAction = m.addAction('Copy to clipboard')
         copyAction.triggered.connect(partial(self.copyHandToClipboard, hand=hand))
@@ -268,48 +376,18 @@ class GuiHandViewer(QSplitter):
         m.exec_()
 
     def filter_cards_cb(self, card):
-        if hasattr(self, 'hands'):
-            self.filterModel.invalidateFilter()
-
-    def is_row_in_card_filter(self, rownum):
-        """ Returns true if the cards of the given row are in the card filter """
-        # Does work but all cards that should NOT be displayed have to be clicked.
-        card_filter = self.filters.getCards() 
-        hcs = self.model.data(self.model.index(rownum, self.colnum['Street0']), Qt.UserRole + 1).split(' ')
-        
-        if '0x' in hcs:      #if cards are unknown return True
-            return True
-        
-        gt = self.model.data(self.model.index(rownum, self.colnum['Game']))
-
-        if gt not in ('holdem', 'omahahi', 'omahahilo'): return True
-        # Holdem: Compare the real start cards to the selected filter (ie. AhKh = AKs)
-        value1 = Card.card_map[hcs[0][0]]
-        value2 = Card.card_map[hcs[1][0]]
-        idx = Card.twoStartCards(value1, hcs[0][1], value2, hcs[1][1])
-        abbr = Card.twoStartCardString(idx)
-        return card_filter[abbr]
+        self.model.refilter()
 
     def row_activated(self, index):
-        handlist = list(sorted(self.hands.keys()))
-        self.replayer = GuiReplayer.GuiReplayer(self.config, self.sql, self.main_window, handlist)
-
-        self.replayer.play_hand(handlist.index(int(index.sibling(index.row(), self.colnum['HandId']).data())))
-
-    def importhand(self, handid=1):
-        # Fetch hand info
-        # We need at least sitename, gametype, handid
-        # for the Hand.__init__
-
-        h = Hand.hand_factory(handid, self.config, self.db)
+        # the replayer steps through the rows as they are shown, filtered and sorted
+        handlist = list(self.model.order)
+        self.replayer = GuiReplayer.GuiReplayer(self.config, self.sql, self.main_window, handlist, self.model.hands)
 
-        # Set the hero for this hand using the filter for the sitename of this hand
-        h.hero = self.filters.getHeroes()[h.sitename]
-        return h
+        self.replayer.play_hand(index.row())
 
     def render_cards(self, cardstring):
-        card_width  = 30
-        card_height = 42
+        card_width  = CARD_WIDTH
+        card_height = CARD_HEIGHT
         if cardstring is None or cardstring == '':
             cardstring = "0x"
         cardstring = cardstring.replace("'","")
@@ -34,8 +34,8 @@ class GuiPositionalStats:
         self.PGSQL          = 3
         self.SQLITE         = 4
         
-        # create new db connection to avoid conflicts with other threads
-        self.db = Database.Database(self.conf, sql=self.sql)
+        # the read connection of the gui thread, shared with the other tabs
+        self.db = Database.read_connection(self.conf, sql=self.sql)
         self.cursor = self.db.cursor
 
         settings = {}
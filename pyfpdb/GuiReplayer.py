@@ -28,6 +28,7 @@ import Configuration
 import Database
 import SQL
 import Deck
+from ICM import ICM
 
 from PyQt5.QtCore import (QPoint, QRect, Qt, QTimer)
 from PyQt5.QtGui import (QColor, QImage, QPainter)
@@ -42,20 +43,22 @@ import os
 
 CARD_HEIGHT = 42
 CARD_WIDTH = 30
+PREFETCH = 40   # hands read from the db at once
 
 class GuiReplayer(QWidget):
     """A Replayer to replay hands."""
-    def __init__(self, config, querylist, mainwin, handlist):
+    def __init__(self, config, querylist, mainwin, handlist, hands=None):
         QWidget.__init__(self, None)
         self.setFixedSize(800, 680)
         self.conf = config
         self.main_window = mainwin
         self.sql = querylist
 
-        self.db = Database.Database(self.conf, sql=self.sql)
+        self.db = Database.read_connection(self.conf, sql=self.sql)
         self.states = [] # List with all table states.
         self.handlist = handlist
         self.handidx = 0
+        self.hands = dict(hands or {})  # hand id -> Hand, read PREFETCH at a time
 
         self.setWindowTitle("FPDB Hand Replayer")
         
@@ -209,7 +212,7 @@ class GuiReplayer(QWidget):
 
     def play_hand(self, handidx):
         self.handidx = handidx
-        hand = Hand.hand_factory(self.handlist[handidx], self.conf, self.db)
+        hand = self.importhand(self.handlist[handidx])
         # hand.writeHand()  # Print handhistory to stdout -> should be an option in the GUI
         self.currency = hand.sym
 
@@ -269,10 +272,16 @@ class GuiReplayer(QWidget):
         self.update()
 
     def importhand(self, handid=1):
-
-        h = Hand.hand_factory(handid, self.conf, self.db)
-        
-        return h
+        if handid not in self.hands and handid in self.handlist:
+            # read the hands around this one too, for the prev and next buttons
+            idx = self.handlist.index(handid)
+            start = max(0, idx - PREFETCH // 2)
+            chunk = [h for h in self.handlist[start:start + PREFETCH] if h not in self.hands]
+            self.hands.update(Hand.select_many(self.db, chunk, self.conf))
+        if handid not in self.hands:
+            self.hands[handid] = Hand.hand_factory(handid, self.conf, self.db)
+        self.db.rollback()
+        return self.hands[handid]
 
     def play_clicked(self, checkState):
         self.playing = not self.playing
@@ -303,32 +312,6 @@ class GuiReplayer(QWidget):
                 self.stateSlider.setValue(i)
                 break
 
-# ICM code originally grabbed from http://svn.gna.org/svn/pokersource/trunk/icm-calculator/icm-webservice.py
-# Copyright (c) 2008 Thomas Johnson <tomfmason@gmail.com>
-
-class ICM:
-    def __init__(self, stacks, payouts):
-        self.stacks = stacks
-        self.payouts = payouts
-        self.equities = []
-        self.prepare()
-    def prepare(self):
-        total = sum(self.stacks)
-        for k in self.stacks:
-            self.equities.append(round(Decimal(str(self.getEquities(total, k, 0))), 4))
-    def getEquities(self, total, player, depth):
-        D = Decimal
-        eq = D(self.stacks[player]) / total * D(str(self.payouts[depth]))
-        if(depth + 1 < len(self.payouts)):
-            i=0
-            for stack in self.stacks:
-                if i != player and stack > 0.0:
-                    self.stacks[i] = 0.0
-                    eq += self.getEquities((total - stack), player, (depth + 1)) * (stack / D(total))
-                    self.stacks[i] = stack
-                i += 1
-        return eq
-
 class TableState:
     def __init__(self, hand):
         self.pot = Decimal(0)
@@ -31,6 +31,7 @@ import Card
 import Database
 import Filters
 import Charset
+import QueryRunner
 
 colalias,colheading,colshowsumm,colshowposn,colformat,coltype,colxalign = 0,1,2,3,4,5,6
 ranks = {'x':0, '2':2, '3':3, '4':4, '5':5, '6':6, '7':7, '8':8, '9':9, 'T':10, 'J':11, 'Q':12, 'K':13, 'A':14}
@@ -82,15 +83,23 @@ class GuiRingPlayerStats(QSplitter):
         
         self.liststore = []   # gtk.ListStore[]         stores the contents of the grids
         self.listcols = []    # gtk.TreeViewColumn[][]  stores the columns in the grids
+        self.gridviews = []   # QTableView[]            shows the grids
+        self.gridcols = []    # (cols_to_show, holecards) of the grids, for the rows to come
 
         self.MYSQL_INNODB   = 2
         self.PGSQL          = 3
         self.SQLITE         = 4
 
-        # create new db connection to avoid conflicts with other threads
-        self.db = Database.Database(self.conf, sql=self.sql)
+        # the read connection of the gui thread, shared with the other tabs
+        self.db = Database.read_connection(self.conf, sql=self.sql)
         self.cursor = self.db.cursor
 
+        # the stats queries run off the gui thread, a refresh cancels the one running
+        self.runner = QueryRunner.QueryRunner(self.conf, self)
+        self.runner.rows.connect(self.gridRows)
+        self.runner.done.connect(self.statsDone)
+        self.runner.failed.connect(self.statsFailed)
+
         settings = {}
         settings.update(self.conf.get_db_parameters())
         settings.update(self.conf.get_import_parameters())
@@ -188,8 +197,11 @@ class GuiRingPlayerStats(QSplitter):
             steals_column[colshowposn] = False
 
     def refreshStats(self, checkState):
+        self.runner.cancel()
         self.liststore = []
         self.listcols = []
+        self.gridviews = []
+        self.gridcols = []
         self.stats_frame.layout().removeWidget(self.stats_vbox)
         self.stats_vbox.setParent(None)
         self.stats_vbox = QSplitter(Qt.Vertical)
@@ -237,7 +249,7 @@ class GuiRingPlayerStats(QSplitter):
         self.createStatsTable(vbox, playerids, sitenos, limits, seats, groups, dates, games, currencies)
 
     def createStatsTable(self, vbox, playerids, sitenos, limits, seats, groups, dates, games, currencies):
-        startTime = time()
+        self.startTime = time()
         show_detail = True
 
 #        # Display summary table at top of page
@@ -246,8 +258,8 @@ class GuiRingPlayerStats(QSplitter):
 #        #   numhands  - min number hands required when displaying all players
 #        #   gridnum   - index for grid data structures
         flags = [False, self.filters.getNumHands(), 0]
-        self.addGrid(vbox, 'playerDetailedStats', flags, playerids
-                    ,sitenos, limits, seats, groups, dates, games, currencies)
+        queries = [self.addGrid(vbox, 'playerDetailedStats', flags, playerids
+                               ,sitenos, limits, seats, groups, dates, games, currencies)]
 
         if 'allplayers' in groups:
             # can't currently do this combination so skip detailed table
@@ -267,32 +279,47 @@ class GuiRingPlayerStats(QSplitter):
             # Detailed table
             flags[0] = True
             flags[2] = 1
-            self.addGrid(vbox2, 'playerDetailedStats', flags, playerids
-                        ,sitenos, limits, seats, groups, dates, games, currencies)
+            queries.append(self.addGrid(vbox2, 'playerDetailedStats', flags, playerids
+                                       ,sitenos, limits, seats, groups, dates, games, currencies))
 
         self.db.rollback()
-        print (_("Stats page displayed in %4.2f seconds") % (time() - startTime))
+        self.runner.run(queries)
+
+    def gridRows(self, job, grid, colnames, rows):
+        """Rows of the query of grid, no rows once they are all there"""
+        if not self.runner.current(job):
+            return
+        if rows:
+            self.addRows(grid, colnames, rows)
+        else:
+            self.finishGrid(grid)
+
+    def statsDone(self, job):
+        if self.runner.current(job):
+            print (_("Stats page displayed in %4.2f seconds") % (time() - self.startTime))
+
+    def statsFailed(self, job, error):
+        if self.runner.current(job):
+            print _("Stats page failed: %s") % error
 
     def addGrid(self, vbox, query, flags, playerids, sitenos, limits, seats, groups, dates, games, currencies):
-        sqlrow = 0
+        """Add the view of a grid and return the query of its rows, which go in with addRows"""
         if not flags:  holecards,grid = False,0
         else:          holecards,grid = flags[0],flags[2]
 
         tmp = self.sql.query[query]
         tmp = self.refineQuery(tmp, flags, playerids, sitenos, limits, seats, groups, dates, games, currencies)
-        self.cursor.execute(tmp)
-        result = self.cursor.fetchall()
-        colnames = [desc[0].lower() for desc in self.cursor.description]
 
         # pre-fetch some constant values:
         colshow = colshowsumm
         if 'posn' in groups:  colshow = colshowposn
-        self.cols_to_show = [x for x in self.columns if x[colshow]]
-        hgametypeid_idx = colnames.index('hgametypeid')
+        cols_to_show = [x for x in self.columns if x[colshow]]
+        self.gridcols.append((cols_to_show, holecards))
 
         assert len(self.liststore) == grid, "len(self.liststore)="+str(len(self.liststore))+" grid-1="+str(grid)
         view = QTableView()
-        self.liststore.append(QStandardItemModel(0, len(self.cols_to_show), view))
+        self.gridviews.append(view)
+        self.liststore.append(QStandardItemModel(0, len(cols_to_show), view))
         self.liststore[grid].setSortRole(Qt.UserRole)
         view.setModel(self.liststore[grid])
         view.verticalHeader().hide()
@@ -300,19 +327,24 @@ class GuiRingPlayerStats(QSplitter):
         self.listcols.append( [] )
 
         # Create header row   eg column: ("game",     True, "Game",     0.0, "%s")
-        for col, column in enumerate(self.cols_to_show):
+        for col, column in enumerate(cols_to_show):
             if column[colalias] == 'game' and holecards:
                 s = [x for x in self.columns if x[colalias] == 'hand'][0][colheading]
             else:
                 s = column[colheading]
             self.listcols[grid].append(s)
         self.liststore[grid].setHorizontalHeaderLabels(self.listcols[grid])
+        return tmp
 
-        rows = len(result) # +1 for title row
+    def addRows(self, grid, colnames, result):
+        (cols_to_show, holecards) = self.gridcols[grid]
+        hgametypeid_idx = colnames.index('hgametypeid')
+        rows = len(result)
+        sqlrow = 0
 
         while sqlrow < rows:
             treerow = []
-            for col,column in enumerate(self.cols_to_show):
+            for col,column in enumerate(cols_to_show):
                 if column[colalias] in colnames:
                     value = result[sqlrow][colnames.index(column[colalias])]
                     if column[colalias] == 'plposition':
@@ -374,6 +406,8 @@ class GuiRingPlayerStats(QSplitter):
             self.liststore[grid].appendRow(treerow)
             sqlrow += 1
 
+    def finishGrid(self, grid):
+        view = self.gridviews[grid]
         view.resizeColumnsToContents()
         view.setSortingEnabled(True) # do this after resizing columns, otherwise it leaves room for the sorting triangle in every heading
         view.resizeColumnToContents(0) # we want room for the sorting triangle in column 0 where it starts.
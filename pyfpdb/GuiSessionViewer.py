@@ -50,6 +50,7 @@ import Card
 import Database
 import Filters
 import Charset
+import QueryRunner
 
 import GuiHandViewer
 
@@ -75,10 +76,16 @@ class GuiSessionViewer(QSplitter):
         self.ax = None
         self.graphBox = None
         
-        # create new db connection to avoid conflicts with other threads
-        self.db = Database.Database(self.conf, sql=self.sql)
+        # the read connection of the gui thread, shared with the other tabs
+        self.db = Database.read_connection(self.conf, sql=self.sql)
         self.cursor = self.db.cursor
 
+        # the sessions query runs off the gui thread, a refresh cancels the one running
+        self.runner = QueryRunner.QueryRunner(self.conf, self)
+        self.runner.rows.connect(self.sessionRows)
+        self.runner.failed.connect(self.sessionsFailed)
+        self.hands = []
+
         settings = {}
         settings.update(self.conf.get_db_parameters())
         settings.update(self.conf.get_import_parameters())
@@ -151,6 +158,7 @@ class GuiSessionViewer(QSplitter):
         self.main_vbox.addWidget(self.stats_frame)
 
     def refreshStats(self, checkState):
+        self.runner.cancel()
         if self.view:
             self.stats_frame.layout().removeWidget(self.view)
             self.view.setParent(None)
@@ -195,9 +203,29 @@ class GuiSessionViewer(QSplitter):
         self.createStatsPane(frame, playerids, sitenos, games, currencies, limits, seats)
 
     def createStatsPane(self, frame, playerids, sitenos, games, currencies, limits, seats):
-        starttime = time()
+        """Start the sessions query, showSessions fills frame once its rows are there"""
+        self.starttime = time()
+        self.frame = frame
+        self.hands = []
+        self.runner.run([self.sessionQuery(playerids, sitenos, games, currencies, limits, seats)])
+        self.db.rollback()
+
+    def sessionRows(self, job, index, colnames, rows):
+        """Rows of the sessions query, no rows once they are all there"""
+        if not self.runner.current(job):
+            return
+        if rows:
+            self.hands.extend(rows)
+            return
+        (hands, self.hands) = (self.hands, [])
+        self.showSessions(hands)
+
+    def sessionsFailed(self, job, error):
+        if self.runner.current(job):
+            print _("Stats page failed: %s") % error
 
-        (results, quotes) = self.generateDatasets(playerids, sitenos, games, currencies, limits, seats)
+    def showSessions(self, hands):
+        (results, quotes) = self.generateDatasets(hands)
 
         if DEBUG:
             for x in quotes:
@@ -205,16 +233,12 @@ class GuiSessionViewer(QSplitter):
 
         self.generateGraph(quotes)
 
-        self.addTable(frame, results)
-
-        self.db.rollback()
-        print _("Stats page displayed in %4.2f seconds") % (time() - starttime)
+        self.addTable(self.frame, results)
 
-    def generateDatasets(self, playerids, sitenos, games, currencies, limits, seats):
-        if (DEBUG): print "DEBUG: Starting generateDatasets"
-        THRESHOLD = 1800     # Min # of secs between consecutive hands before being considered a new session
-        PADDING   = 5        # Additional time in minutes to add to a session, session startup, shutdown etc
+        print _("Stats page displayed in %4.2f seconds") % (time() - self.starttime)
 
+    def sessionQuery(self, playerids, sitenos, games, currencies, limits, seats):
+        """The query of the (start time, profit) of the hands generateDatasets makes the sessions of"""
         # Get a list of timestamps and profits
 
         q = self.sql.query['sessionStats']
@@ -255,6 +279,12 @@ class GuiSessionViewer(QSplitter):
         nametest = nametest.replace(",)",")")
         q = q.replace("<player_test>", nametest)
         q = q.replace("<ampersand_s>", "%s")
+        return q
+
+    def generateDatasets(self, hands):
+        if (DEBUG): print "DEBUG: Starting generateDatasets"
+        THRESHOLD = 1800     # Min # of secs between consecutive hands before being considered a new session
+        PADDING   = 5        # Additional time in minutes to add to a session, session startup, shutdown etc
 
         if DEBUG:
             hands = [ 
@@ -275,9 +305,6 @@ class GuiSessionViewer(QSplitter):
                 (u'150000', -40), (u'150000',  40),
                 (u'160000', -40), (u'160000',  80), (u'160000', -40),
                 ]
-        else:
-            self.db.cursor.execute(q)
-            hands = self.db.cursor.fetchall()
 
         #fixme - nasty hack to ensure that the hands.insert() works 
         # for mysql data.  mysql returns tuples which can't be inserted
@@ -460,8 +487,8 @@ class GuiSessionViewer(QSplitter):
             # at the edges of the date range are not included. A better solution may be possible.
             # Optionally the end date in the call below, which is a Long gets a '+1'.
             reformat = lambda t: strftime("%Y-%m-%d %H:%M:%S+00:00", gmtime(t))
-            handids = replayer.get_hand_ids_from_date_range(reformat(self.times[index.row()][0]), reformat(self.times[index.row()][1]))
-            replayer.reload_hands(handids)
+            hands = replayer.get_hands_from_date_range(reformat(self.times[index.row()][0]), reformat(self.times[index.row()][1]))
+            replayer.reload_hands(hands)
 
 if __name__ == '__main__':
     import Configuration
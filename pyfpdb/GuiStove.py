@@ -235,7 +235,8 @@ Against the range: {
         self.stove.set_hero_cards_string(self.p1_board.get_text())
         self.stove.set_villain_range_string(self.p2_board.get_text())
         print (_("DEBUG:") + ("odds_for_range"))
-        self.ev = Stove.odds_for_range(self.stove)
+        # no worker processes: forking the threads of the Qt gui is not safe
+        self.ev = Stove.odds_for_range(self.stove, processes=1)
         print (_("DEBUG:") + " " + ("set_output_label"))
         self.set_output_label(self.ev.output)
 
@@ -56,7 +56,7 @@ class GuiTourneyGraphViewer(QSplitter):
         self.conf = config
         self.debug = debug
         self.parent = parent
-        self.db = Database.Database(self.conf, sql=self.sql)
+        self.db = Database.read_connection(self.conf, sql=self.sql)
 
 
         filters_display = { "Heroes"    : True,
@@ -36,6 +36,8 @@ import os
 import thread
 import time
 import string
+import socket
+import Queue
 import logging
 
 from PyQt5.QtCore import (QCoreApplication, QMetaObject, QObject, Qt,
@@ -50,6 +52,9 @@ import Database
 import Hud
 import Options
 import Deck
+import Stats
+import StatStore
+import HudChannel
 
 (options, argv) = Options.fpdb_options()
 
@@ -66,23 +71,181 @@ elif c.os_family == 'Mac':
 elif c.os_family in ('XP', 'Win7'):
     import WinTables as Tables
 
+HAND_QUEUE_SIZE = 500   # hand ids read from stdin but not fetched yet, the reader blocks when full
+
 class Reader(QObject):
-    handRead = pyqtSignal(str)
+    """Puts the hands the importer sends on the queue of the StatFetcher: the
+    HudChannel payloads read from port, or the hand ids written to stdin"""
+
+    def __init__(self, hands, port=None, token=None):
+        QObject.__init__(self)
+        self.hands = hands
+        self.port = port
+        self.token = token
+
+    def read(self):
+        if self.port is not None:
+            try:
+                for payload in HudChannel.read_hands(self.port, self.token):
+                    log.debug(_("Received hand no %s") % payload['hand_id'])
+                    self.hands.put(payload)
+            except socket.error, e:
+                log.error(_("Lost the connection to the importer: %s") % e)
+            self.hands.put("")              # closed connection means quit
+            return
+        self.readStdin()
 
     def readStdin(self):
         while 1:    # wait for a new hand number on stdin
-            time.sleep(0.45) # pause an arbitrary amount of time
-                            # This throttles thru-put to about 2 or 3
-                            # hands per second.  Otherwise, the downstream
-                            # code can become flooded and errors start to
-                            # occur due to stat_dict being overwritten before
-                            # the previous hand completed processing.
-                            # Flooding normally occurs when the hud "fast forwards"
-                            # at tables where a bunch of hands have already been played
-                            # with the HUD switched off.
             new_hand_id = string.rstrip(sys.stdin.readline())
             log.debug(_("Received hand no %s") % new_hand_id)
-            self.handRead.emit(new_hand_id)
+            self.hands.put(new_hand_id)
+            if new_hand_id == "":           # blank line means quit
+                return
+
+class StatFetcher(QObject):
+    """Fetches table info, stats and cards of the queued hands on a db connection
+    of its own and hands them to the gui thread.
+
+    Only the last of the queued hands of a table is fetched, so a HUD that fell
+    behind jumps to the current hand instead of replaying the ones in between.
+    Stats come from a StatStore, which catches up on the skipped hands itself.
+    Every hand gets a new stat_dict, which is not touched after being emitted."""
+    handFetched = pyqtSignal(object)
+
+    def __init__(self, hud_main, hands):
+        QObject.__init__(self)
+        self.hud_main = hud_main
+        self.config = hud_main.config
+        self.hands = hands
+        self.enabled_sites = self.config.get_supported_sites()
+        self.aux_disabled_sites = []
+        for site in self.enabled_sites:
+            if not self.config.get_site_parameters(site)['aux_enabled']:
+                log.info(_("Aux disabled for site %s") % site)
+                self.aux_disabled_sites.append(site)
+        self.screen_names = dict((site, self.config.supported_sites[site].screen_name) for site in self.enabled_sites)
+        self.hero_ids = {}  # site -> player id of the hero, for the heroes in the db
+
+    def fetchStats(self):
+        # the connection has to be got in the thread using it
+        self.db_connection = Database.read_connection(self.config)
+        self.stat_store = StatStore.StatStore(self.db_connection)
+        self.read_hero_ids()
+        while 1:
+            for hand in self.next_hands():
+                if hand is None:
+                    Database.release_read_connection()
+                    self.handFetched.emit(None)
+                    return
+                try:
+                    self.get_stats(hand)
+                except Exception:
+                    log.exception(_("database error: skipping %s") % hand['new_hand_id'])
+                    continue
+                self.handFetched.emit(hand)
+            self.db_connection.rollback() # no snapshot of the db is kept while waiting
+
+    def read_hero_ids(self):
+        """Read the player ids of the heroes of all the enabled sites at once"""
+        found = self.db_connection.get_hero_ids(list(set(self.screen_names.values())))
+        self.hero_ids = dict((site, found[(site, name)]) for (site, name) in self.screen_names.iteritems()
+                             if (site, name) in found)
+
+    def next_hands(self):
+        """Wait for a hand, then take the ones queued after it as well and
+           return the table info of the last hand of each table, None means quit"""
+        new_hands = [self.hands.get()]
+        while 1:
+            try:
+                new_hands.append(self.hands.get_nowait())
+            except Queue.Empty:
+                break
+        (hands, last) = ([], {})
+        for new_hand in new_hands:
+            if new_hand == "":
+                hands.append(None)
+                break
+            hand = self.get_table_info(new_hand)
+            if hand is None:
+                continue
+            last[hand['temp_key']] = len(hands)
+            hands.append(hand)
+        return [hand for (i, hand) in enumerate(hands) if hand is None or last[hand['temp_key']] == i]
+
+    def get_table_info(self, new_hand):
+        """Basic info and cards of the new hand, None if no HUD should be shown for it.
+           new_hand is a hand id, read from the db in one query, or a HudChannel payload"""
+        if isinstance(new_hand, dict):
+            (new_hand_id, payload) = (new_hand['hand_id'], new_hand)
+        else:
+            (new_hand_id, payload) = (new_hand, None)
+        if not self.enabled_sites:
+            log.error(_("No enabled sites found"))
+            return None
+
+#        if there is a db error, complain, skip hand, and proceed
+        try:
+            if payload is not None:     # the importer sent the cards along
+                summary = payload.get('summary')
+                table_info = self.db_connection.table_info(payload['table'])
+                cards = dict((row[0], tuple(row[1:])) for row in payload['cards'])
+                if 'common' in payload:
+                    cards['common'] = tuple(payload['common'])
+                seated = [player[1] for player in summary['players']] if summary else []
+            else:
+                summary = None
+                (table_info, cards, players) = self.db_connection.get_hud_hand(new_hand_id)
+                seated = [name for (seat, player_id, name) in players]
+            (table_name, max, poker_game, type, fast, site_id, site_name, num_seats, tour_number, tab_number) = table_info
+        except Exception:
+            log.error(_("database error: skipping %s") % new_hand_id)
+            return None
+
+        if fast:
+            #we are rush/zoom
+            return None
+
+        # Do nothing if this site is on the ignore list
+        if site_name in self.aux_disabled_sites:
+            return None
+        # Do nothing if this site is not enabled
+        if site_name not in self.enabled_sites:
+            return None
+
+        # A hero seated at a hand is in Players, even when auto importing into an
+        # empty db, so the heroes are only read again when one is seated but not known.
+        hero = self.screen_names[site_name]
+        if site_name not in self.hero_ids and hero in seated:
+            self.read_hero_ids()
+
+        # regenerate temp_key for this hand- this is the tablename (+ tablenumber (if mtt))
+        if type == "tour":   # hand is from a tournament
+            temp_key = "%s Table %s" % (tour_number, tab_number)
+        else:
+            temp_key = table_name
+
+        return {'new_hand_id': new_hand_id, 'table_name': table_name, 'max': max,
+                'poker_game': poker_game, 'type': type, 'site_id': site_id,
+                'site_name': site_name, 'num_seats': num_seats, 'tour_number': tour_number,
+                'tab_number': tab_number, 'temp_key': temp_key, 'hero': hero,
+                'hero_id': self.hero_ids.get(site_name, -1), 'cards': cards, 'summary': summary}
+
+    def get_stats(self, hand):
+        """Add stat_dict to hand, using the params of the table's HUD if it has one"""
+        with self.hud_main.hud_dict_lock:
+            hud = self.hud_main.hud_dict.get(hand['temp_key'])
+            # a copy, the gui thread changes the params from the HUD menu
+            hud_params = dict(hud.hud_params if hud is not None else self.hud_main.hud_params)
+        session = 'S' in (hud_params['stat_range'], hud_params['h_stat_range'])
+        self.db_connection.init_hud_stat_vars(hud_params['hud_days'], hud_params['h_hud_days'], session)
+        hand['stat_dict'] = self.stat_store.get_stats_from_hand(hand['new_hand_id'], hud_params,
+                                                                hand['hero_id'], hand['num_seats'])
+        if self.stat_store.restarted:
+            # the hands skipped are only in the db, read the start hands from there again
+            Stats.start_hands.clear()
+        else:
+            Stats.start_hands.add_hands(self.stat_store.deltas)
 
 class HUD_main(QObject):
     """A main() object to own both the read_stdin thread and the gui."""
@@ -101,21 +264,30 @@ class HUD_main(QObject):
             errorFile = codecs.open(fileName, 'w', 'utf-8')
             sys.stderr = errorFile
             log.info(_("HUD_main starting"))
-        self.db_connection = Database.Database(self.config)
+        self.db_connection = Database.read_connection(self.config)
         #update and save config
         self.hud_dict = {}
+        # changed by the gui thread only, the StatFetcher reads it holding this lock
+        self.hud_dict_lock = thread.allocate_lock()
         self.blacklist = [] #a list of blacklisted table numbers (handles)
         self.hud_params = self.config.get_hud_ui_parameters()
         self.deck = Deck.Deck(self.config,
             deck_type=self.hud_params["deck_type"], card_back=self.hud_params["card_back"],
             width=self.hud_params['card_wd'], height=self.hud_params['card_ht'])
 
-        # a thread to read stdin
+        # a thread to read stdin and one to fetch the stats of the hands read
+        self.hands = Queue.Queue(HAND_QUEUE_SIZE)
+        self.fetchThread = QThread()
+        self.statFetcher = StatFetcher(self, self.hands)
+        self.statFetcher.moveToThread(self.fetchThread)
+        self.statFetcher.handFetched.connect(self.read_stdin)
+        self.fetchThread.started.connect(self.statFetcher.fetchStats)
+        self.fetchThread.start()
+
         self.stdinThread = QThread()
-        self.stdinReader = Reader()
+        self.stdinReader = Reader(self.hands, options.hudport, options.hudtoken)
         self.stdinReader.moveToThread(self.stdinThread)
-        self.stdinReader.handRead.connect(self.read_stdin)
-        self.stdinThread.started.connect(self.stdinReader.readStdin)
+        self.stdinThread.started.connect(self.stdinReader.read)
         self.stdinThread.start()
 
         # a main window
@@ -193,10 +365,12 @@ class HUD_main(QObject):
     def check_tables(self):
         idle_check_tables(self)
 
-    def create_HUD(self, new_hand_id, table, temp_key, max, poker_game, type, stat_dict, cards):
+    def create_HUD(self, new_hand_id, table, temp_key, max, poker_game, type, stat_dict, cards, summary=None):
         """type is "ring" or "tour" used to set hud_params"""
 
-        self.hud_dict[temp_key] = Hud.Hud(self, table, max, poker_game, type, self.config)
+        hud = Hud.Hud(self, table, max, poker_game, type, self.config)
+        with self.hud_dict_lock:
+            self.hud_dict[temp_key] = hud
         self.hud_dict[temp_key].table_name = temp_key
         self.hud_dict[temp_key].stat_dict = stat_dict
         self.hud_dict[temp_key].cards = cards
@@ -208,79 +382,22 @@ class HUD_main(QObject):
         #fixme - passing self.db_connection into another thread
         # is probably pointless.
         [aw.update_data(new_hand_id, self.db_connection) for aw in self.hud_dict[temp_key].aux_windows]
-        idle_create(self, new_hand_id, table, temp_key, max, poker_game, type, stat_dict, cards)
+        idle_create(self, new_hand_id, table, temp_key, max, poker_game, type, stat_dict, cards, summary)
 
-    def update_HUD(self, new_hand_id, table_name, config):
+    def update_HUD(self, new_hand_id, table_name, config, summary=None):
         """Update a HUD gui from inside the non-gui read_stdin thread."""
-        idle_update(self, new_hand_id, table_name, config)
+        idle_update(self, new_hand_id, table_name, config, summary)
 
-    def read_stdin(self, new_hand_id):
-#       get hero's screen names and player ids
-        self.hero, self.hero_ids = {}, {}
-        found = False
-        
-        enabled_sites = self.config.get_supported_sites()
-        if not enabled_sites:
-            log.exception(_("No enabled sites found"))
-            self.db_connection.connection.rollback()
-            self.destroy()
-            return
-        
-        aux_disabled_sites = []
-        for i in enabled_sites:
-            if not c.get_site_parameters(i)['aux_enabled']:
-                log.info(_("Aux disabled for site %s") % i)
-                aux_disabled_sites.append(i)
-
-        self.db_connection.connection.rollback() # release lock from previous iteration
-        if new_hand_id == "":           # blank line means quit
-            self.db_connection.connection.rollback()
+    def read_stdin(self, hand):
+        """Show the stats of a hand fetched by the StatFetcher, None means quit"""
+        self.db_connection.rollback() # release lock from previous iteration
+        if hand is None:
             sys.exit()
 
-#    The following block cannot be hoisted outside the while loop, because it would
-#    cause a problem when auto importing into an empty db.
-#    FIXME (corner-case): Because this block only executes once when the hud starts,
-#    if our hero plays at another site for the __first_time__ during that session,
-#     the hud won't display correctly, because the heroname isn't known yet.
-
-        if not found:
-            for site in enabled_sites:
-                result = self.db_connection.get_site_id(site)
-                if result:
-                    site_id = result[0][0]
-                    self.hero[site_id] = self.config.supported_sites[site].screen_name
-                    self.hero_ids[site_id] = self.db_connection.get_player_id(self.config, site, self.hero[site_id])
-                    if self.hero_ids[site_id] is not None:
-                        found = True
-                    else:
-                        self.hero_ids[site_id] = -1
-
-#        get basic info about the new hand from the db
-#        if there is a db error, complain, skip hand, and proceed
-        #log.info("HUD_main.read_stdin: " + _("Hand processing starting."))
-        try:
-            (table_name, max, poker_game, type, fast, site_id, site_name, num_seats, tour_number, tab_number) = \
-                            self.db_connection.get_table_info(new_hand_id)
-        except Exception:
-            log.error(_("database error: skipping %s") % new_hand_id)
-            return
-
-        if fast:
-            #we are rush/zoom
-            return
-
-        # Do nothing if this site is on the ignore list
-        if site_name in aux_disabled_sites:
-            return
-        # Do nothing if this site is not enabled
-        if site_name not in enabled_sites:
-            return
-
-        # regenerate temp_key for this hand- this is the tablename (+ tablenumber (if mtt))
-        if type == "tour":   # hand is from a tournament
-            temp_key = "%s Table %s" % (tour_number, tab_number)
-        else:
-            temp_key = table_name
+        new_hand_id = hand['new_hand_id']
+        (table_name, max, poker_game, type, site_name, tour_number, tab_number, temp_key, stat_dict, cards) = \
+            (hand['table_name'], hand['max'], hand['poker_game'], hand['type'], hand['site_name'],
+             hand['tour_number'], hand['tab_number'], hand['temp_key'], hand['stat_dict'], hand['cards'])
 
         if type == "tour":
             #
@@ -336,13 +453,7 @@ class HUD_main(QObject):
 
 #        Update an existing HUD
         if temp_key in self.hud_dict:
-            # get stats using hud's specific params and get cards
-            self.db_connection.init_hud_stat_vars( self.hud_dict[temp_key].hud_params['hud_days']
-                                                 , self.hud_dict[temp_key].hud_params['h_hud_days'])
-            #print "update an existing hud ", temp_key, self.hud_dict[temp_key].hud_params
-            stat_dict = self.db_connection.get_stats_from_hand(new_hand_id, type, self.hud_dict[temp_key].hud_params,
-                                                               self.hero_ids[site_id], num_seats)
-
+            # stats were fetched using hud's specific params
             try:
                 self.hud_dict[temp_key].stat_dict = stat_dict
             except KeyError:    # HUD instance has been killed off, key is stale
@@ -350,34 +461,27 @@ class HUD_main(QObject):
                 log.error(_('will not send hand'))
                 return
 
-            self.hud_dict[temp_key].cards = self.get_cards(new_hand_id, poker_game)
+            self.hud_dict[temp_key].cards = cards
             #fixme - passing self.db_connection into another thread
             # is probably pointless
             [aw.update_data(new_hand_id, self.db_connection) for aw in self.hud_dict[temp_key].aux_windows]
-            self.update_HUD(new_hand_id, temp_key, self.config)
+            self.update_HUD(new_hand_id, temp_key, self.config, hand['summary'])
 
 #        Or create a new HUD
         else:
-            # get stats using default params--also get cards
-
-            self.db_connection.init_hud_stat_vars( self.hud_params['hud_days'], self.hud_params['h_hud_days'] )
-            stat_dict = self.db_connection.get_stats_from_hand(new_hand_id, type, self.hud_params,
-                                                               self.hero_ids[site_id], num_seats)
-
             #Confirm our hero is seated for this hand, otherwise we must __not__ create a hud
             # because it is impossible to work out who is sitting where, and that working-out
             # of seat positions __only__ happens during creation.  (see Aux_Base.Aux_Seats.adj_seats())
             #Fixes issue with 888/pacific which includes cash hands before the hero is dealt-in
             hero_found = False
             for key in stat_dict:
-                if stat_dict[key]['screen_name'] == self.hero[site_id]:
+                if stat_dict[key]['screen_name'] == hand['hero']:
                     hero_found = True
                     break
             if not hero_found:
                 log.info(_('hud not created yet, because hero is not seated for this hand'))
                 return
                 
-            cards = self.get_cards(new_hand_id, poker_game)
             table_kwargs = dict(table_name=table_name, tournament=tour_number, table_number=tab_number)
             tablewindow = Tables.Table(self.config, site_name, **table_kwargs)
             if tablewindow.number is None:
@@ -394,17 +498,10 @@ class HUD_main(QObject):
                 tablewindow.site = site_name
                 # Test that the table window still exists
                 if hasattr(tablewindow, 'number'):
-                    self.create_HUD(new_hand_id, tablewindow, temp_key, max, poker_game, type, stat_dict, cards)
+                    self.create_HUD(new_hand_id, tablewindow, temp_key, max, poker_game, type, stat_dict, cards, hand['summary'])
                 else:
                     log.error(_('Table "%s" no longer exists') % table_name)
                     return
-
-    def get_cards(self, new_hand_id, poker_game):
-        cards = self.db_connection.get_cards(new_hand_id)
-        if poker_game in ['holdem','omahahi','omahahilo']:
-            comm_cards = self.db_connection.get_common_cards(new_hand_id)
-            cards['common'] = comm_cards['common']
-        return cards
 ######################################################################
 #   idle FUNCTIONS
 #
@@ -436,12 +533,13 @@ def idle_kill(hud_main, table):
             hud_main.hud_dict[table].tablehudlabel.setParent(None)
 #            hud_main.hud_dict[table].main_window.destroy()
             hud_main.hud_dict[table].kill()
-            del(hud_main.hud_dict[table])
+            with hud_main.hud_dict_lock:
+                del(hud_main.hud_dict[table])
         hud_main.main_window.resize(1, 1)
     except:
         log.exception(_("Error killing HUD for table: %s.") % table.title)
 
-def idle_create(hud_main, new_hand_id, table, temp_key, max, poker_game, type, stat_dict, cards):
+def idle_create(hud_main, new_hand_id, table, temp_key, max, poker_game, type, stat_dict, cards, summary=None):
 
     try:
         newlabel = QLabel("%s - %s" % (table.site, temp_key))
@@ -450,7 +548,7 @@ def idle_create(hud_main, new_hand_id, table, temp_key, max, poker_game, type, s
         hud_main.hud_dict[temp_key].tablehudlabel = newlabel
         hud_main.hud_dict[temp_key].tablenumber = table.number
         # call the hud.create method, apparently
-        hud_main.hud_dict[temp_key].create(new_hand_id, hud_main.config, stat_dict)
+        hud_main.hud_dict[temp_key].create(new_hand_id, hud_main.config, stat_dict, summary)
         for m in hud_main.hud_dict[temp_key].aux_windows:
             m.create() # create method of aux_window class (generally Mucked.aux_seats.create)
             m.update_gui(new_hand_id)
@@ -459,9 +557,9 @@ def idle_create(hud_main, new_hand_id, table, temp_key, max, poker_game, type, s
     except:
         log.exception(_("Error creating HUD for hand %s.") % new_hand_id)
 
-def idle_update(hud_main, new_hand_id, table_name, config):
+def idle_update(hud_main, new_hand_id, table_name, config, summary=None):
     try:
-        hud_main.hud_dict[table_name].update(new_hand_id, config)
+        hud_main.hud_dict[table_name].update(new_hand_id, config, summary)
         [aw.update_gui(new_hand_id) for aw in hud_main.hud_dict[table_name].aux_windows]
     except:
         log.exception(_("Error updating HUD for hand %s.") % new_hand_id)
@@ -289,6 +289,13 @@ class Hand(object):
             self.tourneyTypeId = db.getSqlTourneyTypeIDs(self)
             self.tourneyId = db.getSqlTourneyIDs(self)
             self.tourneysPlayersIds = db.getSqlTourneysPlayersIDs(self)
+        if getattr(self, 'hands', None) is not None:
+            # Hand was assembled before the db ids were known (parallel bulk import)
+            self.hands['tourneyId'] = self.tourneyId
+            if self.gametype['type'] == 'tour':
+                for name, player_stats in self.handsplayers.iteritems():
+                    player_stats['tourneyTypeId'] = self.tourneyTypeId
+                    player_stats['tourneysPlayersId'] = self.tourneysPlayersIds.get(name)
         
     def assembleHand(self):
         self.stats.getStats(self)
@@ -298,6 +305,14 @@ class Hand(object):
         self.handsstove = self.stats.getHandsStove()
         self.handspots = self.stats.getHandsPots()
 
+    def getHeroSeat(self):
+        """Seat of the hero as stored in Hands.heroSeat, 0 if the hero didn't play"""
+        heroSeat = 0
+        for player in self.players:
+            if self.hero==player[1]:
+                heroSeat = player[0]
+        return heroSeat
+
     def getHandId(self, db, id):
         if db.isDuplicate(self.siteId, self.hands['siteHandNo'], self.hands['heroSeat'], self.publicDB):
             #log.debug(_("Hand.insert(): hid #: %s is a duplicate") % self.hands['siteHandNo'])
@@ -327,6 +342,7 @@ class Hand(object):
             self.handspots.sort(key=lambda x: x[1])
             for ht in self.handspots: 
                 ht[0] = self.dbid_hands
+                ht[4] = self.dbid_pids.get(ht[4], ht[4])
         db.storeHandsPots(self.handspots, doinsert)
     
     def insertHandsActions(self, db, doinsert = False, printtest = False):
@@ -337,7 +353,9 @@ class Hand(object):
     def insertHandsStove(self, db, doinsert = False):
         """ Function to inserts HandsStove into database"""
         if self.handsstove:
-            for hs in self.handsstove: hs[0] = self.dbid_hands
+            for hs in self.handsstove:
+                hs[0] = self.dbid_hands
+                hs[1] = self.dbid_pids.get(hs[1], hs[1])
         db.storeHandsStove(self.handsstove, doinsert)
         
     def updateTourneyResults(self, db):
@@ -372,19 +390,21 @@ class Hand(object):
     def select(self, db, handId):
         """ Function to create Hand object from database """
         c = db.get_cursor()
-        q = db.sql.query['playerHand']
-        q = q.replace('%s', db.sql.query['placeholder'])
+        players = select_rows(db, c, 'playerHand', [handId])
+        res = select_rows(db, c, 'singleHand', [handId])[0]
+        boards = []
+        if res['runittwice']:
+            boards = select_rows(db, c, 'singleHandBoards', [handId])
+        actions = select_rows(db, c, 'handActions', [handId])
+        self.select_from_rows(players, res, boards, actions)
 
-        c.execute("select heroseat from Hands where id = {}".format(handId))
-        heroSeat = c.fetchone()[0]
+    def select_from_rows(self, players, res, boards, actions):
+        """ Fills the Hand from its rows of the playerHand, singleHand, singleHandBoards and
+            handActions queries, or of their manyHands equivalents """
+        heroSeat = res['heroseat']
 
         # PlayerStacks
-        c.execute(q, (handId,))
-        # See NOTE: below on what this does.
-
-        # Discripter must be set to lowercase as postgres returns all descriptors lower case and SQLight returns them as they are
-        res = [dict(line) for line in [zip([ column[0].lower() for column in c.description], row) for row in c.fetchall()]]
-        for row in res:
+        for row in players:
             self.addPlayer(row['seatno'],row['name'],str(row['chips']), str(row['position']))
             cardlist = []
             cardlist.append(Card.valueSuitFromCard(row['card1']))
@@ -438,22 +458,6 @@ class Hand(object):
 
 
         # HandInfo
-        q = db.sql.query['singleHand']
-        q = q.replace('%s', db.sql.query['placeholder'])
-        c.execute(q, (handId,))
-
-        # NOTE: This relies on row_factory = sqlite3.Row (set in connect() params)
-        #       Need to find MySQL and Postgres equivalents
-        #       MySQL maybe: cursorclass=MySQLdb.cursors.DictCursor
-        #res = c.fetchone()
-
-        # Using row_factory is global, and affects the rest of fpdb. The following 2 line achieves
-        # a similar result
-
-        # Discripter must be set to lowercase as supported dbs differ on what is returned.
-        res = [dict(line) for line in [zip([ column[0].lower() for column in c.description], row) for row in c.fetchall()]]
-        res = res[0]
-
         self.tablename = res['tablename']
         self.handid    = res['sitehandno']
         # FIXME: Need to figure out why some times come out of the DB as %Y-%m-%d %H:%M:%S+00:00,
@@ -477,11 +481,7 @@ class Hand(object):
             self.setCommunityCards('RIVER', [cards[4]])
 
         if res['runittwice']:
-            # Get runItTwice boards
-            q = db.sql.query['singleHandBoards']
-            q = q.replace('%s', db.sql.query['placeholder'])
-            c.execute(q, (handId,))
-            boards = [dict(line) for line in [zip([ column[0].lower() for column in c.description], row) for row in c.fetchall()]]
+            # runItTwice boards
             for b in boards:
                 cards = map(Card.valueSuitFromCard, [b['boardcard1'], b['boardcard2'], b['boardcard3'], b['boardcard4'], b['boardcard5']])
                 if cards[0]:
@@ -512,13 +512,7 @@ class Hand(object):
         # street3Pot | street4Pot | showdownPot | comment | commentTs | texture
 
         # Actions
-        q = db.sql.query['handActions']
-        q = q.replace('%s', db.sql.query['placeholder'])
-        c.execute(q, (handId,))
-        
-        # Discripter must be set to lowercase as supported dbs differ on what is returned.
-        res = [dict(line) for line in [zip([ column[0].lower() for column in c.description], row) for row in c.fetchall()]]
-        for row in res:
+        for row in actions:
             name = row['name']
             street = row['street']
             act = row['actionid']
@@ -1885,7 +1879,14 @@ def hand_factory(hand_id, config, db_connection):
     # and to return a populated class instance of the correct hand
     
     gameinfo = db_connection.get_gameinfo_from_hid(hand_id)
+    hand_instance = new_hand(hand_id, config, gameinfo)
+    hand_instance.select(db_connection, hand_id)
+    hand_instance.handid_selected = hand_id #hand_instance does not supply this, create it here
+    
+    return hand_instance
 
+def new_hand(hand_id, config, gameinfo):
+    """ An empty Hand of the class for the base of gameinfo, to be filled from the db """
     if gameinfo['base'] == 'hold':
         hand_instance = HoldemOmahaHand(config=config, hhc=None, sitename=gameinfo['sitename'],
          gametype = gameinfo, handText=None, builtFrom = "DB", handid=hand_id)
@@ -1895,10 +1896,52 @@ def hand_factory(hand_id, config, db_connection):
     elif gameinfo['base'] == 'draw':
         hand_instance = DrawHand(config=config, hhc=None, sitename=gameinfo['sitename'],
          gametype = gameinfo, handText=None, builtFrom = "DB", handid=hand_id)
-
-    hand_instance.select(db_connection, hand_id)
-    hand_instance.handid_selected = hand_id #hand_instance does not supply this, create it here
-    
     return hand_instance
 
-
+def select_rows(db, c, query, args, handIds=None):
+    """ The rows of query as dicts keyed by lowercase column names, postgres returns them
+        lowercase and sqlite as they are. <handIds> in query is replaced by a placeholder
+        per hand of handIds, which go after args """
+    q = db.sql.query[query]
+    if handIds is not None:
+        q = q.replace('<handIds>', ','.join(['%s'] * len(handIds)))
+        args = list(args) + list(handIds)
+    q = q.replace('%s', db.sql.query['placeholder'])
+    c.execute(q, args)
+    names = [column[0].lower() for column in c.description]
+    return [dict(zip(names, row)) for row in c.fetchall()]
+
+def select_many(db, hand_ids, config, chunk_size=500):
+    """ hand_factory for a list of hands, {hand id: Hand}. Reads the hands chunk_size at a
+        time with a query per table for the whole chunk, instead of a handful per hand.
+        Hands missing from the db are left out """
+    hands = {}
+    hand_ids = list(hand_ids)
+    c = db.get_cursor()
+    for i in xrange(0, len(hand_ids), chunk_size):    # sqlite allows 999 parameters
+        chunk = hand_ids[i:i+chunk_size]
+        gameinfos = {}
+        for row in select_rows(db, c, 'manyHandsGameinfo', [], chunk):
+            # the gameinfo of get_gameinfo_from_hid
+            gameinfo = dict((key, row[key.lower()]) for key in ('sitename', 'category', 'base', 'type', 'limitType',
+                            'hilo', 'sb', 'bb', 'sbet', 'bbet', 'currency', 'gametypeId'))
+            gameinfos[row['id']] = gameinfo
+        infos = dict((row['id'], row) for row in select_rows(db, c, 'manyHands', [], chunk))
+        players, boards, actions = {}, {}, {}
+        for row in select_rows(db, c, 'manyPlayerHands', [], chunk):
+            players.setdefault(row['handid'], []).append(row)
+        runittwice = [hid for (hid, info) in infos.iteritems() if info['runittwice']]
+        if runittwice:
+            for row in select_rows(db, c, 'manyHandsBoards', [], runittwice):
+                boards.setdefault(row['handid'], []).append(row)
+        for row in select_rows(db, c, 'manyHandActions', [], chunk):
+            actions.setdefault(row['handid'], []).append(row)
+        for hand_id in chunk:
+            if hand_id not in gameinfos or hand_id not in infos:
+                continue
+            hand_instance = new_hand(hand_id, config, gameinfos[hand_id])
+            hand_instance.select_from_rows(players.get(hand_id, []), infos[hand_id],
+                                           boards.get(hand_id, []), actions.get(hand_id, []))
+            hand_instance.handid_selected = hand_id
+            hands[hand_id] = hand_instance
+    return hands
@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""A poker hand evaluator for when pypoker-eval is not installed.
+
+PokerEval has the methods of pypoker-eval's PokerEval that fpdb uses: best,
+winners, poker_eval, card2string and string2card, for the games of Card.games.
+Hand values are pypoker-eval's: the hand type << 24, then the ranks that count
+four bits each, best first. Low values are lower for better hands.
+
+The hi value of 5 to 7 cards without a flush is looked up by the sum of a weight
+per card rank, the weights being such that no two sets of ranks have the same
+sum, the flushes by the 13 bit mask of the ranks in the suit. The table of a
+number of cards is made the first time a hand of that many cards is valued.
+poker_eval deals and evaluates all the boards at once with NumPy when it is
+installed, one board at a time otherwise."""
+
+import L10n
+_ = L10n.get_translation()
+
+import random
+from itertools import combinations
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RANKS = '23456789TJQKA'
+SUITS = 'hdcs'
+NOCARD = 255
+
+NOPAIR, ONEPAIR, TWOPAIR, TRIPS, STRAIGHT, FLUSH, FLHOUSE, QUADS, STFLUSH = range(9)
+TYPE_NAMES = ('NoPair', 'OnePair', 'TwoPair', 'Trips', 'Straight', 'Flush', 'FlHouse', 'Quads', 'StFlush')
+LOW_NOTHING = (STFLUSH + 1) << 24   # worse than any low
+
+# poker_eval samples at most this many boards, and deals them all when there are no more
+MAX_ITERATIONS = 5000
+
+# no two sets of up to 7 ranks, at most 4 of each, have the same sum of weights
+WEIGHTS = (0, 1, 5, 22, 98, 453, 2031, 8698, 22854, 83661, 262349, 636345, 1479181)
+# the same for 5 ranks, keeping the NumPy table of 5 cards small
+WEIGHTS5 = (0, 1, 5, 22, 94, 312, 992, 2422, 5624, 12522, 19998, 43258, 79415)
+
+# game: (omaha rules, hi pot, low pot) where low is 'low8', 'a5' or '27'
+GAMES = {
+    'holdem'    : (False, True, None),
+    'omaha'     : (True, True, None),
+    'omaha8'    : (True, True, 'low8'),
+    '7stud'     : (False, True, None),
+    '7stud8'    : (False, True, 'low8'),
+    'lowball'   : (False, False, 'a5'),
+    'lowball27' : (False, False, '27'),
+}
+
+
+def _pack(hand_type, ranks):
+    value = hand_type << 24
+    for (i, rank) in enumerate(ranks[:5]):
+        value |= rank << (16 - 4 * i)
+    return value
+
+def _straight_top(mask, wheel=True):
+    """Top rank of the best straight in the rank mask, -1 if there is none"""
+    for top in range(12, 3, -1):
+        if mask >> (top - 4) & 0x1f == 0x1f:
+            return top
+    if wheel and mask & 0x100f == 0x100f:
+        return 3
+    return -1
+
+def _count_value(counts, straights=True, wheel=True):
+    """Hi value of the best 5 of the cards with these counts per rank, flushes aside"""
+    by_count = ([], [], [], [], [])
+    mask = 0
+    for rank in range(12, -1, -1):
+        if counts[rank]:
+            by_count[counts[rank]].append(rank)
+            mask |= 1 << rank
+    (singles, pairs, trips, quads) = by_count[1:]
+    if quads:
+        return _pack(QUADS, [quads[0], max(pairs[:1] + trips[:1] + singles[:1] + quads[1:2])])
+    if trips and (len(trips) > 1 or pairs):
+        return _pack(FLHOUSE, [trips[0], max(trips[1:2] + pairs[:1])])
+    top = _straight_top(mask, wheel) if straights else -1
+    if top >= 0:
+        return _pack(STRAIGHT, [top])
+    if trips:
+        return _pack(TRIPS, trips + singles[:2])
+    if len(pairs) > 1:
+        return _pack(TWOPAIR, pairs[:2] + [max(pairs[2:3] + singles[:1])])
+    if pairs:
+        return _pack(ONEPAIR, pairs + singles[:3])
+    return _pack(NOPAIR, singles[:5])
+
+def _flush_value(mask):
+    top = _straight_top(mask)
+    if top >= 0:
+        return _pack(STFLUSH, [top])
+    return _pack(FLUSH, [rank for rank in range(12, -1, -1) if mask >> rank & 1][:5])
+
+def _low8_value(mask):
+    """8 or better low of the ace low ranks in mask (ace 0 to eight 7), LOW_NOTHING if there is none"""
+    ranks = [rank for rank in range(8) if mask >> rank & 1][:5]
+    if len(ranks) < 5:
+        return LOW_NOTHING
+    return _pack(NOPAIR, ranks[::-1])
+
+def _count_sets(cards):
+    """The counts per rank of all the sets of cards cards, at most 4 of a rank"""
+    def count(rank, left):
+        if rank < 0:
+            if not left:
+                yield []
+            return
+        for n in range(min(4, left) + 1):
+            for rest in count(rank - 1, left - n):
+                yield rest + [n]
+    return count(12, cards)
+
+
+class _Tables:
+    """The lookup tables, made the first time they are needed"""
+
+    def __init__(self):
+        self.flush = [_flush_value(mask) for mask in range(1 << 13)]
+        self.low8 = [_low8_value(mask) for mask in range(1 << 8)]
+        self.nonflush = {}      # number of cards -> {sum of WEIGHTS: value}
+        (self.arrays, self.classes) = (None, None)
+
+    def nonflush_table(self, cards):
+        """{sum of WEIGHTS: value} of the hands of cards cards, 7 taking a second or two to make"""
+        if cards not in self.nonflush:
+            table = {}
+            for counts in _count_sets(cards):
+                table[sum(n * w for (n, w) in zip(counts, WEIGHTS))] = _count_value(counts)
+            self.nonflush[cards] = table
+        return self.nonflush[cards]
+
+    def numpy_arrays(self, cards = 5):
+        """The tables as NumPy arrays of hand classes, numbers ordered as the hi values,
+           with the array of the hands of cards cards, 5 or 7"""
+        if self.arrays is None:
+            # the best 5 of more cards is a hand of 5, so these are all the values
+            values = sorted(set(self.flush) | set(self.nonflush_table(5).itervalues()))
+            self.classes = dict((value, i) for (i, value) in enumerate(values))
+            arrays = {'values': numpy.array(values, numpy.int32),
+                      'flush': numpy.array([self.classes[v] for v in self.flush], numpy.uint16),
+                      'low8': numpy.array(self.low8, numpy.int32),
+                      'weights': numpy.array(WEIGHTS, numpy.int32),
+                      'weights5': numpy.array(WEIGHTS5, numpy.int32)}
+            arrays[5] = numpy.zeros(4 * WEIGHTS5[12] + WEIGHTS5[11] + 1, numpy.uint16)
+            for counts in _count_sets(5):
+                arrays[5][sum(n * w for (n, w) in zip(counts, WEIGHTS5))] = self.classes[_count_value(counts)]
+            self.arrays = arrays
+        if cards not in self.arrays:
+            table = self.nonflush_table(cards)
+            array = numpy.zeros(max(table) + 1, numpy.uint16)
+            array[table.keys()] = [self.classes[v] for v in table.values()]
+            self.arrays[cards] = array
+        return self.arrays
+
+_tables = None
+
+def tables():
+    global _tables
+    if _tables is None:
+        _tables = _Tables()
+    return _tables
+
+
+def hi_value(cards):
+    """Hi value of the best 5 of 5 or more cards"""
+    if len(cards) > 7:
+        return max(hi_value(list(c)) for c in combinations(cards, 7))
+    t = tables()
+    (key, suits) = (0, [0, 0, 0, 0])
+    for card in cards:
+        key += WEIGHTS[card >> 2]
+        suits[card & 3] |= 1 << (card >> 2)
+    value = t.nonflush_table(len(cards))[key]
+    for mask in suits:
+        if mask and bin(mask).count('1') >= 5:
+            return t.flush[mask]     # a flush beats whatever else 7 cards can make
+    return value
+
+def low8_value(cards):
+    """8 or better value of the best 5 of the cards, LOW_NOTHING if there is none"""
+    mask = 0
+    for card in cards:
+        mask |= 1 << ((card >> 2) + 1) % 13
+    return tables().low8[mask & 0xff]
+
+def a5_value(cards):
+    """Ace to five lowball value of the best 5 of the cards, straights and flushes do not count"""
+    if len(cards) > 5:
+        return min(a5_value(list(c)) for c in combinations(cards, 5))
+    counts = [0] * 13
+    for card in cards:
+        counts[((card >> 2) + 1) % 13] += 1
+    return _count_value(counts, straights=False)
+
+def deuce_value(cards):
+    """Deuce to seven lowball value of 5 cards, the hi value with the ace always high"""
+    counts = [0] * 13
+    for card in cards:
+        counts[card >> 2] += 1
+    if len(set(card & 3 for card in cards)) > 1:
+        return _count_value(counts, wheel=False)
+    top = _straight_top(sum(1 << r for r in range(13) if counts[r]), wheel=False)
+    if top >= 0:
+        return _pack(STFLUSH, [top])
+    return _pack(FLUSH, [r for r in range(12, -1, -1) if counts[r]])
+
+def omaha_hi_value(pocket, board):
+    return max(hi_value(list(hole) + list(common))
+               for hole in combinations(pocket, 2) for common in combinations(board, 3))
+
+def omaha_low8_value(pocket, board):
+    return min(low8_value(list(hole) + list(common))
+               for hole in combinations(pocket, 2) for common in combinations(board, 3))
+
+
+class PokerEval:
+    """The part of pypoker-eval's PokerEval fpdb uses"""
+
+    def string2card(self, cards):
+        """Card number of a card string like 'Ah', or a list of them, '__' is NOCARD"""
+        if isinstance(cards, (list, tuple)):
+            return [self.string2card(card) for card in cards]
+        if not isinstance(cards, basestring):
+            return cards
+        if cards == '__':
+            return NOCARD
+        return RANKS.index(cards[0].upper()) * 4 + SUITS.index(cards[1].lower())
+
+    def card2string(self, cards):
+        if isinstance(cards, (list, tuple)):
+            return [self.card2string(card) for card in cards]
+        if cards == NOCARD:
+            return '__'
+        return RANKS[cards >> 2] + SUITS[cards & 3]
+
+    def best(self, side, hand, board = []):
+        """(value, [type name, best five cards]) of hand, of 2 cards of hand and 3 of
+           board if board is given. side is 'hi' or 'low', 8 or better.
+           False with less than 5 cards"""
+        hand = self.string2card(list(hand))
+        board = self.string2card(list(board))
+        if len(hand) + len(board) < 5:
+            return False
+        if board:
+            fives = [list(h) + list(b) for h in combinations(hand, 2) for b in combinations(board, 3)]
+        else:
+            fives = [list(c) for c in combinations(hand, 5)]
+        if side == 'hi':
+            (value, cards) = max((hi_value(cards), cards) for cards in fives)
+            return (value, [TYPE_NAMES[value >> 24]] + self._order(cards, value, False))
+        (value, cards) = min((low8_value(cards), cards) for cards in fives)
+        if value == LOW_NOTHING:
+            return (value, ['Nothing'])
+        return (value, ['NoPair'] + self._order(cards, value, True))
+
+    def _order(self, cards, value, low):
+        """cards in the order of the ranks of value"""
+        rank_of = (lambda card: ((card >> 2) + 1) % 13) if low else (lambda card: card >> 2)
+        hand_type = value >> 24
+        if hand_type in (STRAIGHT, STFLUSH, FLUSH, NOPAIR):
+            order = sorted(cards, key=rank_of, reverse=True)
+            if hand_type in (STRAIGHT, STFLUSH) and value >> 16 & 0xf == 3:
+                order = order[1:] + order[:1]   # wheel, the ace is low
+            return order
+        counts = {}
+        for card in cards:
+            counts[rank_of(card)] = counts.get(rank_of(card), 0) + 1
+        return sorted(cards, key=lambda card: (counts[rank_of(card)], rank_of(card)), reverse=True)
+
+    def winners(self, game, pockets, board = [], dead = [], fill_pockets = 0):
+        """{'hi': [indexes of the pockets winning the hi], 'low': [... the low]} of a
+           completely dealt hand, pockets with unknown cards are left out. A side
+           without a winner is left out"""
+        pockets = [self.string2card(list(pocket)) for pocket in pockets]
+        index = [i for (i, pocket) in enumerate(pockets) if fill_pockets or NOCARD not in pocket]
+        result = self.poker_eval(game, [pockets[i] for i in index], board, dead, iterations = 0)
+        (omaha, hipot, lowpot) = GAMES[game]
+        winners = {'hi': [], 'low': []}
+        for (i, e) in zip(index, result['eval']):
+            if e['winhi'] or e['tiehi']:
+                winners['hi'].append(i)
+            if e['winlo'] or e['tielo']:
+                winners['low'].append(i)
+        if not lowpot or not winners['low']:
+            del winners['low']
+        if not hipot:
+            del winners['hi']
+        return winners
+
+    def poker_eval(self, game, pockets, board = [], dead = [], iterations = 0, fill_pockets = 0):
+        """Deal the unknown ('__') cards of pockets and board, on every possible deal
+           or on iterations random ones, and count the outcomes like pypoker-eval:
+           {'info': (deals, has a low pot, has a hi pot), 'eval': [{'scoop', 'winhi',
+           'losehi', 'tiehi', 'winlo', 'loselo', 'tielo', 'ev'} of each pocket]}, ev
+           being the share of the pot won in per mille"""
+        (omaha, hipot, lowpot) = GAMES[game]
+        pockets = [self.string2card(list(pocket)) for pocket in pockets]
+        board = self.string2card(list(board))
+        known = set(c for c in sum(pockets, []) + board + self.string2card(list(dead)) if c != NOCARD)
+        deck = [c for c in range(52) if c not in known]
+        places = [cards.count(NOCARD) for cards in pockets + [board]]
+        iterations = min(iterations, MAX_ITERATIONS)
+        if iterations > 0 and self._deal_count(len(deck), places) <= MAX_ITERATIONS:
+            iterations = 0      # as quick to deal them all, and exact
+        deals = self._deals(deck, places, iterations)
+        if numpy is not None and hipot and len(deals) > 1:     # one deal is quicker without
+            (deals, hi, low) = self._evaluate_numpy(game, pockets, board, deals)
+            counts = self._outcomes_numpy(deals, hi, low)
+        else:
+            (deals, hi, low) = self._evaluate(game, pockets, board, deals)
+            counts = self._outcomes(deals, hi, low)
+        results = []
+        for (scoop, winhi, tiehi, winlo, tielo, ev) in counts:
+            results.append({'scoop': scoop, 'winhi': winhi, 'losehi': deals - winhi - tiehi if hipot else 0,
+                            'tiehi': tiehi, 'winlo': winlo, 'tielo': tielo,
+                            'loselo': deals - winlo - tielo if lowpot else 0, 'ev': int(ev * 1000 / deals)})
+        return {'info': (deals, int(lowpot is not None), int(hipot)), 'eval': results}
+
+    def _deal_count(self, cards, places):
+        """Number of possible deals of cards cards to the places"""
+        count = 1
+        for place in places:
+            for n in range(place):
+                count = count * (cards - n) / (n + 1)
+            cards -= place
+        return count
+
+    def _deals(self, deck, places, iterations):
+        """The cards dealt to the unknown cards, places being their number in each
+           pocket and the board: every possible deal of the deck, or iterations random
+           ones. A deal has the cards of the places one after the other"""
+        unknown = sum(places)
+        if not unknown:
+            return [()]
+        if iterations > 0:
+            if numpy is not None:
+                order = numpy.random.random((iterations, len(deck))).argsort(axis=1)
+                return numpy.array(deck)[order[:, :unknown]]
+            return [random.sample(deck, unknown) for i in xrange(iterations)]
+        deals = [()]
+        for place in places:
+            if place:
+                deals = [deal + cards for deal in deals
+                         for cards in combinations([c for c in deck if c not in deal], place)]
+        return deals
+
+    def _place(self, cards, dealt, at):
+        """cards with their unknown cards replaced by dealt from index at"""
+        placed = []
+        for card in cards:
+            if card == NOCARD:
+                card = dealt[at]
+                at += 1
+            placed.append(card)
+        return (placed, at)
+
+    def _evaluate(self, game, pockets, board, deals):
+        """(number of deals, hi values, low values), values per deal per pocket"""
+        (omaha, hipot, lowpot) = GAMES[game]
+        (hi, low) = ([], [])
+        for dealt in deals:
+            (hands, at) = ([], 0)
+            for pocket in pockets:
+                (cards, at) = self._place(pocket, dealt, at)
+                hands.append(cards)
+            (common, at) = self._place(board, dealt, at)
+            if omaha:
+                hi.append([omaha_hi_value(cards, common) for cards in hands])
+            elif hipot:
+                hi.append([hi_value(cards + common) for cards in hands])
+            if lowpot == 'low8':
+                low.append([omaha_low8_value(cards, common) if omaha else low8_value(cards + common) for cards in hands])
+            elif lowpot == 'a5':
+                low.append([a5_value(cards + common) for cards in hands])
+            elif lowpot == '27':
+                low.append([deuce_value(cards + common) for cards in hands])
+        return (len(deals), hi, low)
+
+    def _outcomes(self, deals, hi, low):
+        """[scoop, winhi, tiehi, winlo, tielo, pots won] of each pocket"""
+        counts = [[0, 0, 0, 0, 0, 0] for i in range(len((hi or low)[0]))]
+        for n in range(deals):
+            (hi_win, low_win) = ([], [])
+            if hi:
+                best = max(hi[n])
+                hi_win = [i for (i, v) in enumerate(hi[n]) if v == best]
+            if low:
+                best = min(low[n])
+                if best != LOW_NOTHING:
+                    low_win = [i for (i, v) in enumerate(low[n]) if v == best]
+            share = 1.0 / (bool(hi_win) + bool(low_win))
+            for i in hi_win:
+                counts[i][1 if len(hi_win) == 1 else 2] += 1
+                counts[i][5] += share / len(hi_win)
+            for i in low_win:
+                counts[i][3 if len(low_win) == 1 else 4] += 1
+                counts[i][5] += share / len(low_win)
+            if len(set(hi_win + low_win)) == 1 and len(hi_win) <= 1 and len(low_win) <= 1:
+                counts[(hi_win + low_win)[0]][0] += 1
+        return counts
+
+    def _evaluate_numpy(self, game, pockets, board, deals):
+        """_evaluate for all deals at once, the values being hand classes for the hi"""
+        (omaha, hipot, lowpot) = GAMES[game]
+        dealt = numpy.asarray(deals, numpy.int32).reshape(len(deals), len(deals[0]))
+        (hands, at) = ([], 0)
+        for cards in pockets + [board]:
+            columns = []
+            for card in cards:
+                if card == NOCARD:
+                    columns.append(dealt[:, at])
+                    at += 1
+                else:
+                    columns.append(numpy.full(len(deals), card, numpy.int32))
+            hands.append(numpy.column_stack(columns) if columns else numpy.zeros((len(deals), 0), numpy.int32))
+        common = hands.pop()
+        (hi, low) = (None, None)
+        if omaha:
+            fives = [[numpy.column_stack([cards[:, h] for h in hole] + [common[:, b] for b in three])
+                      for hole in combinations(range(cards.shape[1]), 2) for three in combinations(range(5), 3)]
+                     for cards in hands]
+            if hipot:
+                hi = numpy.array([numpy.max([hi_classes(five) for five in player], axis=0) for player in fives])
+            if lowpot == 'low8':
+                low = numpy.array([numpy.min([_low8_values(five) for five in player], axis=0) for player in fives])
+        else:
+            sevens = [numpy.column_stack((cards, common)) for cards in hands]
+            if hipot:
+                hi = numpy.array([hi_classes(cards) for cards in sevens])
+            if lowpot == 'low8':
+                low = numpy.array([_low8_values(cards) for cards in sevens])
+        return (len(deals), hi, low)
+
+    def _outcomes_numpy(self, deals, hi, low):
+        """_outcomes of all the deals at once"""
+        hi_win = hi == hi.max(axis=0)
+        low_win = numpy.zeros(hi.shape, bool)
+        if low is not None:
+            best = low.min(axis=0)
+            low_win = (low == best) & (best != LOW_NOTHING)
+        (hi_n, low_n) = (hi_win.sum(axis=0), low_win.sum(axis=0))
+        share = 1.0 / ((hi_n > 0).astype(int) + (low_n > 0))
+        ev = (hi_win * (share / numpy.maximum(hi_n, 1)) + low_win * (share / numpy.maximum(low_n, 1))).sum(axis=1)
+        scoop = (hi_win & (hi_n == 1)) & ((low_win & (low_n == 1)) | (low_n == 0))
+        return [(int(scoop[i].sum()), int((hi_win[i] & (hi_n == 1)).sum()), int((hi_win[i] & (hi_n > 1)).sum()),
+                 int((low_win[i] & (low_n == 1)).sum()), int((low_win[i] & (low_n > 1)).sum()), float(ev[i]))
+                for i in range(len(hi))]
+
+def hi_classes(cards):
+    """Hand classes of the rows of cards, 5 to 7 cards, higher is better"""
+    n = cards.shape[1]
+    a = tables().numpy_arrays(n if n == 7 else 5)
+    (ranks, suits) = (cards >> 2, cards & 3)
+    if n == 5:
+        classes = a[5][a['weights5'][ranks].sum(axis=1)]
+        flush = (suits == suits[:, :1]).all(axis=1)
+        if flush.any():
+            classes = numpy.where(flush, a['flush'][numpy.bitwise_or.reduce(1 << ranks, axis=1)], classes)
+        return classes
+    elif n == 7:
+        classes = a[7][a['weights'][ranks].sum(axis=1)]
+    else:
+        return numpy.max([hi_classes(cards[:, list(c)]) for c in combinations(range(n), 5)], axis=0)
+    for suit in range(4):
+        in_suit = suits == suit
+        flush = in_suit.sum(axis=1) >= 5
+        if flush.any():
+            mask = numpy.where(in_suit, 1 << ranks, 0).sum(axis=1)
+            classes = numpy.where(flush, a['flush'][mask], classes)
+    return classes
+
+def _low8_values(cards):
+    a = tables().numpy_arrays()
+    low = ((cards >> 2) + 1) % 13
+    mask = numpy.bitwise_or.reduce(numpy.where(low < 8, 1 << low, 0), axis=1)
+    return a['low8'][mask]
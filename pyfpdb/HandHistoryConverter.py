@@ -26,6 +26,7 @@ import os
 import os.path
 import xml.dom.minidom
 import codecs
+import itertools
 from decimal_wrapper import Decimal
 import operator
 from xml.dom.minidom import Node
@@ -48,6 +49,10 @@ import Configuration
 class HandHistoryConverter():
 
     READ_CHUNK_SIZE = 10000 # bytes to read at a time from file in tail mode
+    STREAM_CHUNK_SIZE = 65536 # bytes to decode at a time when splitting hands
+
+    re_StarsArchive = re.compile('^Hand #\d+', re.MULTILINE)
+    re_FtpArchive = re.compile('\*{20}\s#\s\d+\s\*{20,25}\s+', re.MULTILINE)
 
     # filetype can be "text" or "xml"
     # so far always "text"
@@ -69,6 +74,7 @@ class HandHistoryConverter():
         """\
 in_path   (default '-' = sys.stdin)
 out_path  (default '-' = sys.stdout)
+index     byte offset in in_path to start reading from (default 0)
 """
 
         self.config = config
@@ -87,6 +93,7 @@ out_path  (default '-' = sys.stdout)
         self.kodec = None
 
         self.processedHands = []
+        self.handsConsumer = None   # given the processed hands a batch at a time, see setHandsConsumer
         self.numHands = 0
         self.numErrors = 0
         self.numPartial = 0
@@ -131,14 +138,17 @@ HandHistoryConverter: '%(sitename)s'
         self.numSkipped = 0
         self.numErrors = 0
         lastParsed = None
-        handsList = self.allHandsAsList()
-        log.debug( _("Hands list is:") + str(handsList))
-        log.info(_("Parsing %d hands") % len(handsList))
+        lastHand = None
+        handsList = self.iterHands()
+        firstHand = next(handsList, None)
         # Determine if we're dealing with a HH file or a Summary file
-        # quick fix : empty files make the handsList[0] fail ==> If empty file, go on with HH parsing
-        if len(handsList) == 0 or self.isSummary(handsList[0]) == False:
+        # quick fix : empty files have no first hand ==> If empty file, go on with HH parsing
+        if firstHand is None or self.isSummary(firstHand) == False:
             self.parsedObjectType = "HH"
-            for handText in handsList:
+            numHands = 0
+            for handText in itertools.chain((firstHand,) if firstHand is not None else (), handsList):
+                numHands += 1
+                lastHand = handText
                 try:
                     self.processedHands.append(self.processHand(handText))
                     lastParsed = 'stored'
@@ -153,22 +163,23 @@ HandHistoryConverter: '%(sitename)s'
                     self.numErrors += 1
                     lastParsed = 'error'
                     log.error(_("FpdbParseError for file '%s'") % self.in_path)
+                if self.handsConsumer is not None and len(self.processedHands) >= self.handsBatch:
+                    self.handsConsumer(self.processedHands)
+                    self.processedHands = []
             if lastParsed in ('partial', 'error') and self.autoPop:
-                self.index -= len(handsList[-1])
-                if self.isCarraige:
-                     self.index -= handsList[-1].count('\n')
-                handsList.pop()
+                self.index -= self.byteLength(lastHand)
+                numHands -= 1
                 if lastParsed=='partial':
                     self.numPartial -= 1
                 else:
                     self.numErrors -= 1
                 log.info(_("Removing partially written hand & resetting index"))
-            self.numHands = len(handsList)
+            self.numHands = numHands
             endtime = time.time()
             log.info(_("Read %d hands (%d failed) in %.3f seconds") % (self.numHands, (self.numErrors + self.numPartial), endtime - starttime))
         else:
             self.parsedObjectType = "Summary"
-            summaryParsingStatus = self.readSummaryInfo(handsList)
+            summaryParsingStatus = self.readSummaryInfo([firstHand] + list(handsList))
             endtime = time.time()
             if summaryParsingStatus :
                 log.info(_("Summary file '%s' correctly parsed (took %.3f seconds)") % (self.in_path, endtime - starttime))
@@ -177,15 +188,20 @@ HandHistoryConverter: '%(sitename)s'
     
     def setAutoPop(self, value):
         self.autoPop = value
+
+    def setHandsConsumer(self, consumer, batch):
+        """Have start() pass the processed hands to consumer every batch hands instead of
+           keeping all of them, getProcessedHands() then returns the last ones only"""
+        self.handsConsumer = consumer
+        self.handsBatch = batch
                 
     def allHandsAsList(self):
-        """Return a list of handtexts in the file at self.in_path"""
-        #TODO : any need for this to be generator? e.g. stars support can email one huge file of all hands in a year. Better to read bit by bit than all at once.
+        """Return a list of handtexts in the file at self.in_path.
+        Reads the whole file, see iterHands() for the streaming version"""
         self.readFile()
-        lenobs = len(self.obs)
-        self.obs = self.obs.rstrip()
-        self.index -= (lenobs - len(self.obs))
-        self.obs = self.obs.lstrip()
+        stripped = self.obs.rstrip()
+        self.index -= self.byteLength(self.obs[len(stripped):], False)
+        self.obs = stripped.lstrip()
         lenobs = len(self.obs)
         self.obs = self.obs.replace('\r\n', '\n')
         if lenobs != len(self.obs):
@@ -194,13 +210,11 @@ HandHistoryConverter: '%(sitename)s'
         # if self.archive:
         #     self.obs = self.convert_archive(self.obs)
         if self.starsArchive == True:
-            m = re.compile('^Hand #\d+', re.MULTILINE)
-            self.obs = m.sub('', self.obs)
+            self.obs = self.re_StarsArchive.sub('', self.obs)
 
         if self.ftpArchive == True:
             # Remove  ******************** # 1 *************************
-            m = re.compile('\*{20}\s#\s\d+\s\*{20,25}\s+', re.MULTILINE)
-            self.obs = m.sub('', self.obs)
+            self.obs = self.re_FtpArchive.sub('', self.obs)
     
         if self.obs is None or self.obs == "":
             log.info(_("Read no hands from file: '%s'") % self.in_path)
@@ -210,13 +224,89 @@ HandHistoryConverter: '%(sitename)s'
         # ie. </game> (split) </session>EOL
         # Remove this dangler if less than 50 characters and warn in the log
         if len(handlist[-1]) <= 50:
-            self.index -= len(handlist[-1])
-            if self.isCarraige:
-                self.index -= handlist[-1].count('\n')
+            self.index -= self.byteLength(handlist[-1])
             handlist.pop()
             log.info(_("Removing text < 50 characters & resetting index"))
         return handlist
 
+    def iterHands(self):
+        """Generator of the handtexts in the file at self.in_path.
+
+        The file is decoded STREAM_CHUNK_SIZE bytes at a time and each hand is
+        yielded as soon as the separator after it has been read, so memory use
+        depends on the size of a hand rather than the size of the file.
+        Reading starts at byte offset self.index, so a file that is being
+        appended to only has its new part decoded.
+        Produces the same hands and self.index as allHandsAsList()."""
+        if self.copyGameHeader or self.filetype != "text" or self.in_path == '-':
+            # parseHeader() needs self.whole_file
+            for handText in self.allHandsAsList():
+                yield handText
+            return
+        self.checkIndex(os.path.getsize(self.in_path))
+        kodec = self.detectCodec()
+        if kodec is None:
+            print _("unable to read file with any codec in list!"), self.in_path
+            log.info(_("Read no hands from file: '%s'") % self.in_path)
+            return
+        self.kodec = kodec
+        raw_fh = open(self.in_path, 'rb')
+        raw_fh.seek(self.index)
+        in_fh = codecs.getreader(kodec)(raw_fh)
+        try:
+            leading, carry, pending = True, u'', u''
+            while True:
+                chunk = in_fh.read(self.STREAM_CHUNK_SIZE)
+                eof = not chunk
+                carry += chunk
+                if eof:
+                    # an incomplete character at the end of the file is left for next time
+                    self.index = raw_fh.tell() - len(in_fh.bytebuffer)
+                    text = carry.rstrip()
+                    self.index -= self.byteLength(carry[len(text):], False)
+                    carry = u''
+                else:
+                    # Hold back the last line and the whitespace before it, so that
+                    # \r\n pairs, archive banners and hand separators are never cut
+                    cut = carry.rfind('\n', 0, len(carry.rstrip())) + 1
+                    text, carry = carry[:cut], carry[cut:]
+                if leading:
+                    text = text.lstrip()
+                    leading = not text
+                if '\r\n' in text:
+                    text = text.replace('\r\n', '\n')
+                    self.isCarraige = True
+                if self.starsArchive == True:
+                    text = self.re_StarsArchive.sub('', text)
+                if self.ftpArchive == True:
+                    text = self.re_FtpArchive.sub('', text)
+                pending += text
+
+                start = 0
+                for m in self.re_SplitHands.finditer(pending):
+                    # a separator running into the end of the buffer may not be complete yet
+                    if m.end() >= len(pending) and not eof:
+                        break
+                    yield pending[start:m.start()]
+                    start = m.end()
+                pending = pending[start:]
+                if eof:
+                    break
+        finally:
+            in_fh.close()
+
+        if leading:
+            log.info(_("Read no hands from file: '%s'") % self.in_path)
+            return
+        # Some HH formats leave dangling text after the split
+        # ie. </game> (split) </session>EOL
+        # Remove this dangler if less than 50 characters and warn in the log
+        if len(pending) <= 50:
+            self.index -= self.byteLength(pending)
+            log.info(_("Removing text < 50 characters & resetting index"))
+        else:
+            yield pending
+
     def processHand(self, handText):
         if self.isPartial(handText):
             raise FpdbHandPartial(_("Could not identify as a %s hand") % self.sitename)
@@ -450,19 +540,89 @@ or None if we fail to get the info """
         else:
             return [x]
 
+    def tailCodec(self, kodec, head):
+        """Return the codec to decode in_path with from self.index on, head being
+        the first bytes of the file, or None if kodec is not the file's codec.
+        A utf-16 file is only taken for one when it starts with a byte order mark,
+        without it any even number of bytes decodes, utf-8 included. The mark is
+        only at the start of the file, so reading from further on needs the
+        byte order it gave"""
+        if codecs.lookup(kodec).name == 'utf-16':
+            if head[:2] == codecs.BOM_UTF16_BE:
+                return 'utf-16-be' if self.index > 0 else kodec
+            if head[:2] == codecs.BOM_UTF16_LE:
+                return 'utf-16-le' if self.index > 0 else kodec
+            return None
+        return kodec
+
+    def checkIndex(self, size):
+        """Start from the beginning if in_path is now shorter than self.index,
+        i.e. the file was replaced"""
+        if self.index > size:
+            log.warning(_("File '%s' is smaller than the last read position, reading it from the start") % self.in_path)
+            self.index = 0
+
+    def byteLength(self, text, restoreCR=True):
+        """Return the number of bytes text takes up in in_path when encoded with
+        self.kodec. restoreCR counts back in the \r of each \r\n that was
+        replaced by \n when the file had them."""
+        if not text:
+            return 0
+        codec = codecs.lookup(self.kodec)
+        bom = len(codec.encode(u'')[0])
+        length = len(codec.encode(text)[0]) - bom
+        if restoreCR and self.isCarraige:
+            length += text.count('\n') * (len(codec.encode(u'\r')[0]) - bom)
+        return length
+
+    def detectCodec(self):
+        """Return the first codec in self.codepage that decodes in_path from
+        self.index on, without holding the file in memory, or None"""
+        codepages = self.__listof(self.codepage)
+        for kodec in codepages:
+            try:
+                in_fh = open(self.in_path, 'rb')
+                try:
+                    kodec = self.tailCodec(kodec, in_fh.read(2))
+                    if kodec is None:
+                        continue
+                    if len(codepages) > 1:
+                        decoder = codecs.getincrementaldecoder(kodec)()
+                        in_fh.seek(self.index)
+                        for chunk in iter(lambda: in_fh.read(self.STREAM_CHUNK_SIZE), ''):
+                            decoder.decode(chunk)
+                        if not self.autoPop:
+                            # the end of a file still being written can cut a character,
+                            # iterHands leaves that for the next read
+                            decoder.decode('', True)
+                finally:
+                    in_fh.close()
+                return kodec
+            except:
+                pass
+        return None
+
     def readFile(self):
         """Open in_path according to self.codepage. Exceptions caught further up"""
 
         if self.filetype == "text":
+            try:
+                in_fh = open(self.in_path, 'rb')
+                raw = in_fh.read()
+                in_fh.close()
+                self.checkIndex(len(raw))
+            except:
+                raw = None
             for kodec in self.__listof(self.codepage):
                 #print "trying", kodec
                 try:
-                    in_fh = codecs.open(self.in_path, 'r', kodec)
-                    self.whole_file = in_fh.read()
-                    in_fh.close()
-                    self.obs = self.whole_file[self.index:]
-                    self.index = len(self.whole_file)
-                    self.kodec = kodec
+                    tail = self.tailCodec(kodec, raw[:2])
+                    if tail is None:
+                        continue
+                    self.whole_file = raw.decode(kodec)
+                    self.obs = raw[self.index:].decode(tail)
+                    self.index = len(raw)
+                    self.kodec = tail
                     return True
                 except:
                     pass
@@ -512,7 +672,7 @@ or None if we fail to get the info """
     def getProcessedFile(self):
         return self.out_path
 
-    def getLastCharacterRead(self):
+    def getLastByteRead(self):
         return self.index
 
     def isSummary(self, topline):
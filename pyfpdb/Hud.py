@@ -31,6 +31,7 @@ _ = L10n.get_translation()
 import string
 import logging
 import copy
+from collections import OrderedDict
 
 # logging has been set up in fpdb.py or HUD_main.py, use their settings:
 log = logging.getLogger("hud")
@@ -39,6 +40,7 @@ log = logging.getLogger("hud")
 import Configuration
 import Database
 import Hand
+from decimal_wrapper import Decimal
 
 
 def importName(module_name, name):
@@ -53,6 +55,40 @@ def importName(module_name, name):
     return(getattr(module, name))
 
 
+class HandSummary:
+    """The parts of a Hand the stats and popups use, from the summary the importer sends
+    along with the hand (see HudChannel.hand_summary), so no query is needed"""
+
+    def __init__(self, hand, summary):
+        self.handid_selected = hand
+        self.gametype = summary['gametype']
+        self.players = summary['players']
+        self.bets = OrderedDict((street, OrderedDict((name, [Decimal(amount) for amount in amounts])
+                                                     for (name, amounts) in bets))
+                                for (street, bets) in summary['bets'])
+        self.pot = HandSummaryPot(dict((name, Decimal(amount)) for (name, amount) in summary['returned'].iteritems()))
+        self.collectees = dict((name, Decimal(amount)) for (name, amount) in summary['collectees'].iteritems())
+
+class HandSummaryPot:
+    def __init__(self, returned):
+        self.returned = returned
+
+class LazyHand(object):
+    """Stands for the Hand of a hand id, which is only read from the db the first time
+    one of its attributes is used, by a popup or an aux window for instance"""
+
+    def __init__(self, hud, hand, config):
+        self._hud = hud
+        self._handid = hand
+        self._config = config
+        self._hand = None
+
+    def __getattr__(self, name):
+        if self._hand is None:
+            self._hand = self._hud.read_hand(self._handid, self._config)
+        return getattr(self._hand, name)
+
+
 class Hud:
     def __init__(self, parent, table, max, poker_game, game_type, config):
 #    __init__ is (now) intended to be called from the stdin thread, so it
@@ -169,23 +205,32 @@ class Hud:
         self.config.save()
 
 
-    def create(self, hand, config, stat_dict):
+    def create(self, hand, config, stat_dict, summary=None):
         # update this hud, to the stats and players as of "hand"
         # hand is the hand id of the most recent hand played at this table
 
         self.stat_dict = stat_dict # stat_dict from HUD_main.read_stdin is mapped here
         # the db_connection created in HUD_Main is NOT available to the
-        #  hud.py and aux handlers, so create a fresh connection in this class
+        #  hud.py and aux handlers, so read_hand creates a fresh connection in this class
         # if the db connection is made in __init__, then the sqlite db threading will fail
-        #  so the db connection is made here instead.
-        self.db_hud_connection = Database.Database(self.config)
-        # Load a hand instance (factory will load correct type for this hand)
-        self.hand_instance = Hand.hand_factory(hand, config, self.db_hud_connection)
-        self.db_hud_connection.connection.rollback()
+        #  so the db connection is made when a hand is first read instead.
+        self.db_hud_connection = None
+        self.update(hand, config, summary)
         log.info(_('Creating hud from hand ')+str(hand))
 
 
-    def update(self, hand, config):
-         # re-load a hand instance (factory will load correct type for this hand)
-        self.hand_instance = Hand.hand_factory(hand, config, self.db_hud_connection)
-        self.db_hud_connection.connection.rollback()
+    def update(self, hand, config, summary=None):
+        # the summary of the hand the importer sent, or the hand read from the db
+        # when something needs it
+        if summary is not None:
+            self.hand_instance = HandSummary(hand, summary)
+        else:
+            self.hand_instance = LazyHand(self, hand, config)
+
+    def read_hand(self, hand, config):
+        # load a hand instance (factory will load correct type for this hand)
+        if self.db_hud_connection is None:
+            self.db_hud_connection = Database.read_connection(self.config)
+        hand_instance = Hand.hand_factory(hand, config, self.db_hud_connection)
+        self.db_hud_connection.rollback()
+        return hand_instance
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""HudChannel.py
+
+Sends the hands stored by the importer to the HUDs over a localhost socket.
+
+A message is a 4 byte length in network byte order followed by that many bytes
+of JSON: the list of the payloads (see hand_payload) of the hands stored by one
+import. Every connected HUD gets every message, the HUD closing the connection
+or the importer closing the server is the end of it.
+
+Any local process can connect to the port, and the hands have everyone's hole
+cards: a HUD first sends the server's random token, given to it with --hudtoken,
+in a message of its own. A connection sending anything else is closed.
+"""
+
+import L10n
+_ = L10n.init_translation()
+
+import os
+import hmac
+import json
+import socket
+import binascii
+import struct
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger("importer")
+
+HOST = '127.0.0.1'
+HEADER = struct.Struct('!I')
+CLIENT_QUEUE_SIZE = 100     # messages waiting for a HUD, the oldest are dropped beyond that
+LOGIN_TIMEOUT = 10          # seconds a HUD has to send the token once connected
+
+
+def hand_payload(hand):
+    """What the HUD reads from the db about a stored hand, from the Hand object:
+       'table' is the row of get_table_name, 'cards' the rows of get_cards,
+       'common' the row of get_common_cards, for the games with common cards, and
+       'summary' the hand_summary the HUD gives the stats instead of a Hand"""
+    gametype = hand.gametype
+    table = (hand.hands['tableName'], gametype['maxSeats'], gametype['category'], gametype['type'],
+             gametype['fast'], hand.siteId, hand.sitename, hand.hands['seats'])
+    cards = []
+    for player in hand.handsplayers.itervalues():
+        held = [player['card%d' % i] for i in range(1, 21)]
+        if gametype['base'] == 'draw':
+            # the cards of the last draw, as the CASE of get_cards
+            held = [held[i + 15] or held[i + 10] or held[i + 5] or held[i] for i in range(5)] + [0, 0]
+        cards.append([player['seatNo']] + held[:7])
+    cards.sort()
+    payload = {'hand_id': hand.dbid_hands, 'table': table, 'cards': cards}
+    if gametype['category'] in ('holdem', 'omahahi', 'omahahilo'):
+        payload['common'] = [hand.hands['boardcard%d' % i] for i in range(1, 6)]
+    payload['summary'] = hand_summary(hand)
+    return payload
+
+def hand_summary(hand):
+    """What the HUD's stats and popups use of the Hand, see Hud.HandSummary, amounts as strings"""
+    def text(value):
+        if value is None:
+            return None
+        return repr(value) if isinstance(value, float) else unicode(value)
+    gametype = dict((key, text(hand.gametype.get(key))) for key in ('category', 'limitType', 'sb', 'bb'))
+    # as lists, the stats add the bets up in the order of the Hand's dicts
+    bets = [[street, [[name, [text(amount) for amount in amounts]] for (name, amounts) in streetbets.iteritems()]]
+            for (street, streetbets) in hand.bets.iteritems()]
+    return {'gametype': gametype,
+            'players': [player[:3] for player in hand.players],
+            'bets': bets,
+            'returned': dict((name, text(amount)) for (name, amount) in hand.pot.returned.iteritems()),
+            'collectees': dict((name, text(amount)) for (name, amount) in hand.collectees.iteritems())}
+
+def encode(payloads):
+    """A message with payloads"""
+    data = json.dumps(payloads, separators=(',', ':'))
+    return HEADER.pack(len(data)) + data
+
+def read_hands(port, token):
+    """Connect to the HudServer on port with its token and yield the payloads it
+       sends until it closes"""
+    sock = socket.create_connection((HOST, port))
+    try:
+        sock.sendall(HEADER.pack(len(token)) + token)
+        while 1:
+            header = _receive(sock, HEADER.size)
+            if header is None:
+                return
+            data = _receive(sock, HEADER.unpack(header)[0])
+            if data is None:
+                return
+            for payload in json.loads(data):
+                yield payload
+    finally:
+        sock.close()
+
+def _receive(sock, size):
+    """size bytes from sock, None if it was closed before"""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+class HudServer(object):
+    """Accepts HUDs on a localhost port and sends them the hands given to send_hands.
+
+    send_hands never waits for a HUD: every HUD has its queue of messages and a
+    thread writing them. A HUD that falls more than CLIENT_QUEUE_SIZE imports behind
+    misses the oldest ones, its stat store catches up on their stats by hand id.
+    Until the first HUD connects the messages are kept for it, the last
+    CLIENT_QUEUE_SIZE of them, as the HUD is started along with the import.
+    A connection is only a HUD once it sent token."""
+
+    def __init__(self, port=0):
+        self.token = binascii.hexlify(os.urandom(16))
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((HOST, port))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.clients = []
+        self.backlog = deque(maxlen=CLIENT_QUEUE_SIZE)  # the messages for the first HUD, None once it connected
+        self.lock = threading.Lock()
+        self.closed = False
+        accept = threading.Thread(target=self.accept, name="HudServer")
+        accept.daemon = True
+        accept.start()
+
+    def accept(self):
+        while 1:
+            try:
+                (sock, address) = self.listener.accept()
+            except socket.error:
+                return      # closed
+            # a thread of its own, a connection that sends nothing does not hold up the others
+            login = threading.Thread(target=self.login, args=(sock, address), name="HudServer login")
+            login.daemon = True
+            login.start()
+
+    def login(self, sock, address):
+        """Take the connection on as a HUD if the first message is the token"""
+        token = None
+        try:
+            sock.settimeout(LOGIN_TIMEOUT)
+            header = _receive(sock, HEADER.size)
+            if header is not None and HEADER.unpack(header)[0] == len(self.token):
+                token = _receive(sock, len(self.token))
+            sock.settimeout(None)
+        except socket.error:
+            token = None
+        if token is None or not hmac.compare_digest(token, self.token):
+            log.warning(_("Refused a HUD connection from %s:%s without the token") % address)
+            sock.close()
+            return
+        log.info(_("HUD connected from %s:%s") % address)
+        with self.lock:
+            if self.closed:
+                sock.close()
+                return
+            client = HudConnection(sock)
+            if self.backlog is not None:
+                for message in self.backlog:
+                    client.put(message)
+                self.backlog = None
+            self.clients.append(client)
+
+    def send_hands(self, payloads):
+        """Queue a message with payloads for every connected HUD, or for the first to connect"""
+        if not payloads:
+            return
+        message = encode(payloads)
+        with self.lock:
+            if self.backlog is not None:
+                self.backlog.append(message)
+                return
+            self.clients = [client for client in self.clients if client.alive]
+            for client in self.clients:
+                client.put(message)
+
+    def close(self):
+        """Stop accepting HUDs, the connected ones are closed once their messages are sent"""
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.listener.close()
+        with self.lock:
+            self.closed = True
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+
+class HudConnection(object):
+    """A connected HUD and the thread writing its messages"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.messages = deque()
+        self.ready = threading.Condition()
+        self.alive = True
+        self.closing = False
+        sender = threading.Thread(target=self.send, name="HudConnection")
+        sender.daemon = True
+        sender.start()
+
+    def put(self, message):
+        with self.ready:
+            if len(self.messages) >= CLIENT_QUEUE_SIZE:
+                self.messages.popleft()
+                log.warning(_("HUD is not keeping up, dropping the oldest hands sent to it"))
+            self.messages.append(message)
+            self.ready.notify()
+
+    def close(self):
+        with self.ready:
+            self.closing = True
+            self.ready.notify()
+
+    def send(self):
+        while 1:
+            with self.ready:
+                while not self.messages and not self.closing:
+                    self.ready.wait()
+                if not self.messages:
+                    break
+                message = self.messages.popleft()
+            try:
+                self.sock.sendall(message)
+            except socket.error, e:
+                log.info(_("HUD disconnected: %s") % e)
+                break
+        self.alive = False
+        self.sock.close()
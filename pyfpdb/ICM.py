@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Tournament equities of stacks by the Independent Chip Model (Malmuth-Harville):
+a player finishes first with their share of the chips, then next among the
+players left the same way, and so on down the paid places.
+
+The exact solver goes through the sets of players that can take the paid places
+above a player, each set once with the chance of it happening, instead of every
+finishing order: a final table of 10 paying 10 is 1023 sets. When there are more
+than EXACT_STATES sets, a big field, the finishing orders are sampled instead,
+from a generator seeded with seed so that the same stacks give the same answer."""
+
+import L10n
+_ = L10n.get_translation()
+
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EXACT_STATES = 50000    # sets of players placed the exact solver goes through at most
+ITERATIONS = 100000     # finishing orders sampled beyond that
+SEED = 1
+
+
+def place_probabilities(stacks, places):
+    """The chance of each player of finishing in each of the first places places, a
+       list per player, exactly. Players without chips never finish in the money"""
+    stacks = [float(s) for s in stacks]
+    probabilities = [[0.0] * places for s in stacks]
+    players = [i for (i, s) in enumerate(stacks) if s > 0]
+    # sets of the players already placed, as bitmasks: mask -> (chance, their chips)
+    level = {0: (1.0, 0.0)}
+    total = sum(stacks)
+    for place in range(min(places, len(players))):
+        placed = {}
+        for (mask, (chance, chips)) in level.iteritems():
+            left = total - chips
+            for i in players:
+                if mask & (1 << i):
+                    continue
+                p = chance * stacks[i] / left
+                probabilities[i][place] += p
+                key = mask | (1 << i)
+                if key in placed:
+                    placed[key] = (placed[key][0] + p, placed[key][1])
+                else:
+                    placed[key] = (p, chips + stacks[i])
+        level = placed
+    return probabilities
+
+def exact_states(players, places):
+    """The number of sets of players place_probabilities goes through"""
+    (states, count) = (0, 1)
+    for k in range(min(players, places)):
+        states += count
+        count = count * (players - k) // (k + 1)
+    return states
+
+def sampled_probabilities(stacks, places, iterations=ITERATIONS, seed=SEED):
+    """place_probabilities estimated over iterations random finishing orders"""
+    stacks = [float(s) for s in stacks]
+    players = [i for (i, s) in enumerate(stacks) if s > 0]
+    places = min(places, len(players))
+    probabilities = [[0.0] * places for s in stacks]
+    if not places:
+        return probabilities
+    # ordering the players by an exponential time of rate their stack is drawing
+    # the winner by stacks, then the next among the others and so on
+    if numpy is not None:
+        rates = numpy.array([stacks[i] for i in players])
+        times = numpy.random.RandomState(seed).exponential(size=(iterations, len(players))) / rates
+        order = times.argsort(axis=1)[:, :places]
+        for place in range(places):
+            counts = numpy.bincount(order[:, place], minlength=len(players))
+            for (j, i) in enumerate(players):
+                probabilities[i][place] = counts[j] / float(iterations)
+    else:
+        generator = random.Random(seed)
+        for n in xrange(iterations):
+            order = sorted(players, key=lambda i: generator.expovariate(stacks[i]))
+            for (place, i) in enumerate(order[:places]):
+                probabilities[i][place] += 1.0
+        for row in probabilities:
+            for place in range(places):
+                row[place] /= iterations
+    return probabilities
+
+def equities(stacks, payouts, iterations=ITERATIONS, seed=SEED):
+    """The share of the payouts of each of stacks, payouts being the prizes (or
+       shares of the prize pool) of 1st, 2nd... exact unless the field is too big"""
+    places = len(payouts)
+    players = len([s for s in stacks if s > 0])
+    if exact_states(players, places) <= EXACT_STATES:
+        probabilities = place_probabilities(stacks, places)
+    else:
+        probabilities = sampled_probabilities(stacks, places, iterations, seed)
+    return [sum(p * float(prize) for (p, prize) in zip(row, payouts)) for row in probabilities]
+
+def batch_equities(configurations, payouts, iterations=ITERATIONS, seed=SEED):
+    """equities of each list of stacks of configurations, such as the stacks at every
+       decision of a hand, each distinct one worked out once"""
+    done = {}
+    results = []
+    for stacks in configurations:
+        key = tuple(float(s) for s in stacks)
+        if key not in done:
+            done[key] = equities(key, payouts, iterations, seed)
+        results.append(list(done[key]))
+    return results
+
+
+class ICM:
+    """The equities of stacks, as the class that was in GuiReplayer"""
+
+    def __init__(self, stacks, payouts):
+        self.stacks = stacks
+        self.payouts = payouts
+        self.equities = [round(e, 4) for e in equities(stacks, payouts)]
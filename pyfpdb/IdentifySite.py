@@ -41,6 +41,9 @@ re_Head['Fulltilt'] = re.compile(r'^((BEGIN)?\n)?FullTiltPoker.+\n\nSeat', re.MU
 re_XLS['PokerStars'] = re.compile(r'Tournaments\splayed\sby\s\'.+?\'')
 re_XLS['Fulltilt'] = re.compile(r'Player\sTournament\sReport\sfor\s.+?\s\(.*\)')
 
+HEAD_CHARS = 5000       # the start of a file the sites are identified by
+READ_CHUNK_SIZE = 65536 # bytes decoded at a time to pick a file's codec
+
 class FPDBFile:
     path = ""
     ftype = None # Valid: hh, summary, both
@@ -173,15 +176,17 @@ class IdentifySite:
 
     def processFile(self, path):
         if path not in self.filelist:
-            whole_file, kodec = self.read_file(path)
-            if whole_file:
-                fobj = self.idSite(path, whole_file, kodec)
+            head, kodec = self.read_file(path)
+            if head:
+                fobj = self.idSite(path, head, kodec)
                 if fobj == False: # Site id failed
                     log.debug(_("DEBUG:") + " " + _("siteId Failed for: %s") % path)
                 else:
                     self.filelist[path] = fobj
 
     def read_file(self, in_path):
+        """The first HEAD_CHARS characters of in_path and its codec. The whole file
+           is decoded to pick the codec, a chunk at a time, but only its head kept"""
         if in_path.endswith('.xls') or in_path.endswith('.xlsx') and xlrd:
             try:
                 wb = xlrd.open_workbook(in_path)
@@ -192,34 +197,46 @@ class IdentifySite:
                 return None, None
         for kodec in self.codepage:
             try:
-                infile = codecs.open(in_path, 'r', kodec)
-                whole_file = infile.read()
-                infile.close()
-                return whole_file, kodec
+                decoder = codecs.getincrementaldecoder(kodec)()
+                head = u''
+                with open(in_path, 'rb') as infile:
+                    for chunk in iter(lambda: infile.read(READ_CHUNK_SIZE), ''):
+                        text = decoder.decode(chunk)
+                        if len(head) < HEAD_CHARS:
+                            head += text[:HEAD_CHARS - len(head)]
+                decoder.decode('', True)
+                return head, kodec
             except:
                 continue
         return None, None
+
+    def search_file(self, path, kodec, regex):
+        """Whether regex matches a line of the file at path, read a line at a time"""
+        with codecs.open(path, 'r', kodec) as infile:
+            for line in infile:
+                if regex.search(line):
+                    return True
+        return False
     
-    def idSite(self, path, whole_file, kodec):
+    def idSite(self, path, head, kodec):
         """Identifies the site the hh file originated from"""
         f = FPDBFile(path)
         f.kodec = kodec
         for id, site in self.sitelist.iteritems():
             filter_name = site.filter_name
-            m = site.re_Identify.search(whole_file[:5000])
+            m = site.re_Identify.search(head)
             if m and filter_name in ('Fulltilt', 'PokerStars'):
-                m1 = re_Divider[filter_name].search(whole_file.replace('\r\n', '\n'))
-                if m1:
+                if self.search_file(path, kodec, re_Divider[filter_name]):
                     f.archive = True
                     f.archiveDivider = True
-                elif re_Head.get(filter_name) and re_Head[filter_name].match(whole_file[:5000].replace('\r\n', '\n')):
+                elif re_Head.get(filter_name) and re_Head[filter_name].match(head.replace('\r\n', '\n')):
                     f.archive = True
                     f.archiveHead = True
             if m:
                 f.site = site
                 f.ftype = "hh"
                 if f.site.re_HeroCards:
-                    h = f.site.re_HeroCards.search(whole_file[:5000])
+                    h = f.site.re_HeroCards.search(head)
                     if h and 'PNAME' in h.groupdict():
                         f.hero = h.group('PNAME')
                 else:
@@ -231,20 +248,20 @@ class IdentifySite:
                 if path.endswith('.xls') or path.endswith('.xlsx'):
                     filter_name = site.filter_name
                     if filter_name in ('Fulltilt', 'PokerStars'):
-                        m2 = re_XLS[filter_name].search(whole_file[:5000])
+                        m2 = re_XLS[filter_name].search(head)
                         if m2:
                             f.site = site
                             f.ftype = "summary"
                             return f
                 else:
-                    m3 = site.re_SumIdentify.search(whole_file[:5000])
+                    m3 = site.re_SumIdentify.search(head)
                     if m3:
                         f.site = site
                         f.ftype = "summary"
                         return f
                 
-        m1 = self.re_Identify_PT.search(whole_file[:5000])
-        m2 = self.re_SumIdentify_PT.search(whole_file[:100])
+        m1 = self.re_Identify_PT.search(head)
+        m2 = self.re_SumIdentify_PT.search(head[:100])
         if m1 or m2:
             filter = 'PokerTrackerToFpdb'
             filter_name = 'PokerTracker'
@@ -260,15 +277,15 @@ class IdentifySite:
                 elif re.search(u'\*{2}\sHand\s\#\s', m1.group()):
                     f.site.line_delimiter = None
                     f.site.re_SplitHands = re.compile(u'Rake:\s[^\s]+')
-                elif re.search(u'Server\spoker\d+\.ipoker\.com', whole_file[:250]):
+                elif re.search(u'Server\spoker\d+\.ipoker\.com', head[:250]):
                     f.site.line_delimiter = None
                     f.site.spaces = True
                     f.site.re_SplitHands = re.compile(u'GAME\s\#')
-                m3 = f.site.re_HeroCards1.search(whole_file[:5000])
+                m3 = f.site.re_HeroCards1.search(head)
                 if m3:
                     f.hero = m3.group('PNAME')
                 else:
-                     m4 = f.site.re_HeroCards2.search(whole_file[:5000])
+                     m4 = f.site.re_HeroCards2.search(head)
                      if m4:
                          f.hero = m4.group('PNAME')
             else:
@@ -26,6 +26,8 @@ import datetime
 import Queue
 import shutil
 import re
+import cPickle
+import multiprocessing
 
 import logging, traceback
 
@@ -36,6 +38,9 @@ from PyQt5.QtCore import QCoreApplication
 import Database
 import Configuration
 import IdentifySite
+import FileWatcher
+import HudChannel
+import ResultCache
 from Exceptions import FpdbParseError, FpdbHandDuplicate, FpdbHandPartial
 
 try:
@@ -48,6 +53,51 @@ if __name__ == "__main__":
 # logging has been set up in fpdb.py or HUD_main.py, use their settings:
 log = logging.getLogger("importer")
 
+HANDS_BATCH = 1000  # hands converted in this process before they are stored, so that
+                    # the hands of a big file are not all held at once
+
+# Parse processes for bulk import. Each process converts a whole hh file and
+# assembles the derived stats of its hands, the importer process only does the
+# db lookups and writes.
+_parse_config = None
+
+def _init_parse_process(config_file, site_ids):
+    global _parse_config
+    _parse_config = Configuration.Config(file = config_file)
+    _parse_config.set_site_ids(site_ids) # normally loaded from the db by Database.get_sites()
+
+def _parse_hh_file(task):
+    """Convert one hh file in a parse process. Returns a dict with the pickled,
+       assembled hands, or hands=None and the error if anything failed"""
+    (path, hhc_fname, filter_name, archive, sitename) = task
+    parsed = {'path': path, 'hands': None, 'error': None, 'numHands': 0, 'numPartial': 0,
+              'numSkipped': 0, 'numErrors': 0, 'summaryInFile': False, 'lastByteRead': 0, 'ttime': 0}
+    stime = time()
+    try:
+        mod = __import__(hhc_fname)
+        obj = getattr(mod, filter_name, None)
+        hhc = obj( _parse_config, in_path = path, index = 0, autostart=False
+                  ,starsArchive = archive
+                  ,ftpArchive   = archive
+                  ,sitename     = sitename)
+        hhc.start()
+        handlist = hhc.getProcessedHands()
+        for hand in handlist:
+            hand.assembleHand()
+            hand.config = None # re-attached by the importer, no need to ship it back
+        parsed['hands'] = cPickle.dumps(handlist, cPickle.HIGHEST_PROTOCOL)
+        parsed['numHands']   = hhc.numHands
+        parsed['numPartial'] = hhc.numPartial
+        parsed['numSkipped'] = hhc.numSkipped
+        parsed['numErrors']  = hhc.numErrors
+        parsed['summaryInFile'] = hhc.summaryInFile
+        parsed['lastByteRead'] = hhc.getLastByteRead()
+    except:
+        parsed['hands'] = None
+        parsed['error'] = traceback.format_exc()
+    parsed['ttime'] = time() - stime
+    return parsed
+
 class Importer:
     def __init__(self, caller, settings, config, sql = None, parent = None):
         """Constructor"""
@@ -69,7 +119,9 @@ class Importer:
         self.lines      = None
         self.faobs      = None       # File as one big string
         self.mode       = None
-        self.pos_in_file = {}        # dict to remember how far we have read in the file
+        self.pos_in_file = {}        # dict to remember how far (in bytes) we have read in the file
+        self.watcher    = None       # FileWatcher reporting changed files, polls the directories if None
+        self.changedFiles = Queue.Queue() # paths reported by the watcher
         #Set defaults
         self.callHud    = self.config.get_import_parameters().get("callFpdbHud")
 
@@ -85,6 +137,7 @@ class Importer:
         self.settings.setdefault("ftpArchive", False)
         self.settings.setdefault("testData", False)
         self.settings.setdefault("cacheHHC", False)
+        self.settings.setdefault("parseProcesses", 1)          # >1 parses bulk imports in a process pool
 
         self.writeq = None
         self.database = Database.Database(self.config, sql = self.sql)
@@ -120,6 +173,9 @@ class Importer:
             for i in xrange(self.settings['threads'] - len(self.writerdbs)):
                 self.writerdbs.append( Database.Database(self.config, sql = self.sql) )
 
+    def setParseProcesses(self, value):
+        self.settings['parseProcesses'] = value
+
     def setDropIndexes(self, value):
         self.settings['dropIndexes'] = value
 
@@ -156,6 +212,9 @@ class Importer:
         ttime100 = ttime * 100
         self.database.updateFile([type, now, now, hands, stored, dups, partial, skipped, errs, ttime100, True, id])
         self.database.commit()
+        if stored:
+            # the file's hands are committed, the results cached by the gui tabs are out of date
+            ResultCache.bump_import_generation(self.config)
     
     def addFileToList(self, fpdbfile):
         """FPDBFile"""
@@ -164,10 +223,13 @@ class Importer:
             file = unicode(file, "utf8", "replace")
         except TypeError:
             pass
+        if self.config.get_import_parameters().get("preloadPlayers"):
+            # the players of a site a file came from are likely to turn up in the next ones
+            self.database.preloadPlayerCache(fpdbfile.site.name)
         fpdbfile.fileId = self.database.get_id(file)
         if not fpdbfile.fileId:
             now = datetime.datetime.utcnow()
-            fpdbfile.fileId = self.database.storeFile([file, fpdbfile.site.name, now, now, 0, 0, 0, 0, 0, 0, 0, False])
+            fpdbfile.fileId = self.database.storeFile([file, fpdbfile.site.name, now, now, 0, 0, 0, 0, 0, 0, 0, False, 0])
             self.database.commit()
             
     #Add an individual file to filelist
@@ -229,6 +291,8 @@ class Importer:
             if monitor == True:
                 self.monitor = True
                 self.dirlist[site] = [dir] + [filter]
+                if self.watcher is not None:
+                    self.watcher.addDirectory(dir)
 
             #print "addImportDirectory: checking files in", dir
             for subdir in os.walk(dir):
@@ -291,11 +355,20 @@ class Importer:
         ProgressDialog.resize(500, 200)
         ProgressDialog.show()
         
-        for f in self.filelist:
+        files = self.filelist.keys()
+        pool, parsed = None, None
+        # the converter of a parse process cannot be cached, cacheHHC imports in this process
+        if self.settings['parseProcesses'] > 1 and self.mode == 'bulk' and not self.settings['cacheHHC']:
+            (pool, parsed) = self._start_parse_pool(files)
+
+        for f in files:
             filecount = filecount + 1
             ProgressDialog.progress_update(f, str(self.database.getHandCount()))
 
-            (stored, duplicates, partial, skipped, errors, ttime) = self._import_despatch(self.filelist[f])
+            result = None
+            if pool and self.filelist[f].ftype in ("hh", "both"):
+                result = parsed.next()
+            (stored, duplicates, partial, skipped, errors, ttime) = self._import_despatch(self.filelist[f], result)
             totstored += stored
             totdups += duplicates
             totpartial += partial
@@ -313,15 +386,34 @@ class Importer:
             
             self.logImport('bulk', f, stored, duplicates, partial, skipped, errors, ttime, self.filelist[f].fileId)
 
+        if pool:
+            pool.close()
+            pool.join()
         ProgressDialog.accept()
         del ProgressDialog
         
         return (totstored, totdups, totpartial, totskipped, toterrors)
     # end def importFiles
 
-    def _import_despatch(self, fpdbfile):
+    def _start_parse_pool(self, files):
+        """Start the parse processes for the hh files in files, returns the pool and
+           an iterator giving the parse results in the order of files"""
+        processes = min(self.settings['parseProcesses'], multiprocessing.cpu_count())
+        log.info(_("Parsing hand histories in %d processes") % processes)
+        tasks = []
+        for f in files:
+            fpdbfile = self.filelist[f]
+            if fpdbfile.ftype in ("hh", "both"):
+                tasks.append((fpdbfile.path, fpdbfile.site.hhc_fname, fpdbfile.site.filter_name,
+                              fpdbfile.archive, fpdbfile.site.name))
+        pool = multiprocessing.Pool(processes, _init_parse_process, (self.config.file, self.config.site_ids.items()))
+        return (pool, pool.imap(_parse_hh_file, tasks))
+
+    def _import_despatch(self, fpdbfile, parsed = None):
         stored, duplicates, partial, skipped, errors, ttime = 0,0,0,0,0,0
-        if fpdbfile.ftype in ("hh", "both"):
+        if fpdbfile.ftype in ("hh", "both") and parsed is not None:
+            (stored, duplicates, partial, skipped, errors, ttime) = self._import_parsed_hh_file(fpdbfile, parsed)
+        elif fpdbfile.ftype in ("hh", "both"):
             (stored, duplicates, partial, skipped, errors, ttime) = self._import_hh_file(fpdbfile)
         if fpdbfile.ftype == "summary":
             (stored, duplicates, partial, skipped, errors, ttime) = self._import_summary_file(fpdbfile)
@@ -367,9 +459,37 @@ class Importer:
         #      size_per_hand, "inc =", increment, "return:", ret
         return ret
 
+    def startWatcher(self, callback = None):
+        """Have a FileWatcher report changes in the monitored directories instead of
+           polling them in runUpdated. callback is called from the watcher thread when
+           files have changed. Returns False if there is no watcher for this platform"""
+        if self.watcher is None:
+            self.watcher = FileWatcher.get_watcher(self.changedFiles, callback)
+            if self.watcher is None:
+                log.info(_("No file system watcher available, polling import directories"))
+                return False
+            for (site,type) in self.dirlist:
+                self.watcher.addDirectory(self.dirlist[(site,type)][0])
+            self.watcher.start()
+            # the files written before the watcher started, which polling would import
+            # on its next pass, are checked by one full pass on the next runUpdated
+            self.changedFiles.put(None)
+            if callback is not None:
+                callback()
+        return True
+
+    def stopWatcher(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
     #Run import on updated files, then store latest update time. Called from GuiAutoImport.py
     def runUpdated(self):
         """Check for new files in monitored directories"""
+        if self.watcher is not None:
+            self.runQueued()
+            return
+
         for (site,type) in self.dirlist:
             self.addImportDirectory(self.dirlist[(site,type)][0], False, (site,type), self.dirlist[(site,type)][1])
 
@@ -378,19 +498,7 @@ class Importer:
                 stat_info = os.stat(f)
                 if f in self.updatedsize: # we should be able to assume that if we're in size, we're in time as well
                     if stat_info.st_size > self.updatedsize[f] or stat_info.st_mtime > self.updatedtime[f]:
-                        try:
-                            if not os.path.isdir(f):
-                                self.caller.addText("\n"+os.path.basename(f))
-                        except KeyError:
-                            log.error("File '%s' seems to have disappeared" % f)
-                        (stored, duplicates, partial, skipped, errors, ttime) = self._import_despatch(self.filelist[f])
-                        self.logImport('auto', f, stored, duplicates, partial, skipped, errors, ttime, self.filelist[f].fileId)
-                        self.database.commit()
-                        try:
-                            if not os.path.isdir(f): # Note: This assumes that whatever calls us has an "addText" func
-                                self.caller.addText(" %d stored, %d duplicates, %d partial, %d skipped, %d errors (time = %f)" % (stored, duplicates, partial, skipped, errors, ttime))
-                        except KeyError: # TODO: Again, what error happens here? fix when we find out ..
-                            pass
+                        self._import_updated(f)
                         self.updatedsize[f] = stat_info.st_size
                         self.updatedtime[f] = time()
                 else:
@@ -411,6 +519,54 @@ class Importer:
         self.database.rollback()
         self.runPostImport()
 
+    def runQueued(self):
+        """Import the files the watcher reported as changed since the last call"""
+        changed = set()
+        try:
+            while True:
+                changed.add(self.changedFiles.get_nowait())
+        except Queue.Empty:
+            pass
+        if not changed:
+            return
+        if None in changed:
+            # the watcher lost events, check every file
+            watcher, self.watcher = self.watcher, None
+            self.runUpdated()
+            self.watcher = watcher
+            return
+
+        for f in changed:
+            if f not in self.filelist and os.path.isfile(f):
+                self.addImportFile(f, "auto")
+            if f not in self.filelist:
+                continue
+            if os.path.exists(f):
+                self._import_updated(f)
+                self.updatedsize[f] = os.stat(f).st_size
+                self.updatedtime[f] = time()
+            else:
+                del self.filelist[f]
+
+        self.database.rollback()
+        self.runPostImport()
+
+    def _import_updated(self, f):
+        """Import the new hands in the monitored file f"""
+        try:
+            if not os.path.isdir(f):
+                self.caller.addText("\n"+os.path.basename(f))
+        except KeyError:
+            log.error("File '%s' seems to have disappeared" % f)
+        (stored, duplicates, partial, skipped, errors, ttime) = self._import_despatch(self.filelist[f])
+        self.logImport('auto', f, stored, duplicates, partial, skipped, errors, ttime, self.filelist[f].fileId)
+        self.database.commit()
+        try:
+            if not os.path.isdir(f): # Note: This assumes that whatever calls us has an "addText" func
+                self.caller.addText(" %d stored, %d duplicates, %d partial, %d skipped, %d errors (time = %f)" % (stored, duplicates, partial, skipped, errors, ttime))
+        except KeyError: # TODO: Again, what error happens here? fix when we find out ..
+            pass
+
     def _import_hh_file(self, fpdbfile):
         """Function for actual import of a hh file
             This is now an internal function that should not be called directly."""
@@ -426,16 +582,21 @@ class Importer:
         if callable(obj):
             
             if fpdbfile.path in self.pos_in_file:  idx = self.pos_in_file[fpdbfile.path]
-            else: self.pos_in_file[fpdbfile.path], idx = 0, 0
+            elif self.mode == 'auto':
+                # carry on from where the last run of auto import got to
+                idx = self.database.getFileOffset(fpdbfile.fileId)
+            else: idx = 0
                 
             hhc = obj( self.config, in_path = fpdbfile.path, index = idx, autostart=False
                       ,starsArchive = fpdbfile.archive
                       ,ftpArchive   = fpdbfile.archive
                       ,sitename     = fpdbfile.site.name)
             hhc.setAutoPop(self.mode=='auto')
+            batches = []    # (duplicates, first inserted hand) of the batches stored by start()
+            if not self.settings['cacheHHC']:
+                hhc.setHandsConsumer(lambda hands: batches.append(self._store_hand_batch(fpdbfile, hands)), HANDS_BATCH)
             hhc.start()
             
-            self.pos_in_file[file] = hhc.getLastCharacterRead()
             #Tally the results
             partial  = getattr(hhc, 'numPartial')
             skipped  = getattr(hhc, 'numSkipped')
@@ -448,86 +609,18 @@ class Importer:
             if stored > 0:
                 if self.caller: self.progressNotify()
                 handlist = hhc.getProcessedHands()
-                self.database.resetBulkCache(True)
-                self.pos_in_file[fpdbfile.path] = hhc.getLastCharacterRead()
-                (phands, ahands, ihands, to_hud) = ([], [], [], [])
-                self.database.resetBulkCache()
-                
-                ####Lock Placeholder####
-                for hand in handlist:
-                    hand.prepInsert(self.database, printtest = self.settings['testData'])
-                    ahands.append(hand)
-                self.database.commit()
-                ####Lock Placeholder####
-                
-                for hand in ahands:
-                    hand.assembleHand()
-                    phands.append(hand)
-                
-                ####Lock Placeholder####
-                backtrack = False
-                id = self.database.nextHandId()
-                for i in range(len(phands)):
-                    doinsert = len(phands)==i+1
-                    hand = phands[i]
-                    try:
-                        id = hand.getHandId(self.database, id)
-                        hand.updateSessionsCache(self.database, None, doinsert)
-                        hand.insertHands(self.database, fpdbfile.fileId, doinsert, self.settings['testData'])
-                        hand.updateCardsCache(self.database, None, doinsert)
-                        hand.updatePositionsCache(self.database, None, doinsert) 
-                        hand.updateHudCache(self.database, doinsert)
-                        hand.updateTourneyResults(self.database)
-                        ihands.append(hand)
-                        to_hud.append(hand.dbid_hands)
-                    except FpdbHandDuplicate:
-                        duplicates += 1
-                        if (doinsert and ihands): backtrack = True
-                    except:
-                        error_trace = ''
-                        formatted_lines = traceback.format_exc().splitlines()
-                        for line in formatted_lines:
-                            error_trace += line
-                        tmp = hand.handText[0:200]
-                        log.error(_("Importer._import_hh_file: '%r' Fatal error: '%r'") % (file, error_trace))
-                        log.error(_("'%r'") % tmp)
-                        if (doinsert and ihands): backtrack = True
-                    if backtrack: #If last hand in the file is a duplicate this will backtrack and insert the new hand records
-                        hand = ihands[-1]
-                        hp, hero = hand.handsplayers, hand.hero
-                        hand.hero, self.database.hbulk, hand.handsplayers  = 0, self.database.hbulk[:-1], [] #making sure we don't insert data from this hand
-                        hand.updateSessionsCache(self.database, None, doinsert)
-                        hand.insertHands(self.database, fpdbfile.fileId, doinsert, self.settings['testData'])
-                        hand.updateCardsCache(self.database, None, doinsert)
-                        hand.updatePositionsCache(self.database, None, doinsert)
-                        hand.updateHudCache(self.database, doinsert)
-                        hand.handsplayers, hand.hero = hp, hero
-                #log.debug("DEBUG: hand.updateSessionsCache: %s" % (t5tot))
-                #log.debug("DEBUG: hand.insertHands: %s" % (t6tot))
-                #log.debug("DEBUG: hand.updateHudCache: %s" % (t7tot))
-                self.database.commit()
-                ####Lock Placeholder####
-                
-                for i in range(len(ihands)):
-                    doinsert = len(ihands)==i+1
-                    hand = ihands[i]
-                    hand.insertHandsPlayers(self.database, doinsert, self.settings['testData'])
-                    hand.insertHandsActions(self.database, doinsert, self.settings['testData'])
-                    hand.insertHandsStove(self.database, doinsert)
-                self.database.commit()
-
-                #pipe the Hands.id out to the HUD
-                if self.callHud:
-                    for hid in to_hud:
-                        try:
-                            print _("fpdb_import: sending hand to hud"), hid, "pipe =", self.caller.pipe_to_hud
-                            self.caller.pipe_to_hud.stdin.write("%s" % (hid) + os.linesep)
-                        except IOError, e:
-                            log.error(_("Failed to send hand to HUD: %s") % e)
+                if handlist:
+                    batches.append(self._store_hand_batch(fpdbfile, handlist))
+                duplicates = sum([d for (d, first) in batches])
+                ihands = [first for (d, first) in batches if first is not None]
                 # Really ugly hack to allow testing Hands within the HHC from someone
                 # with only an Importer objec
                 if self.settings['cacheHHC']:
                     self.handhistoryconverter = hhc
+            # Remember where the next import of this file starts, the Files row
+            # is committed with the hands by logImport()
+            self.pos_in_file[fpdbfile.path] = hhc.getLastByteRead()
+            self.database.updateFileOffset(fpdbfile.fileId, hhc.getLastByteRead())
         elif (self.mode=='auto'):
             return (0, 0, partial, skipped, errors, time() - ttime)
         
@@ -539,11 +632,148 @@ class Importer:
 
         ttime = time() - ttime
         return (stored, duplicates, partial, skipped, errors, ttime)
+
+    def _import_parsed_hh_file(self, fpdbfile, parsed):
+        """Store the hands of a hh file that was converted by a parse process"""
+
+        (stored, duplicates, partial, skipped, errors, ttime) = (0, 0, 0, 0, 0, time())
+        if parsed['hands'] is None:
+            log.warning(_("Parse process failed for %s, importing it directly: %s") % (fpdbfile.path, parsed['error']))
+            return self._import_hh_file(fpdbfile)
+
+        partial  = parsed['numPartial']
+        skipped  = parsed['numSkipped']
+        errors   = parsed['numErrors']
+        stored   = parsed['numHands'] - errors - partial - skipped
+
+        if stored > 0:
+            if self.caller: self.progressNotify()
+            handlist = cPickle.loads(parsed['hands'])
+            for hand in handlist:
+                hand.config = self.config
+            (duplicates, ihands) = self._store_hands(fpdbfile, handlist, assembled = True)
+            stored -= duplicates
+            if stored>0 and ihands[0].gametype['type']=='tour' and parsed['summaryInFile']:
+                fpdbfile.ftype = "both"
+        # as _import_hh_file, auto import carries on from here
+        self.pos_in_file[fpdbfile.path] = parsed['lastByteRead']
+        self.database.updateFileOffset(fpdbfile.fileId, parsed['lastByteRead'])
+
+        ttime = time() - ttime + parsed['ttime']
+        return (stored, duplicates, partial, skipped, errors, ttime)
+
+    def _store_hand_batch(self, fpdbfile, handlist):
+        """Store some of the hands of a file, returns the duplicates and the first hand
+           inserted, or None, the others are not kept"""
+        (duplicates, ihands) = self._store_hands(fpdbfile, handlist)
+        return (duplicates, ihands[0] if ihands else None)
+
+    def _store_hands(self, fpdbfile, handlist, assembled = False):
+        """Write converted hands to the db, returns (duplicates, inserted hands)
+           assembled: hands already went through assembleHand() in a parse process"""
+        duplicates = 0
+        self.database.resetBulkCache(True)
+        (phands, ahands, ihands, to_hud) = ([], [], [], [])
+        self.database.resetBulkCache()
+
+        # Leave out the hands that are already in the db before doing any work on them
+        publicDB = self.config.get_import_parameters().get("publicDB")
+        keys = [(hand.siteId, hand.handid, hand.getHeroSeat()) for hand in handlist]
+        found = self.database.findDuplicates(keys, publicDB)
+        if found:
+            new = []
+            for hand, (siteId, siteHandNo, heroSeat) in zip(handlist, keys):
+                if self.database.siteHandKey(siteId, siteHandNo, heroSeat, publicDB) in found:
+                    duplicates += 1
+                else:
+                    new.append(hand)
+            handlist = new
+        
+        # Resolve the player ids of the whole file in a few queries
+        self.database.loadPlayerIDs([(p[1], hand.siteId, p[1]==hand.hero) for hand in handlist for p in hand.players])
+
+        ####Lock Placeholder####
+        for hand in handlist:
+            hand.prepInsert(self.database, printtest = self.settings['testData'])
+            ahands.append(hand)
+        self.database.commit()
+        ####Lock Placeholder####
+        
+        for hand in ahands:
+            if not assembled:
+                hand.assembleHand()
+            phands.append(hand)
+        
+        ####Lock Placeholder####
+        backtrack = False
+        id = self.database.nextHandId()
+        for i in range(len(phands)):
+            doinsert = len(phands)==i+1
+            hand = phands[i]
+            try:
+                id = hand.getHandId(self.database, id)
+                hand.updateSessionsCache(self.database, None, doinsert)
+                hand.insertHands(self.database, fpdbfile.fileId, doinsert, self.settings['testData'])
+                hand.updateCardsCache(self.database, None, doinsert)
+                hand.updatePositionsCache(self.database, None, doinsert) 
+                hand.updateHudCache(self.database, doinsert)
+                hand.updateTourneyResults(self.database)
+                ihands.append(hand)
+                to_hud.append(hand.dbid_hands)
+            except FpdbHandDuplicate:
+                duplicates += 1
+                if (doinsert and ihands): backtrack = True
+            except:
+                error_trace = ''
+                formatted_lines = traceback.format_exc().splitlines()
+                for line in formatted_lines:
+                    error_trace += line
+                tmp = hand.handText[0:200]
+                log.error(_("Importer._import_hh_file: '%r' Fatal error: '%r'") % (fpdbfile.path, error_trace))
+                log.error(_("'%r'") % tmp)
+                if (doinsert and ihands): backtrack = True
+            if backtrack: #If last hand in the file is a duplicate this will backtrack and insert the new hand records
+                hand = ihands[-1]
+                hp, hero = hand.handsplayers, hand.hero
+                hand.hero, self.database.hbulk, hand.handsplayers  = 0, self.database.hbulk[:-1], [] #making sure we don't insert data from this hand
+                hand.updateSessionsCache(self.database, None, doinsert)
+                hand.insertHands(self.database, fpdbfile.fileId, doinsert, self.settings['testData'])
+                hand.updateCardsCache(self.database, None, doinsert)
+                hand.updatePositionsCache(self.database, None, doinsert)
+                hand.updateHudCache(self.database, doinsert)
+                hand.handsplayers, hand.hero = hp, hero
+        #log.debug("DEBUG: hand.updateSessionsCache: %s" % (t5tot))
+        #log.debug("DEBUG: hand.insertHands: %s" % (t6tot))
+        #log.debug("DEBUG: hand.updateHudCache: %s" % (t7tot))
+        self.database.commit()
+        ####Lock Placeholder####
+        
+        for i in range(len(ihands)):
+            doinsert = len(ihands)==i+1
+            hand = ihands[i]
+            hand.insertHandsPlayers(self.database, doinsert, self.settings['testData'])
+            hand.insertHandsActions(self.database, doinsert, self.settings['testData'])
+            hand.insertHandsStove(self.database, doinsert)
+        self.database.commit()
+
+        #pipe the Hands.id out to the HUD, with what it would read about the hands from the db
+        if self.callHud and getattr(self.caller, 'hud_server', None) is not None:
+            self.caller.hud_server.send_hands([HudChannel.hand_payload(hand) for hand in ihands])
+        elif self.callHud:
+            for hid in to_hud:
+                try:
+                    print _("fpdb_import: sending hand to hud"), hid, "pipe =", self.caller.pipe_to_hud
+                    self.caller.pipe_to_hud.stdin.write("%s" % (hid) + os.linesep)
+                except IOError, e:
+                    log.error(_("Failed to send hand to HUD: %s") % e)
+        return (duplicates, ihands)
     
     def autoSummaryGrab(self, force = False):
         for f, fpdbfile in self.filelist.items():
+            if fpdbfile.ftype != "both":
+                continue
             stat_info = os.stat(f)
-            if ((time() - stat_info.st_mtime)> 300 or force) and fpdbfile.ftype == "both":
+            if (time() - stat_info.st_mtime)> 300 or force:
                 self._import_summary_file(fpdbfile)
                 fpdbfile.ftype = "hh"
 
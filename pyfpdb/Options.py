@@ -78,6 +78,10 @@ def fpdb_options():
                       help=_("Start Minimized"))
     parser.add_option("--hidden", action="store_true", dest="hidden",
                       help=_("Start Hidden"))
+    parser.add_option("--hudport", dest="hudport", default=None, type="int",
+                      help=_("Port to read the imported hands from instead of stdin (HUD only)"))
+    parser.add_option("--hudtoken", dest="hudtoken", default=None,
+                      help=_("Token the importer gave for --hudport (HUD only)"))
 
 
     (options, argv) = parser.parse_args()
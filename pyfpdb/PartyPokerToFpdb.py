@@ -187,6 +187,11 @@ class PartyPoker(HandHistoryConverter):
             return []
         return filter(lambda text: len(text.strip()), list)
 
+    def iterHands(self):
+        for text in HandHistoryConverter.iterHands(self):
+            if len(text.strip()):
+                yield text
+
     def compilePlayerRegexs(self,  hand):
         players = set([player[1] for player in hand.players])
         if not players <= self.compiledPlayers: # x <= y means 'x is subset of y'
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Exact equities of two hold'em hands all-in preflop, read from a table.
+
+The table (preflop_equity.bin, made by ScriptPreflopEquity.py) has the wins and
+ties of the first hand over all 1712304 boards, for each of the 47008 matchups
+left once the suits are renamed away, see matchup_key. It is a header, then
+(key, wins, ties) records sorted by key, all little endian unsigned 32 bit ints.
+The file is memory-mapped and searched in place."""
+
+import L10n
+_ = L10n.get_translation()
+
+import os
+import mmap
+import struct
+import logging
+from itertools import permutations
+
+from decimal_wrapper import Decimal
+import Configuration
+
+log = logging.getLogger("parser")
+
+FILE_NAME = 'preflop_equity.bin'
+MAGIC = 'FPDBPFEQ'
+HEADER = struct.Struct('<8sII')     # magic, number of records, boards per matchup
+RECORD = struct.Struct('<III')      # key, wins of the first hand, ties
+BOARDS = 1712304                    # 48 choose 5
+
+RANKS = '23456789TJQKA'
+SUITS = 'shdc'
+SUIT_PERMUTATIONS = list(permutations(range(4)))
+
+
+def card_index(card):
+    """0..51 for a card string like 'Ah', rank * 4 + suit"""
+    return RANKS.index(card[0]) * 4 + SUITS.index(card[1])
+
+def card_string(index):
+    return RANKS[index >> 2] + SUITS[index & 3]
+
+def matchup_key(hand1, hand2):
+    """(key, swapped) of the matchup of two hands of card indexes: the smallest of the
+       keys of the matchup with its suits renamed either way, hands in either order.
+       swapped means the key has hand2 first"""
+    best = None
+    for perm in SUIT_PERMUTATIONS:
+        (a1, a2) = sorted([(c & ~3) | perm[c & 3] for c in hand1], reverse=True)
+        (b1, b2) = sorted([(c & ~3) | perm[c & 3] for c in hand2], reverse=True)
+        for key in ((a1 << 18 | a2 << 12 | b1 << 6 | b2, False), (b1 << 18 | b2 << 12 | a1 << 6 | a2, True)):
+            if best is None or key < best:
+                best = key
+    return best
+
+def matchups():
+    """The sorted keys of all the matchups"""
+    keys = set()
+    holes = [(c1, c2) for c1 in range(52) for c2 in range(c1 + 1, 52)]
+    for (i, hand1) in enumerate(holes):
+        for hand2 in holes[i + 1:]:
+            if hand2[0] not in hand1 and hand2[1] not in hand1:
+                keys.add(matchup_key(hand1, hand2)[0])
+    return sorted(keys)
+
+
+class EquityTable:
+    """The memory-mapped table, lookup gives the counts of a matchup"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.count, boards) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or boards != BOARDS or len(self.map) != HEADER.size + self.count * RECORD.size:
+            raise ValueError(_("%s is not a preflop equity table") % path)
+
+    def lookup(self, key):
+        """(wins, ties) of the first hand of the matchup of key"""
+        (lo, hi) = (0, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (found, wins, ties) = RECORD.unpack_from(self.map, HEADER.size + mid * RECORD.size)
+            if found == key:
+                return (wins, ties)
+            if found < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        raise KeyError(key)
+
+
+_table = None
+
+def get_table():
+    """The EquityTable, None if there is no usable table file"""
+    global _table
+    if _table is None:
+        _table = False
+        for path in (os.path.dirname(os.path.abspath(__file__)), Configuration.PYFPDB_PATH, '/usr/share/python-fpdb'):
+            path = os.path.join(path, FILE_NAME)
+            if os.path.exists(path):
+                try:
+                    _table = EquityTable(path)
+                    break
+                except (IOError, ValueError, struct.error, mmap.error), e:
+                    log.error(_("Could not read the preflop equity table: %s") % e)
+    return _table or None
+
+def equities(hand1, hand2):
+    """The equities in per mille of two hold'em hands all-in preflop, as the 'ev'
+       of pokereval.poker_eval but exact, None without the table"""
+    table = get_table()
+    if table is None:
+        return None
+    (key, swapped) = matchup_key([card_index(c) for c in hand1], [card_index(c) for c in hand2])
+    (wins, ties) = table.lookup(key)
+    first = Decimal(1000 * (2 * wins + ties)) / (2 * BOARDS)
+    if swapped:
+        return [1000 - first, first]
+    return [first, 1000 - first]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Queries of the gui tabs run off the gui thread.
+
+A tab gives its QueryRunner the queries of a refresh. They run one after the
+other on a thread of the global QThreadPool, on that thread's read connection
+(see Database.ReadPool), and their rows come back QUERY_CHUNK at a time through
+the rows signal, so the gui keeps responding while the db works. Running new
+queries cancels the ones still running: the server stops the query (sqlite3
+interrupt, pg_cancel_backend, KILL QUERY) and nothing more of it is emitted.
+
+The rows of queries run to the end are kept in the ResultCache, until hands are
+imported: running the same queries again, as a tab refreshed with the same filters
+does, emits those rows without going to the db."""
+
+import L10n
+_ = L10n.get_translation()
+
+import logging
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import Database
+import ResultCache
+
+log = logging.getLogger("db")
+
+QUERY_CHUNK = 2000  # rows emitted at a time
+
+
+class QueryRunner(QObject):
+    """Runs the queries of a tab, a job at a time.
+
+    rows is emitted with (job, query index, column names, rows) for every chunk of
+    rows of a query, then once with no rows when the query is done. done is emitted
+    with the job once all its queries are, failed with (job, error message) instead
+    if one fails. Nothing is emitted for a cancelled job."""
+    rows = pyqtSignal(int, int, object, object)
+    done = pyqtSignal(int)
+    failed = pyqtSignal(int, object)
+    ended = pyqtSignal(int)     # the run of a job returned, cancelled or not
+
+    def __init__(self, config, parent=None):
+        QObject.__init__(self, parent)
+        self.config = config
+        self.job = 0            # number of the last job
+        self.running = None     # QueryJob of the last job, until it is done or cancelled
+        self.cancelled = {}     # job number -> QueryJob cancelled while a pool thread runs it
+        self.cache = ResultCache.result_cache(config)    # None if results are not cached
+        self.ended.connect(self.drop)
+
+    def run(self, queries):
+        """Run queries, cancelling the ones still running, returns the job number"""
+        self.cancel()
+        self.job += 1
+        key = (Database.read_pool.key(self.config), tuple(queries))
+        # read before the job's connection sees the db, rows of an older generation are not kept
+        generation = ResultCache.import_generation(self.config)
+        cached = self.cache.get(key) if self.cache is not None else None
+        self.running = QueryJob(self, self.job, queries, key, generation, cached)
+        QThreadPool.globalInstance().start(self.running)
+        return self.job
+
+    def cancel(self):
+        """Cancel the running job, if any"""
+        if self.running is not None:
+            self.running.cancel()
+            if not QThreadPool.globalInstance().tryTake(self.running):
+                # started, the pool holds no reference to it, keep it until its run returns
+                self.cancelled[self.running.job] = self.running
+            self.running = None
+
+    def drop(self, job):
+        """Forget a cancelled job whose run returned"""
+        self.cancelled.pop(job, None)
+
+    def current(self, job):
+        """Whether job is the last one and was not cancelled, the slots ignore the others"""
+        return job == self.job and self.running is not None
+
+
+class QueryJob(QRunnable):
+    """The queries of a job, run by a thread of the pool, or their cached rows"""
+
+    def __init__(self, runner, job, queries, key, generation, cached=None):
+        QRunnable.__init__(self)
+        self.setAutoDelete(False)   # the runner keeps it to cancel it
+        self.runner = runner
+        self.job = job
+        self.queries = queries
+        self.key = key              # of the rows in the runner's cache
+        self.generation = generation  # import generation before the queries ran
+        self.cached = cached        # the rows of each query, if the cache had them
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.db = None              # the connection while the queries run
+
+    def run(self):
+        try:
+            if self.cached is not None:
+                self.emit_cached()
+            else:
+                self.run_queries()
+        finally:
+            self.runner.ended.emit(self.job)
+
+    def run_queries(self):
+        db = Database.read_connection(self.runner.config)
+        with self.lock:
+            if self.cancelled:
+                Database.release_read_connection()
+                return
+            self.db = db
+        try:
+            results = []
+            for (index, query) in enumerate(self.queries):
+                c = self.db.get_cursor()
+                c.execute(query)
+                colnames = [desc[0].lower() for desc in c.description or ()]
+                results.append((colnames, []))
+                while 1:
+                    rows = c.fetchmany(QUERY_CHUNK)
+                    if self.cancelled:
+                        return
+                    results[-1][1].extend(rows)
+                    self.runner.rows.emit(self.job, index, colnames, rows)
+                    if not rows:
+                        break
+            if not self.cancelled:
+                if self.runner.cache is not None:
+                    self.runner.cache.put(self.key, results, self.generation)
+                self.runner.done.emit(self.job)
+        except Exception, e:
+            if not self.cancelled:
+                log.error(_("Query failed: %s") % e)
+                self.runner.failed.emit(self.job, unicode(e))
+        finally:
+            with self.lock:
+                self.db = None
+            Database.release_read_connection()
+
+    def emit_cached(self):
+        for (index, (colnames, rows)) in enumerate(self.cached):
+            for start in xrange(0, len(rows), QUERY_CHUNK):
+                if self.cancelled:
+                    return
+                self.runner.rows.emit(self.job, index, colnames, rows[start:start+QUERY_CHUNK])
+            self.runner.rows.emit(self.job, index, colnames, [])
+        if not self.cancelled:
+            self.runner.done.emit(self.job)
+
+    def cancel(self):
+        """Stop the job, from the gui thread"""
+        with self.lock:
+            self.cancelled = True
+            if self.db is not None:
+                try:
+                    self.db.interrupt()
+                except Exception, e:
+                    log.error(_("Could not cancel the query: %s") % e)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Equity of a hold'em hand against a range, all the combos of the range at once.
+
+The range becomes an array of the card numbers of its combos, less the ones the
+hand or the board block. With a flop or more every runout of the board is dealt
+and the counts are exact. Preflop the boards are drawn from a random generator
+seeded with seed, in batches of BATCH_BOARDS, until the 95% confidence interval
+of the equity is within precision or max_boards boards are drawn, so the same
+query always gives the same answer. The batches are evaluated by a process pool.
+
+Needs NumPy, the hands are ranked by HandEvaluator.hi_classes."""
+
+import L10n
+_ = L10n.get_translation()
+
+import multiprocessing
+from itertools import combinations, imap
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import HandEvaluator
+
+SEED = 1
+PRECISION = 0.002       # half width of the confidence interval preflop, 0.2% equity
+MAX_BOARDS = 200000     # boards drawn preflop at most
+MIN_BATCHES = 2         # batches drawn preflop before looking at the interval
+BATCH_BOARDS = 2000     # boards of a task given to the pool
+BATCH_ROWS = 1 << 20    # hands ranked in one go, bounds the memory used
+Z95 = 1.96
+
+_pokereval = HandEvaluator.PokerEval()
+
+
+class Result:
+    """The counts of hero against each combo: combos is an array of the (card, card)
+       of the combos, wins, ties and losses arrays of the counts of hero against each.
+       interval is the half width of the 95% confidence interval of the equity, None
+       when the counts are exact"""
+
+    def __init__(self, combos, wins, ties, losses, boards, interval):
+        self.combos = combos
+        self.wins = wins
+        self.ties = ties
+        self.losses = losses
+        self.boards = boards
+        self.interval = interval
+
+    def totals(self):
+        """(plays, wins, ties, losses) over the whole range"""
+        (wins, ties, losses) = (int(self.wins.sum()), int(self.ties.sum()), int(self.losses.sum()))
+        return (wins + ties + losses, wins, ties, losses)
+
+
+def combo_array(hands, known):
+    """Array of the card numbers of hands, pairs of card strings, without duplicates and
+       without those holding a card of known"""
+    found = set()
+    for hand in hands:
+        pair = tuple(sorted(_pokereval.string2card(list(hand))))
+        if pair[0] != pair[1] and not known.intersection(pair):
+            found.add(pair)
+    return numpy.array(sorted(found), numpy.int32).reshape(len(found), 2)
+
+def range_equity(hero, board, hands, processes=None, seed=SEED, precision=PRECISION, max_boards=MAX_BOARDS):
+    """The Result of hero, two card strings, against hands, pairs of card strings, on
+       board, 0 or 3 to 5 card strings. processes defaults to the number of cpus, the
+       workers are forked, so a gui calls with processes=1"""
+    hero = _pokereval.string2card(list(hero))
+    board = _pokereval.string2card(list(board))
+    known = set(hero + board)
+    combos = combo_array(hands, known)
+    deck = numpy.array([c for c in range(52) if c not in known], numpy.int32)
+    need = 5 - len(board)
+    if board:
+        runouts = list(combinations(deck, need))
+        runouts = numpy.array(runouts, numpy.int32).reshape(len(runouts), need)
+        tasks = [(hero, board, combos, runouts[start:start + BATCH_BOARDS])
+                 for start in range(0, len(runouts), BATCH_BOARDS)]
+        enough = lambda total: False
+    else:
+        tasks = _sampled_tasks(hero, combos, deck, seed, max_boards)
+        enough = lambda total: (total[3] >= MIN_BATCHES * BATCH_BOARDS
+                                and _interval(total) <= precision)
+
+    if not len(combos):
+        tasks = tasks[:1]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    total = None
+    HandEvaluator.tables().numpy_arrays(7)  # made once, before the workers are forked
+    if processes > 1 and len(tasks) > 1 and len(combos):
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        results = pool.imap(_count, tasks)
+    else:
+        pool = None
+        results = imap(_count, tasks)
+    try:
+        for result in results:
+            total = result if total is None else [a + b for (a, b) in zip(total, result)]
+            if enough(total):
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    (wins, ties, losses, boards) = total[:4]
+    return Result(combos, wins, ties, losses, boards, None if board else _interval(total))
+
+def _sampled_tasks(hero, combos, deck, seed, max_boards):
+    """Tasks of random boards, drawn in order so that they only depend on seed"""
+    random = numpy.random.RandomState(seed)
+    tasks = []
+    for start in range(0, max_boards, BATCH_BOARDS):
+        size = min(BATCH_BOARDS, max_boards - start)
+        order = random.random_sample((size, len(deck))).argsort(axis=1)
+        tasks.append((hero, [], combos, deck[order[:, :5]]))
+    return tasks
+
+def _interval(total):
+    """Half width of the 95% confidence interval of the equity, from the mean equity
+       against the range on each board, the boards being independent"""
+    (boards, equity, squares) = total[3:]
+    if boards < 2:
+        return 1.0
+    mean = equity / boards
+    variance = max(squares / boards - mean * mean, 0.0) * boards / (boards - 1)
+    return Z95 * (variance / boards) ** 0.5
+
+def _count(task):
+    """[wins, ties, losses] arrays of hero against each combo of the task, then the number
+       of boards, the sum and the sum of squares of hero's mean equity on each board"""
+    (hero, board, combos, runouts) = task
+    n = len(runouts)
+    boards = numpy.hstack((numpy.tile(numpy.array(board, numpy.int32), (n, 1)), runouts))
+    hero_classes = HandEvaluator.hi_classes(numpy.hstack((numpy.tile(numpy.array(hero, numpy.int32), (n, 1)), boards)))
+    (wins, ties, losses) = [numpy.zeros(len(combos), numpy.int64) for i in range(3)]
+    (equity, valid) = (numpy.zeros(n), numpy.zeros(n))
+    step = max(1, BATCH_ROWS // max(n, 1))
+    for start in range(0, len(combos), step):
+        chunk = combos[start:start + step]
+        # boards holding a card of the combo are not dealt against it
+        dealt = ~(boards[numpy.newaxis, :, :, numpy.newaxis] == chunk[:, numpy.newaxis, numpy.newaxis, :]).any(axis=3).any(axis=2)
+        cards = numpy.hstack((numpy.repeat(chunk, n, axis=0), numpy.tile(boards, (len(chunk), 1))))
+        classes = numpy.zeros(len(cards), numpy.int32)
+        classes[dealt.ravel()] = HandEvaluator.hi_classes(cards[dealt.ravel()])
+        classes = classes.reshape(len(chunk), n)
+        won = dealt & (hero_classes > classes)
+        tied = dealt & (hero_classes == classes)
+        wins[start:start + step] = won.sum(axis=1)
+        ties[start:start + step] = tied.sum(axis=1)
+        losses[start:start + step] = (dealt & (hero_classes < classes)).sum(axis=1)
+        equity += won.sum(axis=0) + 0.5 * tied.sum(axis=0)
+        valid += dealt.sum(axis=0)
+    equity = equity[valid > 0] / valid[valid > 0]
+    return [wins, ties, losses, len(equity), float(equity.sum()), float((equity * equity).sum())]
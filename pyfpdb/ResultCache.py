@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Results of the gui tabs' queries, kept until new hands are imported.
+
+The queries of a refresh are built from the filters only, so the same filters give
+the same queries, and while no hands are imported the same rows. A ResultCache keeps
+the rows of the last queries run, in memory and in a file next to the database, the
+least recently used dropped first. The importer bumps the import generation, a
+counter in a file of the config's database directory, after it commits new hands or
+rebuilds the caches: a cache whose rows are from an older generation is emptied before
+it is read. The counter is only seen by the programs sharing the directory, so results
+are only cached for a sqlite database, which no other machine imports into."""
+
+import L10n
+_ = L10n.get_translation()
+
+import cPickle
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import Configuration
+
+log = logging.getLogger("db")
+
+RESULT_CACHE_SIZE = 32          # results kept, least recently used dropped first
+RESULT_CACHE_ROWS = 500000      # rows kept over all results
+RESULT_CACHE_SAVE_ROWS = 100000 # the file is not rewritten while more rows are kept
+RESULT_CACHE_FILE = u'results.cache'
+GENERATION_FILE   = u'import.generation'
+
+
+def generation_path(config):
+    return os.path.join(config.dir_database, GENERATION_FILE)
+
+def import_generation(config):
+    """The import generation of config's database, 0 until the first import"""
+    try:
+        with open(generation_path(config)) as f:
+            return int(f.read().strip() or 0)
+    except (IOError, ValueError):
+        return 0
+
+def bump_import_generation(config):
+    """Start a new import generation, called once new hands are committed or the caches
+       rebuilt"""
+    generation = import_generation(config) + 1
+    try:
+        if not os.path.isdir(config.dir_database):
+            os.makedirs(config.dir_database)
+        with open(generation_path(config), 'w') as f:
+            f.write("%d\n" % generation)
+    except (IOError, OSError), e:
+        log.error(_("Could not write the import generation: %s") % e)
+    return generation
+
+
+class ResultCache(object):
+    """The rows of queries, by key, for the current import generation"""
+
+    def __init__(self, config, size=RESULT_CACHE_SIZE, maxrows=RESULT_CACHE_ROWS):
+        self.config = config
+        self.size = size
+        self.maxrows = maxrows
+        self.path = os.path.join(config.dir_database, RESULT_CACHE_FILE)
+        self.lock = threading.Lock()
+        self.generation = None      # import generation of the results, None until loaded
+        self.results = OrderedDict()  # key -> results, least recently used first
+        self.rows = 0               # rows of all the results
+        self.changes = 0            # number of the last change of the results
+        self.save_lock = threading.Lock()
+        self.saved = 0              # number of the change in the file
+
+    def get(self, key):
+        """The results stored for key, None if there are none or they are out of date"""
+        with self.lock:
+            self._check_generation()
+            results = self.results.pop(key, None)
+            if results is not None:
+                self.results[key] = results
+            return results
+
+    def put(self, key, results, generation):
+        """Store results, the (column names, rows) of each query, for key. generation is
+           the import generation read before the queries ran: if hands were imported
+           since, the results may be older than the generation's and are dropped"""
+        rows = count_rows(results)
+        if rows > self.maxrows:
+            return
+        with self.lock:
+            self._check_generation()
+            if generation != self.generation:
+                return
+            old = self.results.pop(key, None)
+            if old is not None:
+                self.rows -= count_rows(old)
+            self.results[key] = results
+            self.rows += rows
+            while len(self.results) > self.size or self.rows > self.maxrows:
+                (k, old) = self.results.popitem(last=False)
+                self.rows -= count_rows(old)
+            self.changes += 1
+            if self.rows > RESULT_CACHE_SAVE_ROWS:
+                return      # the file keeps fewer results, of the same generation
+            save = (self.changes, self.generation, OrderedDict(self.results))
+        self._save(*save)
+
+    def _check_generation(self):
+        """Load the results the first time, drop them when hands were imported since"""
+        generation = import_generation(self.config)
+        if self.generation is None:
+            self._load(generation)
+        elif generation != self.generation:
+            self.generation = generation
+            self.results.clear()
+            self.rows = 0
+
+    def _load(self, generation):
+        self.generation = generation
+        try:
+            with open(self.path, 'rb') as f:
+                (saved, results) = cPickle.load(f)
+        except IOError:
+            return
+        except Exception, e:
+            log.warning(_("Could not read the results cache: %s") % e)
+            return
+        if saved == generation:
+            self.results = results
+            self.rows = sum([count_rows(r) for r in results.itervalues()])
+
+    def _save(self, change, generation, results):
+        """Write the results as they were at change, outside the lock so that get does
+           not wait, to a temporary file renamed over the cache file"""
+        with self.save_lock:
+            if change < self.saved:
+                return      # a later change is written already
+            temp = self.path + u'.tmp'
+            try:
+                if not os.path.isdir(self.config.dir_database):
+                    os.makedirs(self.config.dir_database)
+                with open(temp, 'wb') as f:
+                    cPickle.dump((generation, results), f, cPickle.HIGHEST_PROTOCOL)
+                if os.name == 'nt' and os.path.exists(self.path):
+                    os.remove(self.path)    # rename does not replace a file on windows
+                os.rename(temp, self.path)
+                self.saved = change
+            except Exception, e:
+                log.error(_("Could not write the results cache: %s") % e)
+
+def count_rows(results):
+    return sum([len(rows) for (colnames, rows) in results])
+
+
+result_caches = {}  # the ResultCache of each database directory
+caches_lock = threading.Lock()
+
+def result_cache(config):
+    """The ResultCache of config's database directory, shared by the tabs, None if
+       the database is on a server"""
+    if config.get_db_parameters()['db-server'] != Configuration.DATABASE_TYPE_SQLITE:
+        return None
+    with caches_lock:
+        if config.dir_database not in result_caches:
+            result_caches[config.dir_database] = ResultCache(config)
+        return result_caches[config.dir_database]
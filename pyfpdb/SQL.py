@@ -81,6 +81,22 @@ class Sql:
         elif db_server == 'sqlite':
             self.query['set tx level'] = """ """
 
+        # the read connections of Database.ReadPool: the queries of a transaction see
+        # the db as it was at its first query, and the connection cannot write. PostgreSQL
+        # connections are set with psycopg2's set_session
+        if db_server == 'mysql':
+            self.query['set tx read only'] = """SET SESSION TRANSACTION
+            ISOLATION LEVEL REPEATABLE READ, READ ONLY"""
+        elif db_server == 'sqlite':
+            self.query['set tx read only'] = """PRAGMA query_only = 1"""
+
+        # stops the query running on the connection of a server process or thread id, see
+        # Database.interrupt, sqlite has sqlite3.Connection.interrupt instead
+        if db_server == 'mysql':
+            self.query['cancel query'] = """KILL QUERY %s"""
+        elif db_server == 'postgresql':
+            self.query['cancel query'] = """SELECT pg_cancel_backend(%s)"""
+
 
         ################################
         # Select basic info
@@ -1538,7 +1554,8 @@ class Sql:
                         skipped INT,
                         errs INT,
                         ttime100 INT,
-                        finished BOOLEAN)
+                        finished BOOLEAN,
+                        byteOffset BIGINT)
                         ENGINE=INNODB"""
         elif db_server == 'postgresql':
             self.query['createFilesTable'] = """CREATE TABLE Files (
@@ -1556,7 +1573,8 @@ class Sql:
                         skipped INT,
                         errs INT,
                         ttime100 INT,
-                        finished BOOLEAN)"""
+                        finished BOOLEAN,
+                        byteOffset BIGINT)"""
         elif db_server == 'sqlite':
             self.query['createFilesTable'] = """CREATE TABLE Files (
                         id INTEGER PRIMARY KEY,
@@ -1573,7 +1591,8 @@ class Sql:
                         skipped INT,
                         errs INT,
                         ttime100 INT,
-                        finished BOOLEAN
+                        finished BOOLEAN,
+                        byteOffset INT
                         )""" 
 
         ################################
@@ -3951,6 +3970,11 @@ class Sql:
                 #  where %s is the number of active players at the current table (and
                 #  1.25 would be a config value so user could change it)
 
+        # get_stats_from_hand_aggregated along with the highest hand id, read by the same statement
+        # so it tells which hands the HudCache totals include, for seeding the HUD stat store
+        self.query['get_stats_from_hand_seed'] = self.query['get_stats_from_hand_aggregated'].replace(
+                "SELECT hc.playerId ", "SELECT (SELECT max(id) FROM Hands) AS max_hand, hc.playerId ", 1)
+
         if db_server == 'mysql':
             self.query['get_stats_from_hand_session'] = """
                     SELECT hp.playerId                                              AS player_id, /* playerId and seats must */
@@ -4329,6 +4353,147 @@ class Sql:
                        the session */
                 """
      
+        # rows of HandsPlayers of hands after the first %s up to the second one, with the columns
+        # of get_stats_from_hand_aggregated, which the HUD stat store adds to the stats it has
+        self.query['get_stats_from_hands_delta'] = """
+                    SELECT hp.handId                                                AS hand_id,
+                           h.gametypeId                                             AS gametype_id,
+                           gt.siteId                                                AS site_id,
+                           gt.type                                                  AS type,
+                           gt.category                                              AS category,
+                           gt.limitType                                             AS limittype,
+                           h.startTime                                              AS start_time,
+                           h.seats                                                  AS seats,
+                           h.fileId                                                 AS file_id,
+                           hp.playerId                                              AS player_id,
+                           hp.seatNo                                                AS seat,
+                           p.name                                                   AS screen_name,
+                           hp.startCards                                            AS startcards,
+                           hp.position                                              AS position,
+                           1                                                        AS n,
+                           cast(hp.street0VPIChance as <signed>integer)             AS vpip_opp,
+                           cast(hp.street0VPI as <signed>integer)                   AS vpip,
+                           cast(hp.street0AggrChance as <signed>integer)            AS pfr_opp,
+                           cast(hp.street0Aggr as <signed>integer)                  AS pfr,
+                           cast(hp.street0CalledRaiseChance as <signed>integer)     AS CAR_opp_0,
+                           cast(hp.street0CalledRaiseDone as <signed>integer)       AS CAR_0,
+                           cast(hp.street0_3BChance as <signed>integer)             AS TB_opp_0,
+                           cast(hp.street0_3BDone as <signed>integer)               AS TB_0,
+                           cast(hp.street0_4BChance as <signed>integer)             AS FB_opp_0,
+                           cast(hp.street0_4BDone as <signed>integer)               AS FB_0,
+                           cast(hp.street0_C4BChance as <signed>integer)            AS CFB_opp_0,
+                           cast(hp.street0_C4BDone as <signed>integer)              AS CFB_0,
+                           cast(hp.street0_FoldTo3BChance as <signed>integer)       AS F3B_opp_0,
+                           cast(hp.street0_FoldTo3BDone as <signed>integer)         AS F3B_0,
+                           cast(hp.street0_FoldTo4BChance as <signed>integer)       AS F4B_opp_0,
+                           cast(hp.street0_FoldTo4BDone as <signed>integer)         AS F4B_0,
+                           cast(hp.street0_SqueezeChance as <signed>integer)        AS SQZ_opp_0,
+                           cast(hp.street0_SqueezeDone as <signed>integer)          AS SQZ_0,
+                           cast(hp.raiseToStealChance as <signed>integer)           AS RTS_opp,
+                           cast(hp.raiseToStealDone as <signed>integer)             AS RTS,
+                           cast(hp.success_Steal as <signed>integer)                AS SUC_ST,
+                           cast(hp.street1Seen as <signed>integer)                  AS saw_f,
+                           cast(hp.street1Seen as <signed>integer)                  AS saw_1,
+                           cast(hp.street2Seen as <signed>integer)                  AS saw_2,
+                           cast(hp.street3Seen as <signed>integer)                  AS saw_3,
+                           cast(hp.street4Seen as <signed>integer)                  AS saw_4,
+                           cast(hp.sawShowdown as <signed>integer)                  AS sd,
+                           cast(hp.street1Aggr as <signed>integer)                  AS aggr_1,
+                           cast(hp.street2Aggr as <signed>integer)                  AS aggr_2,
+                           cast(hp.street3Aggr as <signed>integer)                  AS aggr_3,
+                           cast(hp.street4Aggr as <signed>integer)                  AS aggr_4,
+                           cast(hp.otherRaisedStreet1 as <signed>integer)           AS was_raised_1,
+                           cast(hp.otherRaisedStreet2 as <signed>integer)           AS was_raised_2,
+                           cast(hp.otherRaisedStreet3 as <signed>integer)           AS was_raised_3,
+                           cast(hp.otherRaisedStreet4 as <signed>integer)           AS was_raised_4,
+                           cast(hp.foldToOtherRaisedStreet1 as <signed>integer)     AS f_freq_1,
+                           cast(hp.foldToOtherRaisedStreet2 as <signed>integer)     AS f_freq_2,
+                           cast(hp.foldToOtherRaisedStreet3 as <signed>integer)     AS f_freq_3,
+                           cast(hp.foldToOtherRaisedStreet4 as <signed>integer)     AS f_freq_4,
+                           cast(hp.wonWhenSeenStreet1 as <signed>integer)           AS w_w_s_1,
+                           cast(hp.wonAtSD as <signed>integer)                      AS wmsd,
+                           cast(hp.stealChance as <signed>integer)                  AS steal_opp,
+                           cast(hp.stealDone as <signed>integer)                    AS steal,
+                           cast(hp.foldSbToStealChance as <signed>integer)          AS SBstolen,
+                           cast(hp.foldedSbToSteal as <signed>integer)              AS SBnotDef,
+                           cast(hp.foldBbToStealChance as <signed>integer)          AS BBstolen,
+                           cast(hp.foldedBbToSteal as <signed>integer)              AS BBnotDef,
+                           cast(hp.street1CBChance as <signed>integer)              AS CB_opp_1,
+                           cast(hp.street1CBDone as <signed>integer)                AS CB_1,
+                           cast(hp.street2CBChance as <signed>integer)              AS CB_opp_2,
+                           cast(hp.street2CBDone as <signed>integer)                AS CB_2,
+                           cast(hp.street3CBChance as <signed>integer)              AS CB_opp_3,
+                           cast(hp.street3CBDone as <signed>integer)                AS CB_3,
+                           cast(hp.street4CBChance as <signed>integer)              AS CB_opp_4,
+                           cast(hp.street4CBDone as <signed>integer)                AS CB_4,
+                           cast(hp.foldToStreet1CBChance as <signed>integer)        AS f_cb_opp_1,
+                           cast(hp.foldToStreet1CBDone as <signed>integer)          AS f_cb_1,
+                           cast(hp.foldToStreet2CBChance as <signed>integer)        AS f_cb_opp_2,
+                           cast(hp.foldToStreet2CBDone as <signed>integer)          AS f_cb_2,
+                           cast(hp.foldToStreet3CBChance as <signed>integer)        AS f_cb_opp_3,
+                           cast(hp.foldToStreet3CBDone as <signed>integer)          AS f_cb_3,
+                           cast(hp.foldToStreet4CBChance as <signed>integer)        AS f_cb_opp_4,
+                           cast(hp.foldToStreet4CBDone as <signed>integer)          AS f_cb_4,
+                           cast(hp.totalProfit as <signed>integer)                  AS net,
+                           cast(gt.bigblind as <signed>integer)                     AS bigblind,
+                           cast(hp.street1CheckCallRaiseChance as <signed>integer)  AS ccr_opp_1,
+                           cast(hp.street1CheckCallDone as <signed>integer)         AS cc_1,
+                           cast(hp.street1CheckRaiseDone as <signed>integer)        AS cr_1,
+                           cast(hp.street2CheckCallRaiseChance as <signed>integer)  AS ccr_opp_2,
+                           cast(hp.street2CheckCallDone as <signed>integer)         AS cc_2,
+                           cast(hp.street2CheckRaiseDone as <signed>integer)        AS cr_2,
+                           cast(hp.street3CheckCallRaiseChance as <signed>integer)  AS ccr_opp_3,
+                           cast(hp.street3CheckCallDone as <signed>integer)         AS cc_3,
+                           cast(hp.street3CheckRaiseDone as <signed>integer)        AS cr_3,
+                           cast(hp.street4CheckCallRaiseChance as <signed>integer)  AS ccr_opp_4,
+                           cast(hp.street4CheckCallDone as <signed>integer)         AS cc_4,
+                           cast(hp.street4CheckRaiseDone as <signed>integer)        AS cr_4,
+                           cast(hp.street0Calls as <signed>integer)                 AS call_0,
+                           cast(hp.street1Calls as <signed>integer)                 AS call_1,
+                           cast(hp.street2Calls as <signed>integer)                 AS call_2,
+                           cast(hp.street3Calls as <signed>integer)                 AS call_3,
+                           cast(hp.street4Calls as <signed>integer)                 AS call_4,
+                           cast(hp.street0Bets as <signed>integer)                  AS bet_0,
+                           cast(hp.street1Bets as <signed>integer)                  AS bet_1,
+                           cast(hp.street2Bets as <signed>integer)                  AS bet_2,
+                           cast(hp.street3Bets as <signed>integer)                  AS bet_3,
+                           cast(hp.street4Bets as <signed>integer)                  AS bet_4,
+                           cast(hp.street0Raises as <signed>integer)                AS raise_0,
+                           cast(hp.street1Raises as <signed>integer)                AS raise_1,
+                           cast(hp.street2Raises as <signed>integer)                AS raise_2,
+                           cast(hp.street3Raises as <signed>integer)                AS raise_3,
+                           cast(hp.street4Raises as <signed>integer)                AS raise_4
+                    FROM Hands h
+                         INNER JOIN HandsPlayers hp ON (hp.handId = h.id)
+                         INNER JOIN Players p       ON (p.id = hp.playerId)
+                         INNER JOIN Gametypes gt    ON (gt.id = h.gametypeId)
+                    WHERE h.id > %s
+                    AND   h.id <= %s
+                    ORDER BY h.id, hp.playerId
+                """
+
+        # the hand history file of a hand, for the starthands stat
+        self.query['get_starthands_file'] = """
+                SELECT h.fileId, gt.type, gt.limitType
+                FROM Hands h
+                     INNER JOIN Gametypes gt ON (gt.id = h.gametypeId)
+                WHERE h.id = %s
+            """
+
+        # the holdem starting hands a player voluntarily played in a hand history file
+        self.query['get_starthands'] = """
+                SELECT hp.startCards, hp.street0Aggr, hp.street0CalledRaiseDone, hp.position,
+                       gt.type, gt.limitType
+                FROM Hands h
+                     INNER JOIN HandsPlayers hp ON (hp.handId = h.id)
+                     INNER JOIN Gametypes gt    ON (gt.id = h.gametypeId)
+                WHERE h.fileId = %s
+                AND   hp.playerId = %s
+                AND   gt.category = 'holdem'
+                AND   hp.street0VPI
+                AND   hp.startCards > 0 AND hp.startCards <> 170
+            """
+
         self.query['get_players_from_hand'] = """
                 SELECT HandsPlayers.playerId, seatNo, name
                 FROM  HandsPlayers INNER JOIN Players ON (HandsPlayers.playerId = Players.id)
@@ -4420,6 +4585,58 @@ class Sql:
                 where Id = %s
             """
 
+        # get_table_name, get_cards and get_common_cards in one statement for the HUD,
+        # a row per seated player with the player's id and name
+        self.query['get_hud_hand'] = """
+            SELECT h.tableName, gt.maxSeats, gt.category, gt.type, gt.fast, s.id, s.name,
+                h.boardcard1, h.boardcard2, h.boardcard3, h.boardcard4, h.boardcard5,
+                hp.playerId, p.name,
+                hp.seatNo AS seat_number,
+                CASE gt.base
+                    when 'draw' then COALESCE(NULLIF(hp.card16,0), NULLIF(hp.card11,0), NULLIF(hp.card6,0), hp.card1)
+                    else hp.card1
+                end card1,
+                CASE gt.base
+                    when 'draw' then COALESCE(NULLIF(hp.card17,0), NULLIF(hp.card12,0), NULLIF(hp.card7,0), hp.card2)
+                    else hp.card2
+                end card2,
+                CASE gt.base
+                    when 'draw' then COALESCE(NULLIF(hp.card18,0), NULLIF(hp.card13,0), NULLIF(hp.card8,0), hp.card3)
+                    else hp.card3
+                end card3,
+                CASE gt.base
+                    when 'draw' then COALESCE(NULLIF(hp.card19,0), NULLIF(hp.card14,0), NULLIF(hp.card9,0), hp.card4)
+                    else hp.card4
+                end card4,
+                CASE gt.base
+                    when 'draw' then COALESCE(NULLIF(hp.card20,0), NULLIF(hp.card15,0), NULLIF(hp.card10,0), hp.card5)
+                    else hp.card5
+                end card5,
+                CASE gt.base
+                    when 'draw' then 0
+                    else hp.card6
+                end card6,
+                CASE gt.base
+                    when 'draw' then 0
+                    else hp.card7
+                end card7
+            FROM Hands h, Gametypes gt, Sites s, HandsPlayers hp, Players p
+            WHERE h.id = %s
+                AND gt.id = h.gametypeId
+                AND s.id = gt.siteId
+                AND hp.handId = h.id
+                AND p.id = hp.playerId
+            ORDER BY hp.seatNo
+            """
+
+        # the ids of the players named <names>, with the name of their site
+        self.query['get_hero_ids'] = """
+            SELECT s.name, p.name, p.id
+            FROM Players p, Sites s
+            WHERE p.name IN (<names>)
+                AND s.id = p.siteId
+            """
+
         if db_server == 'mysql':
             self.query['get_hand_1day_ago'] = """
                 select coalesce(max(id),0)
@@ -6037,7 +6254,7 @@ class Sql:
         # Querry to get all hands in a date range
         ####################################
         self.query['handsInRange'] = """
-            select h.id
+            select h.id, round(hp.totalProfit / 100.0,2), hp.card1, hp.card2, gt.category
                 from Hands h
                 join HandsPlayers hp on h.id = hp.handId
                 join Gametypes gt on gt.id = h.gametypeId
@@ -6112,6 +6329,88 @@ class Sql:
                       ha.id ASC
                 """
 
+        ####################################
+        # The queries above for many hands at once, <handIds> is replaced by
+        # one placeholder per hand
+        ####################################
+        self.query['manyHandsGameinfo'] = """
+                SELECT
+                        h.id,
+                        s.name as sitename,
+                        g.category,
+                        g.base,
+                        g.type,
+                        g.limitType,
+                        g.hilo,
+                        round(g.smallBlind / 100.0,2) as sb,
+                        round(g.bigBlind / 100.0,2) as bb,
+                        round(g.smallBet / 100.0,2) as sbet,
+                        round(g.bigBet / 100.0,2) as bbet,
+                        g.currency,
+                        h.gametypeId
+                    FROM
+                        Hands as h,
+                        Sites as s,
+                        Gametypes as g
+                    WHERE
+                        h.id IN (<handIds>)
+                    and g.id = h.gametypeId
+                    and s.id = g.siteId
+            """
+
+        self.query['manyHands'] = """
+                 SELECT h.*
+                    FROM Hands h
+                    WHERE id IN (<handIds>)"""
+
+        self.query['manyHandsBoards'] = """
+                 SELECT b.*
+                    FROM Boards b
+                    WHERE handId IN (<handIds>)"""
+
+        self.query['manyPlayerHands'] = """
+            SELECT
+                        hp.handId,
+                        hp.seatno,
+                        round(hp.winnings / 100.0,2) as winnings,
+                        p.name,
+                        round(hp.startCash / 100.0,2) as chips,
+                        hp.card1,hp.card2,hp.card3,hp.card4,hp.card5,
+                        hp.card6,hp.card7,hp.card8,hp.card9,hp.card10,
+                        hp.card11,hp.card12,hp.card13,hp.card14,hp.card15,
+                        hp.card16,hp.card17,hp.card18,hp.card19,hp.card20,
+                        hp.position
+                    FROM
+                        HandsPlayers as hp,
+                        Players as p
+                    WHERE
+                        hp.handId IN (<handIds>)
+                        and p.id = hp.playerId
+                    ORDER BY
+                        hp.handId, hp.seatno
+                """
+
+        self.query['manyHandActions'] = """
+            SELECT
+                      ha.handId,
+                      ha.actionNo,
+                      p.name,
+                      ha.street,
+                      ha.actionId,
+                      ha.allIn,
+                      round(ha.amount / 100.0,2) as bet,
+                      ha.numDiscarded,
+                      ha.cardsDiscarded
+                FROM
+                      HandsActions as ha,
+                      Players as p
+                WHERE
+                          ha.handId IN (<handIds>)
+                      AND ha.playerId = p.id
+                ORDER BY
+                      ha.id ASC
+                """
+
         ####################################
         # Queries to rebuild/modify hudcache
         ####################################
@@ -6142,6 +6441,29 @@ class Sql:
                                                     WHERE PC.tourneyTypeId is NULL
                 """
         
+        self.query['countGametypes'] = """SELECT count(*) FROM Gametypes"""
+
+        self.query['fetchNewHudCacheGametypeIds'] = """SELECT GT.id, GT.type
+                                                    FROM Gametypes GT
+                                                    LEFT OUTER JOIN HudCache HC ON (GT.id = HC.gametypeId)
+                                                    WHERE HC.gametypeId is NULL
+                                                    ORDER BY GT.id
+                """
+
+        self.query['fetchNewCardsCacheGametypeIds'] = """SELECT GT.id, GT.type
+                                                    FROM Gametypes GT
+                                                    LEFT OUTER JOIN CardsCache CC ON (GT.id = CC.gametypeId)
+                                                    WHERE CC.gametypeId is NULL
+                                                    ORDER BY GT.id
+                """
+
+        self.query['fetchNewPositionsCacheGametypeIds'] = """SELECT GT.id, GT.type
+                                                    FROM Gametypes GT
+                                                    LEFT OUTER JOIN PositionsCache PC ON (GT.id = PC.gametypeId)
+                                                    WHERE PC.gametypeId is NULL
+                                                    ORDER BY GT.id
+                """
+
         self.query['clearCardsCacheWeeksMonths'] = """DELETE FROM CardsCache WHERE weekId = %s AND monthId = %s"""
         self.query['clearPositionsCacheWeeksMonths'] = """DELETE FROM PositionsCache WHERE weekId = %s AND monthId = %s"""  
         
@@ -8602,6 +8924,11 @@ class Sql:
                                          INNER JOIN Gametypes G ON (H.gametypeId = G.id)
                                          WHERE siteHandNo=%s AND G.siteId=%s<heroSeat>
         """
+
+        self.query['findAlreadyInDB'] = """SELECT H.siteHandNo, H.heroSeat FROM Hands H
+                                         INNER JOIN Gametypes G ON (H.gametypeId = G.id)
+                                         WHERE G.siteId=%s AND siteHandNo IN (<siteHandNos>)
+        """
         
         self.query['getTourneyTypeIdByTourneyNo'] = """SELECT tt.id,
                                                               tt.siteId,
@@ -9171,11 +9498,12 @@ class Sql:
                         skipped,
                         errs,
                         ttime100,
-                        finished)
+                        finished,
+                        byteOffset)
                values (
                     %s, %s, %s, %s, %s,
                     %s, %s, %s, %s, %s,
-                    %s, %s
+                    %s, %s, %s
                 )"""
         
         self.query['update_file'] = """
@@ -9192,6 +9520,16 @@ class Sql:
                     ttime100=ttime100+%s,
                     finished=%s
                     WHERE id=%s"""
+
+        self.query['get_file_offset'] = """
+                    SELECT byteOffset
+                    FROM Files
+                    WHERE id=%s"""
+
+        self.query['update_file_offset'] = """
+                    UPDATE Files SET
+                    byteOffset=%s
+                    WHERE id=%s"""
         
         ################################
         # Counts for DB stats window
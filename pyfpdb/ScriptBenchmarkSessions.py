@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Time the session assignment done by Database.storeSessions on a generated
+year of hands, ie. what a bulk import of a year of hand histories costs.
+
+usage: ScriptBenchmarkSessions.py [hands per hour per table] [seed]"""
+
+import sys
+import random
+from time import time
+from datetime import datetime, timedelta
+
+import Database
+
+THRESHOLD = timedelta(minutes=30)
+
+
+def generate_year(hands_per_hour = 80, seed = 1):
+    """Hands of a year of multitabling: (startTime, weekStart, monthStart, tourney id)
+       in the order the importer would see them, table after table"""
+    rnd = random.Random(seed)
+    hands, tid = [], 0
+    day = datetime(2015, 1, 1)
+    while day.year == 2015:
+        for session in range(rnd.choice((0, 0, 1, 1, 1, 2))):
+            start = day + timedelta(hours=rnd.randint(10, 20), minutes=rnd.randint(0, 59))
+            length = rnd.randint(30, 300)
+            for table in range(rnd.randint(1, 6)):
+                tourney = None
+                if rnd.random() < 0.3:
+                    tid += 1
+                    tourney = tid
+                t = start + timedelta(minutes=rnd.randint(0, 20))
+                end = start + timedelta(minutes=length)
+                while t < end:
+                    monthStart = datetime(t.year, t.month, 1)
+                    weekdate   = datetime(t.year, t.month, t.day)
+                    weekStart  = weekdate - timedelta(days=weekdate.weekday())
+                    hands.append((t, weekStart, monthStart, tourney))
+                    t += timedelta(seconds=rnd.expovariate(hands_per_hour / 3600.0))
+        day += timedelta(days=1)
+    return hands
+
+
+def run(hands):
+    sb = Database.SessionBucket(THRESHOLD)
+    start = time()
+    for hid, (t, weekStart, monthStart, tid) in enumerate(hands):
+        sb.add(hid, t, weekStart, monthStart, tid)
+    return time() - start, len(sb)
+
+
+def main(argv = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    hands_per_hour = int(argv[0]) if len(argv) > 0 else 80
+    seed = int(argv[1]) if len(argv) > 1 else 1
+    year = generate_year(hands_per_hour, seed)
+    print "%d hands, session timeout %s" % (len(year), THRESHOLD)
+    print "%8s %8s %9s %9s %12s" % ("months", "hands", "sessions", "seconds", "hands/sec")
+    for months in (1, 3, 6, 12):
+        cut = datetime(2015, 1, 1) + timedelta(days=months * 365 / 12)
+        hands = [h for h in year if h[0] < cut]
+        (elapsed, sessions) = run(hands)
+        print "%8d %8d %9d %9.2f %12d" % (months, len(hands), sessions, elapsed, len(hands) / max(elapsed, 1e-6))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
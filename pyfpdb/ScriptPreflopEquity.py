@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+"""Write the table of PreflopEquity: every heads-up hold'em matchup enumerated
+over all its boards by pokereval. This takes hours, the table is shipped.
+
+usage: ScriptPreflopEquity.py [output file]"""
+
+import sys
+from time import time
+
+from pokereval import PokerEval
+
+import PreflopEquity
+
+
+def count(pokereval, key):
+    """(wins, ties) of the first hand of the matchup of key"""
+    hands = [[PreflopEquity.card_string((key >> shift) & 63) for shift in shifts] for shifts in ((18, 12), (6, 0))]
+    result = pokereval.poker_eval(game='holdem', pockets=hands, dead=[], board=['__'] * 5, iterations=0)
+    first = result['eval'][0]
+    if result['info'][0] != PreflopEquity.BOARDS:
+        raise ValueError("%s: %d boards" % (hands, result['info'][0]))
+    return (first['winhi'], first['tiehi'])
+
+
+def main(argv = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    path = argv[0] if argv else PreflopEquity.FILE_NAME
+    pokereval = PokerEval()
+    start = time()
+    keys = PreflopEquity.matchups()
+    out = open(path, 'wb')
+    out.write(PreflopEquity.HEADER.pack(PreflopEquity.MAGIC, len(keys), PreflopEquity.BOARDS))
+    for (i, key) in enumerate(keys):
+        (wins, ties) = count(pokereval, key)
+        out.write(PreflopEquity.RECORD.pack(key, wins, ties))
+        if i % 1000 == 0:
+            print "%d/%d matchups, %d seconds" % (i, len(keys), time() - start)
+    out.close()
+    print "%d matchups written to %s" % (len(keys), path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
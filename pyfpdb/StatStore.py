@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""StatStore.py
+
+Stats of the players at the HUD's tables, kept in memory from hand to hand.
+"""
+
+import L10n
+_ = L10n.init_translation()
+
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger("hud")
+
+STAT_STORE_SIZE = 5000  # totals kept in memory, the least recently used ones are dropped first
+MAX_HAND_GAP = 1000     # start over instead of catching up on more hand ids than this
+
+# columns of get_stats_from_hands_delta that are not stats to add up
+DELTA_INFO = ('hand_id', 'gametype_id', 'site_id', 'type', 'category', 'limittype', 'seats',
+              'file_id', 'player_id', 'seat', 'screen_name', 'startcards', 'position', 'stylekey')
+
+class StatStore:
+    """The stats get_stats_from_hand_aggregated sums up from HudCache, by (playerId, gametypeId,
+    filters), filters being what Database.get_stats_filters returns for the player's side.
+
+    The totals of a player are read from HudCache once, then the HandsPlayers rows of every
+    new hand are added to them, so the stats of a hand are mostly dictionary lookups. Each
+    total knows the last hand it includes, to add every hand exactly once."""
+
+    def __init__(self, db, size=STAT_STORE_SIZE):
+        self.db = db
+        self.size = size
+        self.clear()
+
+    def __len__(self):
+        return len(self.totals)
+
+    def clear(self):
+        self.totals = OrderedDict()     # key -> {'hand', 'exact', 'stats'}, least recently used first
+        self.keys = {}                  # playerId -> keys of the player's totals
+        self.gametypes = {}             # gametypeId -> (siteId, type, category, limitType, bigblind)
+        self.last_hand = None           # last hand added to the totals
+        self.deltas = []                # the rows read by the last update
+        self.restarted = False          # whether the last update skipped hands, deltas missing some
+
+    def get_stats_from_hand(self, hand, hud_params, hero_id=-1, num_seats=6):
+        """Returns the stat_dict of Database.get_stats_from_hand, a new one every time"""
+        hand = int(hand)
+        filters = self.db.get_stats_filters(hud_params, num_seats)
+        ((stat_range, stylekey, agg_bb_mult, seats_min, seats_max),
+         (h_stat_range, h_stylekey, h_agg_bb_mult, h_seats_min, h_seats_max)) = filters
+
+        stat_dict = {}
+        rows = self.update(hand)
+
+        # session stats come from HandsPlayers, as before
+        if stat_range == 'S' or h_stat_range == 'S':
+            self.db.get_stats_from_hand_session(hand, stat_dict, hero_id
+                                               ,stat_range, seats_min, seats_max
+                                               ,h_stat_range, h_seats_min, h_seats_max)
+            if stat_range == 'S' and h_stat_range == 'S':
+                return stat_dict
+
+        if not rows:
+            return stat_dict
+        gametypeId = rows[0]['gametype_id']
+        keys = []
+        for row in rows:
+            side = filters[row['player_id'] == hero_id]
+            if side[0] != 'S':
+                keys.append(((row['player_id'], gametypeId, side), row))
+        missing = [key for (key, row) in keys if key not in self.totals]
+        if missing:
+            self.seed(hand, gametypeId, filters, hero_id, missing)
+
+        for (key, row) in keys:
+            total = self.totals.pop(key)
+            self.totals[key] = total
+            if total['stats'] is None:
+                continue
+            t_dict = dict(total['stats'])
+            t_dict['player_id'] = row['player_id']
+            t_dict['seat'] = row['seat'] if total['exact'] else -1
+            t_dict['screen_name'] = row['screen_name']
+            stat_dict[row['player_id']] = t_dict
+        self.trim()
+        return stat_dict
+
+    def update(self, hand):
+        """Add the hands up to hand to the totals, returns the rows of hand"""
+        after = self.last_hand
+        self.restarted = False
+        if after is None or after >= hand:
+            after = hand - 1
+        elif hand - after > MAX_HAND_GAP:
+            log.info(_("HUD stat store: %d hands since the last one, reading stats again") % (hand - after))
+            self.clear()
+            self.restarted = True
+            after = hand - 1
+
+        rows = []
+        self.deltas = self.db.get_stats_delta(after, hand)
+        for delta in self.deltas:
+            self.add(delta)
+            if delta['hand_id'] == hand:
+                rows.append(delta)
+        self.last_hand = max(hand, self.last_hand)
+        return rows
+
+    def add(self, delta):
+        """Add a row of get_stats_from_hands_delta to the player's totals it counts in"""
+        gametype = (delta['site_id'], delta['type'], delta['category'], delta['limittype'], delta['bigblind'])
+        self.gametypes[delta['gametype_id']] = gametype
+        for key in self.keys.get(delta['player_id'], ()):
+            total = self.totals[key]
+            if delta['hand_id'] <= total['hand']:
+                continue
+            total['hand'] = delta['hand_id']
+            (playerId, gametypeId, (stat_range, stylekey, agg_bb_mult, seats_min, seats_max)) = key
+            if (delta['stylekey'] <= stylekey or not seats_min <= delta['seats'] <= seats_max
+                or not self.similar(gametype, self.gametypes[gametypeId], agg_bb_mult)):
+                continue
+            if delta['gametype_id'] == gametypeId:
+                total['exact'] = True
+            if total['stats'] is None:
+                total['stats'] = dict.fromkeys((name for name in delta if name not in DELTA_INFO), 0)
+            stats = total['stats']
+            for name in stats:
+                stats[name] += delta[name]
+
+    def similar(self, gametype, to, agg_bb_mult):
+        """Whether the HUD aggregates stats of gametype with those of to, same game and limit
+           and a bigblind within agg_bb_mult of to's"""
+        return (gametype[:4] == to[:4]
+                and gametype[4] <= to[4] * agg_bb_mult
+                and gametype[4] >= to[4] / agg_bb_mult)
+
+    def seed(self, hand, gametypeId, filters, hero_id, keys):
+        """Read the totals of keys, for players of hand, from HudCache"""
+        (max_hand, stats) = self.db.get_stats_seed(hand, gametypeId, filters, hero_id)
+        if max_hand is None:
+            max_hand = hand
+        for key in keys:
+            total = {'hand': max_hand, 'exact': False, 'stats': None}
+            t_dict = stats.get(key[0])
+            if t_dict is not None:
+                total['exact'] = t_dict.pop('seat') != -1
+                del t_dict['player_id'], t_dict['screen_name']
+                total['stats'] = t_dict
+            self.totals[key] = total
+            self.keys.setdefault(key[0], set()).add(key)
+
+    def trim(self):
+        """Drop the least recently used totals above size"""
+        while len(self.totals) > self.size:
+            (key, total) = self.totals.popitem(last=False)
+            keys = self.keys[key[0]]
+            keys.discard(key)
+            if not keys:
+                del self.keys[key[0]]
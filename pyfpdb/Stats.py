@@ -55,6 +55,7 @@ _ = L10n.get_translation()
 
 #    Standard Library modules
 import sys
+import threading
 from decimal import Decimal   # needed by hand_instance in m_ratio
 
 
@@ -103,28 +104,69 @@ def do_stat(stat_dict, player = 24, stat = 'vpip', hand_instance = None):
     #to avoid having to conditionally pass the extra value
     global _global_hand_instance
     _global_hand_instance = hand_instance
-    
+
+    stat_function = get_stat(stat)
+    if stat_function is None:
+        return None
+    return stat_function(stat_dict, player)
+
+def do_stats(stat_dict, stat_functions, players = None, hand_instance = None):
+    """Compute a whole set of stats, {stat: function} as returned by compile_stats,
+    for players (all the players in stat_dict by default) in one go.
+    Returns {player: {stat: the tuple do_stat returns}}"""
+    global _global_hand_instance
+    _global_hand_instance = hand_instance
+
+    if players is None:
+        players = stat_dict.keys()
+    results = {}
+    for player in players:
+        results[player] = dict((stat, stat_function(stat_dict, player))
+                               for (stat, stat_function) in stat_functions.iteritems())
+    return results
+
+def compile_stats(stats):
+    """Resolve the stat names in stats to {stat: function}, leaving out unknown ones"""
+    stat_functions = {}
+    for stat in stats:
+        stat_function = get_stat(stat)
+        if stat_function is not None:
+            stat_functions[stat] = stat_function
+    return stat_functions
+
+_stat_functions = {}
+
+def get_stat(stat):
+    """Return the function computing stat, a stat name with an optional decimal places
+    override, or None if there is no such stat. Names are resolved once and remembered."""
+    try:
+        return _stat_functions[stat]
+    except KeyError:
+        pass
+
     statname = stat
     match = re_Places.search(stat)
     if match:   # override if necessary
         statname = stat[0:-2]
 
-    if statname not in STATLIST:
-        return None
-
-    result = eval("%(stat)s(stat_dict, %(player)d)" %
-        {'stat': statname, 'player': player})
+    stat_function = None
+    if statname in STATLIST:
+        stat_function = globals()[statname]
+        if match:
+            stat_function = _override_places(stat_function, int(stat[-1:]))
+    _stat_functions[stat] = stat_function
+    return stat_function
 
+def _override_places(stat_function, places):
     # If decimal places have been defined, override result[1]
     # NOTE: decimal place override ALWAYS assumes the raw result is a
     # fraction (x/100); manual decimal places really only make sense for
     # percentage values. Also, profit/100 hands (bb/BB) already default
     # to three decimal places anyhow, so they are unlikely override
     # candidates.
-    if match:
-        places = int(stat[-1:])
-        result = __stat_override(places, result)
-    return result
+    def override(stat_dict, player):
+        return __stat_override(places, stat_function(stat_dict, player))
+    return override
 
 #    OK, for reference the tuple returned by the stat is:
 #    0 - The stat, raw, no formating, eg 0.33333333
@@ -1413,46 +1455,8 @@ def starthands(stat_dict, player):
     PFcar="Called raise:"
     PFdefendBB="Defend BB:"
     count_pfl = count_pfa = count_pfc = count_pfd = 5
-    
-    c = Configuration.Config()
-    db_connection = Database.Database(c)
-    sc = db_connection.get_cursor()
-
-    query = ("SELECT distinct startCards, street0Aggr, street0CalledRaiseDone, " +
-    			"case when HandsPlayers.position = 'B' then 'b' " +
-                            "when HandsPlayers.position = 'S' then 'b' " +
-                            "when HandsPlayers.position = '0' then 'l' " +
-                            "when HandsPlayers.position = '1' then 'l' " +
-                            "when HandsPlayers.position = '2' then 'm' " +
-                            "when HandsPlayers.position = '3' then 'm' " +
-                            "when HandsPlayers.position = '4' then 'm' " +
-                            "when HandsPlayers.position = '5' then 'e' " +
-                            "when HandsPlayers.position = '6' then 'e' " +
-                            "when HandsPlayers.position = '7' then 'e' " +
-                            "when HandsPlayers.position = '8' then 'e' " +
-                            "when HandsPlayers.position = '9' then 'e' " +
-                            "else 'X' end " +
-                        "FROM Hands, HandsPlayers, Gametypes " +
-                        "WHERE HandsPlayers.handId = Hands.id " +
-                        " AND Gametypes.id = Hands.gametypeid "+
-                        " AND Gametypes.type = " +
-                        "   (SELECT Gametypes.type FROM Gametypes, Hands   " +
-                        "  WHERE Hands.gametypeid = Gametypes.id and Hands.id = %d) " +
-                        " AND Gametypes.Limittype =  " +
-                        "   (SELECT Gametypes.limitType FROM Gametypes, Hands  " +
-                        " WHERE Hands.gametypeid = Gametypes.id and Hands.id = %d) " +
-                        "AND Gametypes.category = 'holdem' " +
-                        "AND fileId = (SELECT fileId FROM Hands " +
-                        " WHERE Hands.id = %d) " +
-                        "AND HandsPlayers.playerId = %d " +
-                        "AND street0VPI " +
-                        "AND startCards > 0 AND startCards <> 170 " +
-                        "ORDER BY startCards DESC " +
-                        ";")   % (int(handid), int(handid), int(handid), int(player))
-
-    #print query
-    sc.execute(query)
-    for (qstartcards, qstreet0Aggr, qstreet0CalledRaiseDone, qposition) in sc.fetchall():
+
+    for (qstartcards, qstreet0Aggr, qstreet0CalledRaiseDone, qposition) in start_hands.get(handid, player):
         humancards = Card.decodeStartHandValue("holdem", qstartcards)
         #print humancards, qstreet0Aggr, qstreet0CalledRaiseDone, qposition
         if qposition == "b" and qstreet0CalledRaiseDone:
@@ -1475,7 +1479,6 @@ def starthands(stat_dict, player):
             count_pfl += 1
             if (count_pfl / 8.0 == int(count_pfl / 8.0)):
                 PFlimp=PFlimp+"\n"
-    sc.close()
     
     returnstring = PFlimp + "\n" + PFaggr + "\n" + PFcar + "\n" + PFdefendBB  #+ "\n" + str(handid)
 
@@ -1486,6 +1489,92 @@ def starthands(stat_dict, player):
             (returnstring),
             _('Hands seen at this table\n'))
 
+
+def _db_connection():
+    """The read connection of the calling thread, for the stats needing more than stat_dict"""
+    global _global_config
+    if _global_config is None:
+        _global_config = Configuration.Config()
+    return Database.read_connection(_global_config)
+
+_global_config = None
+
+# starthands shows the position of a hand as one of these
+_start_hand_positions = {'B': 'b', 'S': 'b', '0': 'l', '1': 'l', '2': 'm', '3': 'm', '4': 'm',
+                         '5': 'e', '6': 'e', '7': 'e', '8': 'e', '9': 'e'}
+
+class StartHands(object):
+    """The holdem starting hands players voluntarily played, by hand history file and player,
+    for the starthands stat.
+
+    The hands of a file and player are read from the db the first time they are asked for.
+    After that the HUD adds the hands the importer sends it with add_hands, so the stat
+    does not query the db again."""
+
+    def __init__(self):
+        self.lock = threading.Lock()    # the HUD adds hands from its stat fetching thread, the
+                                        #     stat is computed on the gui and aux threads
+        self.hands = {}                 # (fileId, playerId) -> set of (startCards, street0Aggr,
+                                        #     street0CalledRaiseDone, position, type, limitType)
+        self.hand_file = (None, None)   # (hand id, (fileId, type, limitType)) of the last hand asked for
+
+    def get(self, handid, player):
+        """The starting hands player played in the file of hand handid, in the games of the
+        same type and limit: [(startCards, street0Aggr, street0CalledRaiseDone, position)],
+        best starting hands first"""
+        db = _db_connection()
+        with self.lock:
+            if self.hand_file[0] != handid:
+                c = db.get_cursor()
+                c.execute(db.sql.query['get_starthands_file'].replace('%s', db.sql.query['placeholder']), (handid,))
+                self.hand_file = (handid, c.fetchone())
+                db.rollback()
+            hand_file = self.hand_file[1]
+        if hand_file is None:
+            return []
+        (fileId, type, limitType) = hand_file
+
+        key = (fileId, player)
+        with self.lock:
+            hands = self.hands.get(key)
+            if hands is None:
+                # added to before reading, so that hands sent meanwhile are not missed
+                hands = self.hands[key] = set()
+                read = True
+            else:
+                read = False
+        if read:
+            c = db.get_cursor()
+            c.execute(db.sql.query['get_starthands'].replace('%s', db.sql.query['placeholder']), key)
+            rows = [(startCards, bool(aggr), bool(car), _start_hand_positions.get(position, 'X'), gt_type, gt_limitType)
+                    for (startCards, aggr, car, position, gt_type, gt_limitType) in c.fetchall()]
+            db.rollback()
+            with self.lock:
+                hands.update(rows)
+
+        with self.lock:
+            found = [hand[:4] for hand in hands if hand[4] == type and hand[5] == limitType]
+        return sorted(found, reverse=True)
+
+    def add_hands(self, rows):
+        """Add the hands of rows, as read by Database.get_stats_delta, to the files and
+        players already read"""
+        with self.lock:
+            for row in rows:
+                hands = self.hands.get((row['file_id'], row['player_id']))
+                if (hands is not None and row['category'] == 'holdem' and row['vpip']
+                    and row['startcards'] > 0 and row['startcards'] != 170):
+                    hands.add((row['startcards'], bool(row['pfr']), bool(row['car_0']),
+                               _start_hand_positions.get(row['position'], 'X'), row['type'], row['limittype']))
+
+    def clear(self):
+        """Forget the hands read, for when hands were imported that add_hands did not get"""
+        with self.lock:
+            self.hands = {}
+            self.hand_file = (None, None)
+
+start_hands = StartHands()
+
                 
 def get_valid_stats():
 
@@ -1505,9 +1594,10 @@ misslist = [ "Configuration", "Database", "Charset", "codecs", "encoder"
                  , "GInitiallyUnowned", "gtk", "pygtk", "Card", "L10n"
                  , "log", "logging", 'Decimal', 'GFileDescriptorBased'
                  , 'GPollableInputStream', 'GPollableOutputStream'
-                 , "re", "re_Places", 'Hand'
+                 , "re", "re_Places", 'Hand', 'threading'
+                 , 'StartHands', 'start_hands'
                ]
-STATLIST = [ x for x in STATLIST if x not in ("do_stat", "do_tip","get_valid_stats")]
+STATLIST = [ x for x in STATLIST if x not in ("do_stat", "do_stats", "do_tip", "compile_stats", "get_stat", "get_valid_stats")]
 STATLIST = [ x for x in STATLIST if not x.startswith('_')]
 STATLIST = [ x for x in STATLIST if x not in dir(sys) ]
 STATLIST = [ x for x in STATLIST if x not in dir(codecs) ]
@@ -16,7 +16,11 @@ _ = L10n.get_translation()
 
 import sys, random
 import re
-import pokereval
+try:
+    from pokereval import PokerEval
+except ImportError:
+    from HandEvaluator import PokerEval
+import RangeEquity
 
 SUITS = ['h', 'd', 's', 'c']
 
@@ -27,7 +31,7 @@ ANY = 0
 SUITED = 1
 OFFSUIT = 2
 
-ev = pokereval.PokerEval()
+ev = PokerEval()
 
 
 class Stove:
@@ -140,6 +144,7 @@ class SumEV:
         self.n_wins = 0
         self.n_ties = 0
         self.n_losses = 0
+        self.interval = None
         self.output = ""
 
     def add(self, ev):
@@ -160,6 +165,8 @@ Against the range: %s
 Equity       Win         Lose         Tie
 %5.2f%%    %5.2f%%    %5.2f%%    %5.2f%%
 """ % (self.n_hands, hand.c1, hand.c2, cards_from_range(h_range), equity, win_pct, lose_pct, tie_pct)
+        if self.interval is not None:
+            self.output += _("Equity within %.2f%% 19 times out of 20") % (100 * self.interval) + "\n"
 
         print self.output
 
@@ -282,7 +289,7 @@ def odds_for_hand(hand1, hand2, board, iterations):
     return _ev
 
 
-def odds_for_range(holder):
+def odds_for_range(holder, processes=None, seed=RangeEquity.SEED):
     sev = SumEV()
     monte_carlo = False
 
@@ -305,17 +312,23 @@ def odds_for_range(holder):
 
     if monte_carlo:
         print _('No board given. Using Monte-Carlo simulation...')
-        iters = random.randint(25000, 125000)
+    if RangeEquity.numpy is not None:
+        # the whole range at once, exact from the flop on
+        result = RangeEquity.range_equity(holder.hand.get(), [c for c in b if c != '__'],
+                                          [h.get() for h in holder.h_range.get()], processes, seed)
+        (plays, win, tie, lose) = result.totals()
+        sev.add(EV(plays, win, tie, lose))
+        sev.interval = result.interval
     else:
-        iters = -1
-    for h in holder.h_range.get():
-        e = odds_for_hand(
-            [holder.hand.c1, holder.hand.c2],
-            [h.c1, h.c2],
-            b,
-            iterations=iters
-            )
-        sev.add(e)
+        iters = random.randint(25000, 125000) if monte_carlo else -1
+        for h in holder.h_range.get():
+            e = odds_for_hand(
+                [holder.hand.c1, holder.hand.c2],
+                [h.c1, h.c2],
+                b,
+                iterations=iters
+                )
+            sev.add(e)
 
     sev.show(holder.hand, holder.h_range.get())
     return sev
@@ -45,7 +45,7 @@ from PyQt5.QtWidgets import (QAction, QApplication, QCalendarWidget,
                              QDialogButtonBox, QFileDialog,
                              QGridLayout, QHBoxLayout, QInputDialog,
                              QLabel, QLineEdit, QMainWindow,
-                             QMessageBox, QPushButton, QScrollArea,
+                             QMessageBox, QProgressDialog, QPushButton, QScrollArea,
                              QTabWidget, QVBoxLayout)
 
 import interlocks
@@ -577,7 +577,26 @@ class fpdb(QMainWindow):
             if response:
                 print _(" Rebuilding HUD Cache ... ")
 
-                self.db.rebuild_cache(self.h_start_date.date().toString("yyyy-MM-dd"), self.start_date.date().toString("yyyy-MM-dd"))
+                dates = (self.h_start_date.date().toString("yyyy-MM-dd"), self.start_date.date().toString("yyyy-MM-dd"))
+                # carry on where a stopped rebuild with the same dates left off
+                resume = dates == self.config.get_stopped_rebuild()
+                dia_progress = QProgressDialog(_("Rebuilding HUD Cache ..."), _("Stop"), 0, 0, self)
+                dia_progress.setWindowModality(Qt.WindowModal)
+                dia_progress.setMinimumDuration(0)
+
+                def progress(table, done, total):
+                    dia_progress.setMaximum(total)
+                    dia_progress.setValue(done)
+                    QCoreApplication.processEvents()
+                    return not dia_progress.wasCanceled()
+
+                # kept in the config, a rebuild stopped before fpdb was quit carries on too
+                if self.db.rebuild_cache(dates[0], dates[1], progress = progress, resume = resume):
+                    self.config.set_stopped_rebuild(None)
+                else:
+                    self.config.set_stopped_rebuild(dates)
+                    print _('HUD cache rebuild stopped, rebuild again with the same dates to continue')
+                dia_progress.close()
             else:
                 print _('User cancelled rebuilding hud cache')
 
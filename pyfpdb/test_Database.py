@@ -81,3 +81,21 @@ def testSQLiteModFunction():
         idx = idx+1
 
     cur.execute("DROP TABLE test")
+
+def testSessionBucketMerge():
+    from datetime import datetime, timedelta
+    sb = Database.SessionBucket(timedelta(minutes=30))
+    week, month = datetime(2015, 1, 5), datetime(2015, 1, 1)
+    sb.add(1, datetime(2015, 1, 5, 20, 0), week, month, None)
+    sb.add(2, datetime(2015, 1, 5, 21, 0), week, month, None)
+    sb.add(3, datetime(2015, 1, 5, 23, 0), week, month, 7)
+    assert len(sb) == 3
+    # joins the first two sessions
+    sb.add(4, datetime(2015, 1, 5, 20, 30), week, month, None)
+    # same tourney, too late for the time window
+    sb.add(5, datetime(2015, 1, 6, 1, 0), week, month, 7)
+    sessions = list(sb)
+    assert [sorted(s['ids']) for s in sessions] == [[3, 5], [1, 2, 4]]
+    assert sessions[1]['sessionStart'] == datetime(2015, 1, 5, 20, 0)
+    assert sessions[1]['sessionEnd'] == datetime(2015, 1, 5, 21, 0)
+    assert sessions[0]['sessionEnd'] == datetime(2015, 1, 6, 1, 0)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+import py
+
+import HandEvaluator
+
+pokereval = HandEvaluator.PokerEval()
+
+def cards(hand):
+    return pokereval.string2card(hand.split())
+
+def checkOrder(value, hands):
+    """hands go from the worst to the best, hands on one line tie"""
+    values = [[value(cards(hand)) for hand in line.split('|')] for line in hands]
+    for line in values:
+        assert len(set(line)) == 1
+    for (worse, better) in zip(values, values[1:]):
+        assert worse[0] < better[0]
+
+def testHi():
+    checkOrder(HandEvaluator.hi_value, [
+        "7c 5d 4h 3s 2c",
+        "8c 5d 4h 3s 2c | 8d 5c 4s 3h 2d",
+        "Ac Kd Qh Js 9c",
+        "2c 2d 3h 4s 5d 7h 8c",                 # pair, the best 5 of 7
+        "2c 2d Ah Ks Qd Jh 9c",
+        "3c 3d 2h 2s Ad",
+        "3c 3d 2h 2s Kd Kh 4c | Kc Kd 3h 3s 4d", # two pair, the third pair does not count
+        "2c 2d 2h 9s 8d",
+        "Ac 2d 3h 4s 5d | 5c Ah 4d 3s 2h",       # the wheel, the lowest straight
+        "6c 2d 3h 4s 5d Ac",
+        "Ac Kd Qh Js Tc",
+        "2h 3h 4h 5h 7h",
+        "Ah Kh Qh Jh 9h 9c 9s",                 # a flush beats the trips
+        "2c 2d 2h 3s 3d",
+        "2c 2d 2h 3s 3d 3c 4h | 3s 3d 3c 2h 2d Kc",
+        "Ac Ad Ah Ks Kd",
+        "2c 2d 2h 2s 3d",
+        "2c 2d 2h 2s Kd 3c 3h",
+        "Ah 2h 3h 4h 5h",
+        "9c Tc Jc Qc Kc Ac Ad",
+    ])
+
+def testLow8():
+    nothing = HandEvaluator.LOW_NOTHING
+    assert HandEvaluator.low8_value(cards("9c 8d 7h 6s 5c")) == nothing
+    assert HandEvaluator.low8_value(cards("Ac Ad 2h 3s 4c Kd Qd")) == nothing
+    checkOrder(lambda c: -HandEvaluator.low8_value(c), [
+        "8c 7d 6h 5s 4c",
+        "8c 7d 6h 5s 3c | 8d 7c 6s 5h 3d Kc Kd",
+        "8c 4d 3h 2s Ac",
+        "7c 6d 5h 4s 3c",
+        "6c 5d 4h 3s Ac",
+        "Ac 2d 3h 4s 5c | Ac Ad 2c 2d 3h 4s 5c | Ah 2h 3h 4h 5h",  # pairs, straights and flushes do not count
+    ])
+
+def testA5():
+    checkOrder(lambda c: -HandEvaluator.a5_value(c), [
+        "Kc Kd Qh Js Tc",
+        "Ac Ad 3h 4s 5c",
+        "Kc Qd Jh Ts 9c",
+        "9c 4d 3h 2s Ac",
+        "6c 5d 4h 3s 2c",
+        "Ac 2d 3h 4s 5c | Ah 2h 3h 4h 5h | Ac 2d 3h 4s 5c Kd Ks",
+    ])
+
+def testDeuceToSeven():
+    checkOrder(lambda c: -HandEvaluator.deuce_value(c), [
+        "Ah 2h 3h 4h 5h",
+        "6c 5d 4h 3s 2c",                       # a straight
+        "2c 2d 3h 4s 5c",
+        "Ac 5d 4h 3s 2c",                       # the ace is high, no straight
+        "8c 5d 4h 3s 2c",
+        "7c 6d 5h 4s 2c",
+        "7c 5d 4h 3s 2c | 7h 5c 4s 3d 2h",
+    ])
+
+def testBest():
+    assert pokereval.best('hi', ['Ah', 'Kh', 'Qh', 'Jh', '2c', '3d', 'Th'])[1] == \
+           ['StFlush'] + cards("Ah Kh Qh Jh Th")
+    # omaha, 2 of the hand and 3 of the board
+    (value, best) = pokereval.best('hi', ['Ah', 'Kd', 'Qh', 'Jh'], ['2c', '3d', '9s', 'Th', '4h'])
+    assert best == ['NoPair'] + cards("Ah Kd Th 9s 4h")
+    (value, best) = pokereval.best('low', ['Ah', '2d', 'Kh', 'Kc'], ['3c', '4d', '5s', '9h', '8h'])
+    assert best == ['NoPair'] + cards("5s 4d 3c 2d Ah")
+    assert pokereval.best('low', ['Kh', 'Qd', 'Jh', 'Tc'], ['3c', '4d', '5s', '9h', '8h'])[1] == ['Nothing']
+
+def testWinners():
+    assert pokereval.winners('holdem', [['Ah', 'Kh'], ['Ad', 'Kd']], ['2c', '7s', '9d', 'Jc', '3h']) == {'hi': [0, 1]}
+    assert pokereval.winners('holdem', [['Ah', 'Kh'], ['Qd', 'Qs']], ['2c', '7s', '9d', 'Jc', '3h']) == {'hi': [1]}
+    assert pokereval.winners('omaha8', [['Ah', '2d', 'Kh', 'Kc'], ['As', '3s', 'Qd', 'Qc']],
+                             ['4c', '5d', '7s', '9h', 'Kd']) == {'hi': [0], 'low': [0]}
+    assert pokereval.winners('omaha8', [['Ah', '2d', 'Kh', 'Kc'], ['As', '2s', 'Qd', 'Qc']],
+                             ['4c', '5d', '7s', '9h', 'Qh']) == {'hi': [1], 'low': [0, 1]}
+    assert pokereval.winners('7stud8', [['Ah', '2d', '9h', '9c', 'Ks', 'Kd', 'Jc'], ['As', '3s', '4s', '5d', '8c', 'Qh', 'Tc']]) \
+           == {'hi': [0], 'low': [1]}
+    assert pokereval.winners('lowball27', [['7h', '5d', '4c', '3s', '2h'], ['Ad', '2c', '3d', '4s', '5h']]) == {'low': [0]}
+    assert pokereval.winners('lowball', [['7h', '5d', '4c', '3s', '2h'], ['Ad', '2c', '3d', '4s', '5h']]) == {'low': [1]}
+
+def testNumpyMatchesPython():
+    """poker_eval counts the same with and without NumPy"""
+    numpy = py.test.importorskip("numpy")
+    deals = [
+        ('holdem', [['Ah', 'Kh'], ['Qs', 'Qd'], ['7c', '8c']], ['2h', '5d', '9c', '__', '__']),
+        ('holdem', [['Ah', 'Ad'], ['Kc', '__']], ['Kh', 'Ks', '2h', '3h', '__']),
+        ('omaha', [['Ah', '2h', '3d', 'Kc'], ['As', 'Ks', 'Qd', 'Jd']], ['2c', '5d', '9c', 'Td', '__']),
+        ('omaha8', [['Ah', '2h', '3d', 'Kc'], ['As', 'Ks', 'Qd', 'Jd']], ['2c', '5d', '9c', '__', '__']),
+        ('7stud8', [['Ah', '2h', '3d', 'Kc', '5c', '9d', '__'], ['As', 'Ks', 'Qd', 'Jd', 'Tc', '4s', '__']], []),
+    ]
+    for (game, pockets, board) in deals:
+        with_numpy = pokereval.poker_eval(game, pockets, board)
+        HandEvaluator.numpy = None
+        try:
+            without = pokereval.poker_eval(game, pockets, board)
+        finally:
+            HandEvaluator.numpy = numpy
+        assert with_numpy['info'][0] > 1
+        assert with_numpy == without
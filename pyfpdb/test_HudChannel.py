@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+import json
+import socket
+import threading
+
+import HudChannel
+
+def setup_module(module):
+    module.timeout = socket.getdefaulttimeout()
+    socket.setdefaulttimeout(10)    # a failing test fails instead of waiting forever
+
+def teardown_module(module):
+    socket.setdefaulttimeout(module.timeout)
+
+def testEncoding():
+    """A message is the length of its JSON then the JSON, read back by _receive whatever
+       the chunks it arrives in"""
+    payloads = [{'hand_id': 1, 'cards': [[1, 2, 3]]}, {'hand_id': 2, 'common': [0, 0, 0, 0, 0]}]
+    message = HudChannel.encode(payloads)
+    (size,) = HudChannel.HEADER.unpack(message[:HudChannel.HEADER.size])
+    assert size == len(message) - HudChannel.HEADER.size
+    assert json.loads(message[HudChannel.HEADER.size:]) == payloads
+
+    (a, b) = socket.socketpair()
+    for i in range(0, len(message), 7):
+        a.sendall(message[i:i+7])
+    header = HudChannel._receive(b, HudChannel.HEADER.size)
+    assert json.loads(HudChannel._receive(b, HudChannel.HEADER.unpack(header)[0])) == payloads
+    a.close()
+    assert HudChannel._receive(b, 1) is None
+    b.close()
+
+def testBacklogToFirstHud():
+    """The hands sent before a HUD connects go to the first HUD with the token, the
+       last CLIENT_QUEUE_SIZE of them"""
+    server = HudChannel.HudServer()
+    extra = 5
+    for i in range(HudChannel.CLIENT_QUEUE_SIZE + extra):
+        server.send_hands([{'hand_id': i}])
+    server.send_hands([])
+
+    # a connection without the token gets nothing and leaves the backlog alone
+    assert list(HudChannel.read_hands(server.port, 'x' * len(server.token))) == []
+
+    received = []
+    def read():
+        for payload in HudChannel.read_hands(server.port, server.token):
+            received.append(payload['hand_id'])
+            if payload['hand_id'] == 'last':
+                break
+    reader = threading.Thread(target=read)
+    reader.start()
+    while not server.clients:
+        reader.join(0.01)
+    server.send_hands([{'hand_id': 'last'}])
+    reader.join()
+    server.close()
+    assert received == range(extra, HudChannel.CLIENT_QUEUE_SIZE + extra) + ['last']
+
+class StuckSocket:
+    """A HUD socket whose first write waits until go is set"""
+    def __init__(self):
+        (self.go, self.sent) = (threading.Event(), [])
+    def sendall(self, message):
+        self.go.wait()
+        self.sent.append(message)
+    def close(self):
+        pass
+
+def testSlowHudDropsOldest():
+    """A HUD more than CLIENT_QUEUE_SIZE messages behind misses the oldest ones"""
+    sock = StuckSocket()
+    client = HudChannel.HudConnection(sock)
+    client.put('first')
+    while client.messages:       # the sender took it and waits in sendall
+        threading.Event().wait(0.01)
+    for i in range(HudChannel.CLIENT_QUEUE_SIZE + 3):
+        client.put(i)
+    assert len(client.messages) == HudChannel.CLIENT_QUEUE_SIZE
+    client.close()
+    sock.go.set()
+    while client.alive:
+        threading.Event().wait(0.01)
+    assert sock.sent == ['first'] + range(3, HudChannel.CLIENT_QUEUE_SIZE + 3)
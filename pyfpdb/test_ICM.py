@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+from itertools import permutations
+
+import ICM
+
+def bruteForce(stacks, payouts):
+    """Malmuth-Harville over every finishing order"""
+    result = [0.0] * len(stacks)
+    for order in permutations(range(len(stacks))):
+        (chance, left) = (1.0, float(sum(stacks)))
+        for (place, i) in enumerate(order):
+            chance *= stacks[i] / left
+            left -= stacks[i]
+        for (place, i) in enumerate(order[:len(payouts)]):
+            result[i] += chance * payouts[place]
+    return result
+
+def testThreePlayers():
+    for (stacks, payouts) in (([5000, 3000, 2000], [50, 30, 20]),
+                              ([1500, 7000, 1500], [65, 35]),
+                              ([100, 9800, 100], [1])):
+        for (got, want) in zip(ICM.equities(stacks, payouts), bruteForce(stacks, payouts)):
+            assert abs(got - want) < 1e-9
+
+def testSumIsPrizePool():
+    payouts = [40, 25, 15, 10, 6, 4]
+    stacks = [1200, 5400, 300, 0, 2500, 8000, 950, 4100, 3333]
+    result = ICM.equities(stacks, payouts)
+    assert abs(sum(result) - sum(payouts)) < 1e-9
+    assert result[3] == 0
+    # a big field is sampled, every order sampled still pays out the whole pool
+    stacks = [1000 + 37 * i for i in range(200)]
+    payouts = [float(30 - i) for i in range(27)]
+    assert ICM.exact_states(len(stacks), len(payouts)) > ICM.EXACT_STATES
+    result = ICM.equities(stacks, payouts, iterations=2000)
+    assert abs(sum(result) - sum(payouts)) < 1e-6
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+import PreflopEquity
+
+# (hand1, hand2, wins of hand1, ties) over all the boards, counted board by board
+MATCHUPS = [
+    (['Ah', 'As'], ['Kd', 'Kc'], 1388072, 6538),
+    (['Ah', 'As'], ['Kh', 'Ks'], 1410336, 9308),
+    (['Ad', 'Kd'], ['Qc', 'Qh'], 787966, 6732),
+]
+
+def checkEquities(hand1, hand2, wins, ties):
+    first = PreflopEquity.Decimal(1000 * (2 * wins + ties)) / (2 * PreflopEquity.BOARDS)
+    assert PreflopEquity.equities(hand1, hand2) == [first, 1000 - first]
+    assert PreflopEquity.equities(hand2, hand1) == [1000 - first, first]
+
+def testKnownMatchups():
+    assert PreflopEquity.get_table() is not None
+    for (hand1, hand2, wins, ties) in MATCHUPS:
+        checkEquities(hand1, hand2, wins, ties)
+
+def testSuitsRenamed():
+    """Renaming the suits or swapping the cards of a hand does not change the equities"""
+    for (hand1, hand2, wins, ties) in MATCHUPS:
+        for suits in ('shdc', 'dchs', 'cdsh'):
+            rename = dict(zip('hsdc', suits))
+            checkEquities([c[0] + rename[c[1]] for c in reversed(hand1)],
+                          [c[0] + rename[c[1]] for c in hand2], wins, ties)
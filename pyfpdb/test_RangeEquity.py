@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+from itertools import combinations
+
+import py
+
+numpy = py.test.importorskip("numpy")
+import RangeEquity
+
+RANKS = '23456789TJQKA'
+DECK = [r + s for r in RANKS for s in 'hdcs']
+
+def rank5(cards):
+    """A comparable value of a five card hand"""
+    ranks = sorted([RANKS.index(c[0]) for c in cards], reverse=True)
+    counts = sorted([(ranks.count(r), r) for r in set(ranks)], reverse=True)
+    flush = len(set(c[1] for c in cards)) == 1
+    straight = None
+    if len(counts) == 5:
+        if ranks[0] - ranks[4] == 4:
+            straight = ranks[0]
+        elif ranks == [12, 3, 2, 1, 0]:
+            straight = 3
+    if straight is not None:
+        return (8 if flush else 4, straight)
+    if flush:
+        return (5, ranks)
+    shape = [count for (count, r) in counts]
+    value = {(4, 1): 7, (3, 2): 6, (3, 1, 1): 3, (2, 2, 1): 2, (2, 1, 1, 1): 1}.get(tuple(shape), 0)
+    return (value, [r for (count, r) in counts])
+
+def best(cards):
+    return max(rank5(five) for five in combinations(cards, 5))
+
+def testFlopEnumeration():
+    """The counts on a flop against each combo are the ones of dealing every runout"""
+    (hero, board) = (['Ah', 'Kh'], ['2h', '7h', '9c'])
+    hands = [('Qs', 'Qd'), ('Jc', 'Tc'), ('Ah', 'Qh'), ('9d', '9s'), ('Qd', 'Qs')]
+    result = RangeEquity.range_equity(hero, board, hands, processes=1)
+    assert result.interval is None
+    assert len(result.combos) == 3     # AhQh is blocked, QdQs given twice
+
+    deck = [c for c in DECK if c not in hero + board]
+    for (i, combo) in enumerate(result.combos):
+        villain = [c for c in deck if RangeEquity._pokereval.string2card([c])[0] in combo]
+        (wins, ties, losses) = (0, 0, 0)
+        for runout in combinations([c for c in deck if c not in villain], 2):
+            (mine, theirs) = (best(hero + board + list(runout)), best(villain + board + list(runout)))
+            wins += mine > theirs
+            ties += mine == theirs
+            losses += mine < theirs
+        assert (result.wins[i], result.ties[i], result.losses[i]) == (wins, ties, losses)
+    assert result.totals()[0] == 3 * 990
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+import shutil
+import tempfile
+
+import py
+
+import Configuration
+import Database
+
+def testReadConnection():
+    """A read connection cannot write, and sees the db as it was at its first query
+       until it rolls back"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        config = Configuration.Config(file = "HUD_config.test.xml")
+        config.dir_database = tmpdir
+        writer = Database.Database(config)
+        writer.recreate_tables()
+        pool = Database.ReadPool()
+        reader = pool.get(config)
+        assert pool.get(config) is reader
+
+        count = "SELECT count(*) FROM Sites"
+        c = reader.get_cursor()
+        c.execute(count)
+        sites = c.fetchone()[0]
+        w = writer.get_cursor()
+        w.execute("INSERT INTO Sites (id, name, code) VALUES (999, 'Test', 'TT')")
+        writer.commit()
+        c.execute(count)
+        assert c.fetchone()[0] == sites
+        py.test.raises(Exception, c.execute, "DELETE FROM Sites")
+        reader.rollback()
+        c = reader.get_cursor()
+        c.execute(count)
+        assert c.fetchone()[0] == sites + 1
+
+        pool.release()
+        assert pool.get(config) is reader
+        pool.release()
+        reader.close_connection()
+        writer.disconnect()
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU Affero General Public License as published by
+#the Free Software Foundation, version 3 of the License.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU Affero General Public License
+#along with this program. If not, see <http://www.gnu.org/licenses/>.
+#In the "official" distribution you can find the license in agpl-3.0.txt.
+
+import os
+import re
+import shutil
+import tempfile
+
+import Configuration
+import Database
+import Importer
+import StatStore
+
+HH_FILE = "regression-test-files/cash/Stars/Flop/NLHE-6max-USD-0.05-0.10-200911.txt"
+
+HUD_PARAMS = [
+    {'stat_range':'A', 'agg_bb_mult':1000, 'seats_style':'A', 'seats_cust_nums_low':1, 'seats_cust_nums_high':10,
+     'h_stat_range':'S', 'h_agg_bb_mult':1000, 'h_seats_style':'A', 'h_seats_cust_nums_low':1, 'h_seats_cust_nums_high':10},
+    {'stat_range':'A', 'agg_bb_mult':1, 'seats_style':'C', 'seats_cust_nums_low':3, 'seats_cust_nums_high':6,
+     'h_stat_range':'A', 'h_agg_bb_mult':1000, 'h_seats_style':'E', 'h_seats_cust_nums_low':1, 'h_seats_cust_nums_high':10},
+]
+
+class Caller:
+    def addText(self, text):
+        pass
+
+def testStatStoreMatchesDatabase():
+    """The HudCache seed plus the hands added one import at a time give the stats
+       Database.get_stats_from_hand reads"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        config = Configuration.Config(file = "HUD_config.test.xml")
+        config.dir_database = tmpdir
+        settings = {}
+        settings.update(config.get_db_parameters())
+        settings.update(config.get_import_parameters())
+        settings.update(config.get_default_paths())
+        importer = Importer.Importer(Caller(), settings, config)
+        importer.database.recreate_tables()
+        importer.setMode('auto')
+        importer.setCallHud(False)
+
+        hands = re.split(r'\n\s*\n(?=PokerStars )', open(HH_FILE).read().strip())
+        path = os.path.join(tmpdir, 'hands.txt')
+        db = Database.Database(config)
+        db.init_hud_stat_vars(100000, 100000)
+        stores = [StatStore.StatStore(db) for params in HUD_PARAMS]
+        c = db.get_cursor()
+        checked = 0
+        for start in range(0, len(hands), 7):
+            with open(path, 'a') as f:
+                f.write('\n\n\n'.join(hands[start:start+7]) + '\n\n\n')
+            if not start:
+                importer.addImportFile(path, 'auto')
+            importer.runUpdated()
+            importer.runUpdated()
+            db.rollback()
+            c.execute("SELECT max(id) FROM Hands")
+            hand = c.fetchone()[0]
+            c.execute("SELECT playerId FROM HandsPlayers WHERE handId = %d ORDER BY seatNo" % hand)
+            for (hero,) in c.fetchall()[:2]:
+                for (params, store) in zip(HUD_PARAMS, stores):
+                    assert store.get_stats_from_hand(hand, params, hero, 6) \
+                           == db.get_stats_from_hand(hand, 'ring', params, hero, 6)
+                    checked += 1
+        assert checked > 0
+        db.disconnect()
+        importer.database.disconnect()
+    finally:
+        shutil.rmtree(tmpdir)